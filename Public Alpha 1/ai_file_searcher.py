@@ -1,59 +1,233 @@
 import os
+import json
 import logging
-import torch
-import torch.nn as nn
-import torch.optim as optim
-from torchvision import models, transforms
-from PIL import Image
+import itertools
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from signature_scanner import SIGNATURES
+
+MODEL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "kernel_classifier.json")
+
+# Blocks sampled evenly across each file, the first one always being the header
+BLOCK_SIZE = 4096
+BLOCKS_PER_FILE = 16
+DEFAULT_BATCH_SIZE = 64
+# File reads are I/O bound; a few threads keep the disk busy without oversubscribing the CPU
+DEFAULT_PREFETCH_WORKERS = 4
+PREFETCH_BATCHES = 2
+HISTOGRAM_BINS = 16
+KERNEL_SIZE_RANGE = (1024 * 1024, 96 * 1024 * 1024)
+BANNER = b"Linux version "
+PRINTABLE = np.zeros(256, dtype=bool)
+PRINTABLE[0x20:0x7f] = True
+PRINTABLE[[0x09, 0x0a, 0x0d]] = True
+
+FEATURE_NAMES = ([f"histogram_{i:x}" for i in range(HISTOGRAM_BINS)] +
+                 ["zero_fraction", "printable_fraction", "entropy_mean", "entropy_std", "entropy_min",
+                  "entropy_max", "high_entropy_fraction"] +
+                 [f"magic_{kind}" for kind in SIGNATURES] +
+                 ["linux_banner", "log_size", "kernel_size_range"])
+
+
+def _read_samples(path):
+    """(blocks, block lengths, size, banner seen) for the sampled blocks of one file"""
+    size = os.path.getsize(path)
+    offsets = sorted(set(np.linspace(0, max(size - BLOCK_SIZE, 0), BLOCKS_PER_FILE).astype(np.int64).tolist()))
+    blocks = np.zeros((BLOCKS_PER_FILE, BLOCK_SIZE), dtype=np.uint8)
+    lengths = np.zeros(BLOCKS_PER_FILE, dtype=np.int64)
+    banner = False
+    with open(path, "rb") as f:
+        for i, offset in enumerate(offsets):
+            f.seek(offset)
+            data = f.read(BLOCK_SIZE)
+            blocks[i, :len(data)] = np.frombuffer(data, dtype=np.uint8)
+            lengths[i] = len(data)
+            banner = banner or BANNER in data
+    return blocks, lengths, size, banner
+
+
+def extract_features(paths):
+    """Feature matrix of shape (len(paths), len(FEATURE_NAMES)), computed for the whole batch at once"""
+    return _features([_read_samples(path) for path in paths])
+
+
+def _features(samples):
+    count = len(samples)
+    blocks = np.stack([s[0] for s in samples]) if samples else np.zeros((0, BLOCKS_PER_FILE, BLOCK_SIZE), np.uint8)
+    lengths = np.array([s[1] for s in samples], dtype=np.int64).reshape(count, BLOCKS_PER_FILE)
+    sizes = np.array([s[2] for s in samples], dtype=np.float64)
+    banners = np.array([s[3] for s in samples], dtype=np.float64)
+
+    # Byte counts of every (file, block) pair with a single bincount, padding excluded
+    valid = np.arange(BLOCK_SIZE) < lengths[..., None]
+    index = np.arange(count * BLOCKS_PER_FILE).reshape(count, BLOCKS_PER_FILE, 1) * 256 + blocks
+    counts = np.bincount(index.ravel(), weights=valid.ravel(),
+                         minlength=count * BLOCKS_PER_FILE * 256).reshape(count, BLOCKS_PER_FILE, 256)
+
+    block_present = lengths > 0
+    with np.errstate(divide="ignore", invalid="ignore"):
+        p = counts / np.maximum(lengths, 1)[..., None]
+        entropy = -np.where(p > 0, p * np.log2(p), 0).sum(axis=2) / 8
+    present = np.maximum(block_present.sum(axis=1), 1)
+    entropy_mean = np.where(block_present, entropy, 0).sum(axis=1) / present
+    entropy_std = np.sqrt(np.where(block_present, (entropy - entropy_mean[:, None]) ** 2, 0).sum(axis=1) / present)
+    entropy_min = np.where(block_present, entropy, 1).min(axis=1)
+    entropy_max = np.where(block_present, entropy, 0).max(axis=1)
+    high_entropy = np.where(block_present, entropy > 0.93, False).sum(axis=1) / present
+
+    histogram = counts.sum(axis=1)
+    histogram /= np.maximum(histogram.sum(axis=1, keepdims=True), 1)
+    coarse = histogram.reshape(count, HISTOGRAM_BINS, 256 // HISTOGRAM_BINS).sum(axis=2)
+
+    magics = []
+    for magic, anchor, _ in SIGNATURES.values():
+        expected = np.frombuffer(magic, dtype=np.uint8)
+        hit = (blocks[:, 0, anchor:anchor + len(magic)] == expected).all(axis=1)
+        magics.append(hit & (lengths[:, 0] >= anchor + len(magic)))
+
+    return np.column_stack([
+        coarse,
+        histogram[:, 0], histogram[:, PRINTABLE].sum(axis=1),
+        entropy_mean, entropy_std, np.where(block_present.any(axis=1), entropy_min, 0), entropy_max, high_entropy,
+        np.array(magics, dtype=np.float64).T.reshape(count, len(SIGNATURES)),
+        banners, np.log2(sizes + 1) / 40,
+        (sizes >= KERNEL_SIZE_RANGE[0]) & (sizes <= KERNEL_SIZE_RANGE[1]),
+    ]).astype(np.float64)
+
+
+class KernelClassifier:
+    """Logistic regression over standardised file features"""
+
+    def __init__(self, weights, bias, mean=None, scale=None, threshold=0.5):
+        self.weights = np.asarray(weights, dtype=np.float64)
+        self.bias = float(bias)
+        self.mean = np.zeros_like(self.weights) if mean is None else np.asarray(mean, dtype=np.float64)
+        self.scale = np.ones_like(self.weights) if scale is None else np.asarray(scale, dtype=np.float64)
+        self.threshold = threshold
+
+    @classmethod
+    def load(cls, path=MODEL_PATH):
+        with open(path, "r") as f:
+            model = json.load(f)
+
+        def vector(key, default):
+            values = model.get(key, {})
+            return [values.get(name, default) for name in FEATURE_NAMES]
+
+        return cls(vector("weights", 0.0), model["bias"], vector("mean", 0.0), vector("scale", 1.0),
+                   model.get("threshold", 0.5))
+
+    def save(self, path=MODEL_PATH):
+        model = {
+            "bias": self.bias,
+            "threshold": self.threshold,
+            "weights": dict(zip(FEATURE_NAMES, self.weights.tolist())),
+            "mean": dict(zip(FEATURE_NAMES, self.mean.tolist())),
+            "scale": dict(zip(FEATURE_NAMES, self.scale.tolist())),
+        }
+        with open(path, "w") as f:
+            json.dump(model, f, indent=2)
+
+    def predict_proba(self, features):
+        logits = ((features - self.mean) / self.scale) @ self.weights + self.bias
+        return 1 / (1 + np.exp(-logits))
+
+    def fit(self, features, labels, epochs=500, learning_rate=0.1, l2=1e-3):
+        """Refit the weights by gradient descent on labelled features (1 = kernel)"""
+        labels = np.asarray(labels, dtype=np.float64)
+        self.mean = features.mean(axis=0)
+        self.scale = np.where(features.std(axis=0) > 0, features.std(axis=0), 1)
+        x = (features - self.mean) / self.scale
+        for _ in range(epochs):
+            error = 1 / (1 + np.exp(-(x @ self.weights + self.bias))) - labels
+            self.weights -= learning_rate * (x.T @ error / len(labels) + l2 * self.weights)
+            self.bias -= learning_rate * error.mean()
+        return self
+
+
+def _walk_files(directory):
+    for root, _, files in os.walk(directory):
+        for file in files:
+            yield os.path.join(root, file)
+
 
 class AIFileSearcher:
-    def __init__(self, search_directory):
+    def __init__(self, search_directory=None, model_path=MODEL_PATH, batch_size=DEFAULT_BATCH_SIZE,
+                 max_workers=DEFAULT_PREFETCH_WORKERS):
         self.search_directory = search_directory
-        self.model = self._load_model()
-
-    def _load_model(self):
-        # Load a pre-trained ResNet model
-        model = models.resnet18(pretrained=True)
-        model.fc = nn.Linear(model.fc.in_features, 2)  # Binary classification: kernel or not kernel
-        model.load_state_dict(torch.load('kernel_classifier.pth'))
-        model.eval()
-        return model
-
-    def search_kernel_file(self):
-        transform = transforms.Compose([
-            transforms.Resize((224, 224)),
-            transforms.ToTensor(),
-            transforms.Normalize([0.485, 0.456, 0.406], [0.229, 0.224, 0.225])
-        ])
-
-        for root, _, files in os.walk(self.search_directory):
-            for file in files:
-                file_path = os.path.join(root, file)
-                try:
-                    with open(file_path, 'rb') as f:
-                        img = Image.open(f).convert('RGB')
-                        img_t = transform(img)
-                        batch_t = torch.unsqueeze(img_t, 0)
-
-                        with torch.no_grad():
-                            output = self.model(batch_t)
-
-                        _, predicted = torch.max(output, 1)
-                        if predicted.item() == 1:  # 1 represents "kernel"
-                            logging.info(f"Potential kernel file found: {file_path}")
-                            return file_path
-                except Exception as e:
-                    logging.error(f"Error processing file {file_path}: {str(e)}")
+        self.model_path = model_path
+        self.batch_size = batch_size
+        self.max_workers = max_workers
+        self._model = None
+        self._model_lock = threading.Lock()
+
+    @property
+    def model(self):
+        """The classifier, loaded on first use"""
+        with self._model_lock:
+            if self._model is None:
+                self._model = self._load_model(self.model_path)
+            return self._model
+
+    def _load_model(self, model_path):
+        return KernelClassifier.load(model_path)
+
+    def iter_candidates(self, search_directory=None, paths=None):
+        """Yield (path, probability) of the likely kernels batch by batch, each batch most likely first.
+
+        Files are read on worker threads while earlier batches are classified, with at most
+        PREFETCH_BATCHES batches read ahead. Stopping the iteration cancels the pending reads.
+        """
+        paths = iter(_walk_files(search_directory or self.search_directory) if paths is None else paths)
+        model = self.model
+        executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="ai-search")
+        pending = deque()
+        try:
+            for path in itertools.islice(paths, self.batch_size * PREFETCH_BATCHES):
+                pending.append((path, executor.submit(_read_samples, path)))
+
+            while pending:
+                batch, samples = [], []
+                for _ in range(self.batch_size):
+                    if not pending:
+                        break
+                    path, future = pending.popleft()
+                    next_path = next(paths, None)
+                    if next_path is not None:
+                        pending.append((next_path, executor.submit(_read_samples, next_path)))
+                    try:
+                        samples.append(future.result())
+                        batch.append(path)
+                    except OSError as e:
+                        logging.error(f"Error processing file {path}: {str(e)}")
+                if not batch:
+                    continue
+
+                probabilities = model.predict_proba(_features(samples))
+                hits = [(path, float(p)) for path, p in zip(batch, probabilities) if p >= model.threshold]
+                hits.sort(key=lambda item: -item[1])
+                yield from hits
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def rank_files(self, paths):
+        """(path, probability) of the files the classifier takes for kernels, most likely first"""
+        return sorted(self.iter_candidates(paths=paths), key=lambda item: -item[1])
+
+    def search_kernel_file(self, search_directory=None):
+        best = max(self.iter_candidates(search_directory), key=lambda item: item[1], default=None)
+        if best:
+            logging.info(f"Potential kernel file found: {best[0]} ({best[1]:.2f})")
+            return best[0]
 
         logging.info("No kernel file found")
         return None
 
     def download_dependencies(self):
-        # This is a placeholder. In a real implementation, you'd need to
-        # implement logic to download necessary AI model dependencies.
-        logging.info("Downloading AI model dependencies...")
-        # Simulating download
-        import time
-        time.sleep(2)
-        logging.info("AI model dependencies downloaded successfully")
-
+        # The classifier ships with the application, only check that it loads
+        logging.info("Checking kernel classifier model...")
+        with self._model_lock:
+            self._model = self._load_model(self.model_path)
+        logging.info("Kernel classifier model is available")
@@ -0,0 +1,129 @@
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+from config import CONFIG
+
+ANALYSIS_CACHE_FILE = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'analysis_cache.db')
+DEFAULT_MAX_ENTRIES = 50000
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    path TEXT NOT NULL,
+    detector TEXT NOT NULL,
+    version INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    value TEXT NOT NULL,
+    last_used REAL NOT NULL,
+    PRIMARY KEY (path, detector)
+);
+CREATE INDEX IF NOT EXISTS results_last_used ON results (last_used);
+"""
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def file_fingerprint(path):
+    """(size, mtime_ns) of a file, (-1, 0) if it does not exist"""
+    try:
+        stat = os.stat(path)
+        return stat.st_size, stat.st_mtime_ns
+    except OSError:
+        return -1, 0
+
+
+class AnalysisCache:
+    """SQLite cache of per-file detector results keyed by path, size, mtime_ns and detector version"""
+
+    def __init__(self, db_path=ANALYSIS_CACHE_FILE, max_entries=DEFAULT_MAX_ENTRIES):
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        if db_path != ":memory:":
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+
+    def get(self, path, detector, version):
+        """Return (hit, value) for a detector result on a file that has not changed since"""
+        path = os.path.abspath(path)
+        size, mtime_ns = file_fingerprint(path)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM results WHERE path = ? AND detector = ? AND version = ? AND size = ? "
+                "AND mtime_ns = ?", (path, detector, version, size, mtime_ns)).fetchone()
+            if row is None:
+                return False, None
+            self._conn.execute("UPDATE results SET last_used = ? WHERE path = ? AND detector = ?",
+                               (time.time(), path, detector))
+            self._conn.commit()
+        return True, json.loads(row[0])
+
+    def put(self, path, detector, version, value):
+        """Store a JSON-serialisable result for the file as it is now"""
+        path = os.path.abspath(path)
+        size, mtime_ns = file_fingerprint(path)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO results (path, detector, version, size, mtime_ns, value, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (path, detector, version, size, mtime_ns, json.dumps(value), time.time()))
+            self._evict()
+            self._conn.commit()
+
+    def cached(self, path, detector, version, compute):
+        """Return the cached result for the file, calling compute() and storing it on a miss"""
+        hit, value = self.get(path, detector, version)
+        if not hit:
+            value = compute()
+            self.put(path, detector, version, value)
+        return value
+
+    def invalidate(self, path=None, detector=None):
+        """Drop cached results for a file or directory tree and/or a detector, everything if neither is given"""
+        clauses, params = [], []
+        if path is not None:
+            path = os.path.abspath(path)
+            prefix = path.rstrip(os.sep) + os.sep
+            clauses.append("(path = ? OR substr(path, 1, ?) = ?)")
+            params.extend([path, len(prefix), prefix])
+        if detector is not None:
+            clauses.append("detector = ?")
+            params.append(detector)
+        query = "DELETE FROM results" + (" WHERE " + " AND ".join(clauses) if clauses else "")
+        with self._lock:
+            removed = self._conn.execute(query, params).rowcount
+            self._conn.commit()
+        logging.info(f"Invalidated {removed} cached analysis result(s)")
+        return removed
+
+    def _evict(self):
+        """Keep at most max_entries rows, dropping the least recently used ones"""
+        count = self._conn.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+        if count > self.max_entries:
+            self._conn.execute(
+                "DELETE FROM results WHERE rowid IN "
+                "(SELECT rowid FROM results ORDER BY last_used ASC, rowid ASC LIMIT ?)", (count - self.max_entries,))
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def get_default_cache():
+    """Shared cache in ANALYSIS_CACHE_FILE, sized from the configuration"""
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = AnalysisCache(max_entries=CONFIG.get('analysis_cache_max_entries',
+                                                                  DEFAULT_MAX_ENTRIES))
+        return _default_cache
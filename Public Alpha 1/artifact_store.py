@@ -0,0 +1,161 @@
+import os
+import json
+import stat
+import shutil
+import logging
+import threading
+from bootimg import BootImage, BootImageError
+from kernel_formats import HEADER_SIZE, identify_header
+from utils import ensure_dir, file_sha256
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+ARTIFACTS_DIR = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'artifacts')
+INDEX_FILE = 'index.json'
+# ioctl(dest_fd, FICLONE, src_fd) shares the source extents (btrfs, XFS, bcachefs)
+FICLONE = 0x40049409
+
+COMPRESSED_FORMATS = {"gzip", "lz4", "xz"}
+FORMAT_ARCHITECTURES = {"arm64-image": "arm64", "zimage": "arm", "bzimage": "x86_64"}
+
+
+def describe_artifact(path):
+    """Return (format, arch, compression) guessed from the header bytes of a file"""
+    with open(path, 'rb') as f:
+        header = f.read(HEADER_SIZE)
+    fmt = identify_header(header)
+    if fmt == "android-boot":
+        # Describe the kernel inside the boot image
+        try:
+            with BootImage(path) as image:
+                kernel_header = bytes(image.section('kernel')[:HEADER_SIZE])
+        except BootImageError:
+            return fmt, None, None
+        kernel_fmt = identify_header(kernel_header)
+        compression = kernel_fmt if kernel_fmt in COMPRESSED_FORMATS else None
+        return fmt, FORMAT_ARCHITECTURES.get(kernel_fmt), compression
+    compression = fmt if fmt in COMPRESSED_FORMATS else None
+    return fmt, FORMAT_ARCHITECTURES.get(fmt), compression
+
+
+def link_or_copy(src, dst):
+    """Place src at dst as a reflink, else a hardlink, else a copy; returns the method used"""
+    if fcntl is not None:
+        try:
+            with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+                fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+            return "reflink"
+        except OSError:
+            if os.path.exists(dst):
+                os.remove(dst)
+
+    try:
+        os.link(src, dst)
+        return "hardlink"
+    except OSError:
+        pass
+
+    shutil.copyfile(src, dst)
+    return "copy"
+
+
+class ArtifactStore:
+    """Content-addressed store of kernels and recovery images, deduplicated by SHA-256"""
+
+    def __init__(self, root=ARTIFACTS_DIR):
+        self.root = root
+        self.objects_dir = os.path.join(root, 'objects')
+        self.index_path = os.path.join(root, INDEX_FILE)
+        self._lock = threading.Lock()
+        self.index = self._load()
+
+    def _load(self):
+        if os.path.exists(self.index_path):
+            with open(self.index_path, 'r') as f:
+                return json.load(f)
+        return {}
+
+    def save(self):
+        ensure_dir(self.root)
+        tmp_path = self.index_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.index, f, indent=2)
+        os.replace(tmp_path, self.index_path)
+
+    def object_path(self, digest):
+        return os.path.join(self.objects_dir, digest[:2], digest)
+
+    def add(self, path, kind):
+        """Import a file, storing its content once however many names it is imported under"""
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"File not found: {path}")
+
+        digest = file_sha256(path)
+        dest_path = self.object_path(digest)
+        name = os.path.basename(path)
+
+        with self._lock:
+            entry = self.index.get(digest)
+            if entry is None or not os.path.exists(dest_path):
+                ensure_dir(os.path.dirname(dest_path))
+                tmp_path = dest_path + '.tmp'
+                method = link_or_copy(path, tmp_path)
+                os.replace(tmp_path, dest_path)
+                if method != "hardlink":
+                    # A hardlink shares the inode (and mode) with the imported file, leave it alone
+                    os.chmod(dest_path, stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+                fmt, arch, compression = describe_artifact(dest_path)
+                entry = {
+                    'kind': kind,
+                    'size': os.path.getsize(dest_path),
+                    'format': fmt,
+                    'arch': arch,
+                    'compression': compression,
+                    'storage': method,
+                    'names': [],
+                }
+                self.index[digest] = entry
+                logging.info(f"Stored {kind} {name} as {digest} ({method})")
+            else:
+                logging.info(f"{name} is already stored as {digest}")
+
+            if name not in entry['names']:
+                entry['names'].append(name)
+            self.save()
+        return digest
+
+    def get(self, digest):
+        return self.index.get(digest)
+
+    def path(self, digest):
+        if digest not in self.index:
+            raise KeyError(f"Unknown artifact: {digest}")
+        return self.object_path(digest)
+
+    def find(self, name, kind=None):
+        """Digest of the artifact imported under the given name, or None"""
+        for digest, entry in self.index.items():
+            if name in entry['names'] and (kind is None or entry['kind'] == kind):
+                return digest
+        return None
+
+    def list_artifacts(self, kind=None):
+        return [dict(entry, sha256=digest, path=self.object_path(digest))
+                for digest, entry in self.index.items() if kind is None or entry['kind'] == kind]
+
+    def verify(self, digest):
+        """Re-hash a stored object, hardlinked ones can change behind the store's back"""
+        return file_sha256(self.path(digest)) == digest
+
+    def remove(self, digest):
+        with self._lock:
+            dest_path = self.path(digest)
+            if os.path.exists(dest_path):
+                if self.index[digest]['storage'] != "hardlink":
+                    os.chmod(dest_path, stat.S_IRUSR | stat.S_IWUSR)
+                os.remove(dest_path)
+            del self.index[digest]
+            self.save()
@@ -0,0 +1,83 @@
+import os
+import json
+import stat
+import logging
+from vm_store import list_vm_configs
+
+BASE_IMAGES_DIR = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'base_images')
+CATALOG_FILE = os.path.join(BASE_IMAGES_DIR, 'catalog.json')
+
+
+class BaseImageCatalog:
+    """Read-only golden qcow2 images that per-VM disks are cloned from, keyed by model/firmware"""
+
+    def __init__(self, catalog_path=CATALOG_FILE):
+        self.catalog_path = catalog_path
+        self.images = self._load()
+
+    def _load(self):
+        if os.path.exists(self.catalog_path):
+            with open(self.catalog_path, 'r') as f:
+                return json.load(f)
+        return {}
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.catalog_path), exist_ok=True)
+        with open(self.catalog_path, 'w') as f:
+            json.dump(self.images, f, indent=2)
+
+    @staticmethod
+    def make_key(model, firmware=None):
+        return f"{model}/{firmware}" if firmware else model
+
+    def register(self, image_path, model, firmware=None):
+        """Add a golden image to the catalog and make it read-only"""
+        if not os.path.exists(image_path):
+            raise FileNotFoundError(f"Base image not found: {image_path}")
+
+        image_path = os.path.abspath(image_path)
+        os.chmod(image_path, stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+
+        key = self.make_key(model, firmware)
+        self.images[key] = {
+            "path": image_path,
+            "model": model,
+            "firmware": firmware or ""
+        }
+        self.save()
+        logging.info(f"Registered base image {key}: {image_path}")
+        return key
+
+    def unregister(self, key):
+        """Remove a base image from the catalog, refusing while clones still use it"""
+        entry = self.images.get(key)
+        if entry is None:
+            return
+        users = self.get_clones(entry['path'])
+        if users:
+            raise RuntimeError(f"Base image {key} is still used by: {', '.join(users)}")
+        del self.images[key]
+        self.save()
+
+    def get(self, key):
+        return self.images.get(key)
+
+    def list_images(self):
+        return [dict(entry, key=key) for key, entry in sorted(self.images.items())]
+
+    def is_base_image(self, image_path):
+        image_path = os.path.abspath(image_path)
+        return any(os.path.abspath(entry['path']) == image_path for entry in self.images.values())
+
+    def get_clones(self, image_path):
+        """Names of the VMs whose disks are backed by the given image"""
+        image_path = os.path.abspath(image_path)
+        return [
+            vm_config['name']
+            for vm_config in list_vm_configs()
+            if vm_config.get('backing_file') and os.path.abspath(vm_config['backing_file']) == image_path
+        ]
+
+    def is_in_use(self, image_path):
+        """True if deleting the image would break the catalog or another VM's disk"""
+        return self.is_base_image(image_path) or bool(self.get_clones(image_path))
@@ -0,0 +1,218 @@
+import os
+import json
+import mmap
+import struct
+import logging
+from utils import ensure_dir, file_sha256
+
+BOOT_MAGIC = b"ANDROID!"
+VENDOR_BOOT_MAGIC = b"VNDRBOOT"
+# Boot image v3/v4 headers always use 4096 byte pages
+BOOT_V3_PAGE_SIZE = 4096
+UNPACKED_INFO_FILE = "bootimg.json"
+
+# Header layouts from AOSP system/tools/mkbootimg/include/bootimg/bootimg.h
+_BOOT_V0 = struct.Struct("<8s10I16s512s32s1024s")
+_BOOT_V1_EXTRA = struct.Struct("<IQI")
+_BOOT_V2_EXTRA = struct.Struct("<IQ")
+_BOOT_V3 = struct.Struct("<8s4I4II1536s")
+_BOOT_V4_EXTRA = struct.Struct("<I")
+_VENDOR_V3 = struct.Struct("<8s5I2048sI16s2IQ")
+_VENDOR_V4_EXTRA = struct.Struct("<4I")
+
+
+class BootImageError(ValueError):
+    pass
+
+
+def _cstring(raw):
+    return raw.split(b"\x00", 1)[0].decode("ascii", errors="replace")
+
+
+def _align(offset, page_size):
+    return (offset + page_size - 1) // page_size * page_size
+
+
+def decode_os_version(value):
+    """Split the packed os_version field into ('A.B.C', 'YYYY-MM') strings"""
+    if not value:
+        return None, None
+    version, patch = value >> 11, value & 0x7FF
+    os_version = f"{(version >> 14) & 0x7F}.{(version >> 7) & 0x7F}.{version & 0x7F}"
+    patch_level = f"{(patch >> 4) + 2000:04d}-{patch & 0xF:02d}"
+    return os_version, patch_level
+
+
+def is_boot_image(path):
+    """True if the file starts with a boot or vendor_boot magic"""
+    try:
+        with open(path, "rb") as f:
+            return f.read(8) in (BOOT_MAGIC, VENDOR_BOOT_MAGIC)
+    except (OSError, TypeError):
+        return False
+
+
+class BootImage:
+    """Android boot or vendor_boot image (header v0-v4) whose sections are memoryview slices of an mmap"""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "rb")
+        try:
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self._file.close()
+            raise BootImageError(f"Empty boot image: {path}")
+        self._views = []
+        self.sections = {}
+        try:
+            self._parse()
+        except (struct.error, BootImageError):
+            self.close()
+            raise
+
+    def _parse(self):
+        magic = self._mmap[:8]
+        if magic == BOOT_MAGIC:
+            self.kind = "boot"
+            self._parse_boot()
+        elif magic == VENDOR_BOOT_MAGIC:
+            self.kind = "vendor_boot"
+            self._parse_vendor_boot()
+        else:
+            raise BootImageError(f"Not an Android boot image: {self.path}")
+
+        size = len(self._mmap)
+        for name, (offset, length) in self.sections.items():
+            if offset + length > size:
+                raise BootImageError(f"Section {name} runs past the end of {self.path}")
+
+    def _parse_boot(self):
+        # v0-v2 keep the header version where v3+ keep reserved words, both at offset 40
+        self.header_version = struct.unpack_from("<I", self._mmap, 40)[0]
+        if self.header_version >= 3:
+            self._parse_boot_v3()
+            return
+
+        (_, kernel_size, _, ramdisk_size, _, second_size, _, _, self.page_size, _, os_version, name, cmdline,
+         _, extra_cmdline) = _BOOT_V0.unpack_from(self._mmap, 0)
+        self.name = _cstring(name)
+        self.cmdline = (_cstring(cmdline) + _cstring(extra_cmdline)).strip()
+        self.os_version, self.os_patch_level = decode_os_version(os_version)
+
+        sizes = [("kernel", kernel_size), ("ramdisk", ramdisk_size), ("second", second_size)]
+        offset = _BOOT_V0.size
+        if self.header_version >= 1:
+            recovery_dtbo_size, _, _ = _BOOT_V1_EXTRA.unpack_from(self._mmap, offset)
+            sizes.append(("recovery_dtbo", recovery_dtbo_size))
+            offset += _BOOT_V1_EXTRA.size
+        if self.header_version == 2:
+            dtb_size, _ = _BOOT_V2_EXTRA.unpack_from(self._mmap, offset)
+            sizes.append(("dtb", dtb_size))
+        self._layout(self.page_size, sizes)
+
+    def _parse_boot_v3(self):
+        (_, kernel_size, ramdisk_size, os_version, _, _, _, _, _, _,
+         cmdline) = _BOOT_V3.unpack_from(self._mmap, 0)
+        self.page_size = BOOT_V3_PAGE_SIZE
+        self.name = ""
+        self.cmdline = _cstring(cmdline)
+        self.os_version, self.os_patch_level = decode_os_version(os_version)
+
+        sizes = [("kernel", kernel_size), ("ramdisk", ramdisk_size)]
+        if self.header_version >= 4:
+            signature_size, = _BOOT_V4_EXTRA.unpack_from(self._mmap, _BOOT_V3.size)
+            sizes.append(("signature", signature_size))
+        self._layout(self.page_size, sizes)
+
+    def _parse_vendor_boot(self):
+        (_, self.header_version, self.page_size, _, _, ramdisk_size, cmdline, _, name, _, dtb_size,
+         _) = _VENDOR_V3.unpack_from(self._mmap, 0)
+        self.name = _cstring(name)
+        self.cmdline = _cstring(cmdline)
+        self.os_version, self.os_patch_level = None, None
+
+        sizes = [("ramdisk", ramdisk_size), ("dtb", dtb_size)]
+        if self.header_version >= 4:
+            table_size, _, _, bootconfig_size = _VENDOR_V4_EXTRA.unpack_from(self._mmap, _VENDOR_V3.size)
+            sizes.extend([("ramdisk_table", table_size), ("bootconfig", bootconfig_size)])
+        self._layout(self.page_size, sizes)
+
+    def _layout(self, page_size, sizes):
+        """Sections follow the header one after another, each starting on a page boundary"""
+        if not page_size:
+            raise BootImageError(f"Invalid page size in {self.path}")
+        offset = page_size
+        for name, size in sizes:
+            self.sections[name] = (offset, size)
+            offset = _align(offset + size, page_size)
+
+    def section(self, name):
+        """Zero-copy view of a section, empty if the image does not have it"""
+        offset, size = self.sections.get(name, (0, 0))
+        view = memoryview(self._mmap)[offset:offset + size]
+        self._views.append(view)
+        return view
+
+    def write_section(self, name, path):
+        """Write a section to a file, returns False if the section is empty"""
+        view = self.section(name)
+        if not len(view):
+            return False
+        with open(path, "wb") as f:
+            f.write(view)
+        return True
+
+    def to_dict(self):
+        return {
+            "kind": self.kind,
+            "header_version": self.header_version,
+            "page_size": self.page_size,
+            "name": self.name,
+            "cmdline": self.cmdline,
+            "os_version": self.os_version,
+            "os_patch_level": self.os_patch_level,
+            "sections": {name: size for name, (_, size) in self.sections.items() if size},
+        }
+
+    def close(self):
+        for view in self._views:
+            view.release()
+        self._views = []
+        self._mmap.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def unpack_boot_image(path, cache_dir):
+    """Unpack a boot image into cache_dir/<sha256>/, reusing an earlier unpack of the same content.
+
+    Returns the header info with the paths of the extracted sections added under 'files'.
+    """
+    digest = file_sha256(path)
+    target_dir = os.path.join(cache_dir, digest)
+    info_path = os.path.join(target_dir, UNPACKED_INFO_FILE)
+    if os.path.exists(info_path):
+        with open(info_path, "r") as f:
+            return json.load(f)
+
+    ensure_dir(target_dir)
+    with BootImage(path) as image:
+        info = image.to_dict()
+        info["sha256"] = digest
+        info["files"] = {}
+        for name in image.sections:
+            section_path = os.path.join(target_dir, name)
+            if image.write_section(name, section_path):
+                info["files"][name] = section_path
+
+    # Written last so that an interrupted unpack is redone next time
+    with open(info_path, "w") as f:
+        json.dump(info, f, indent=2)
+    logging.info(f"Unpacked {image.kind} image v{image.header_version} {path} into {target_dir}")
+    return info
@@ -0,0 +1,176 @@
+import os
+import re
+import fnmatch
+import logging
+from fs_image import PartitionImages
+
+# Property files per partition, in the order init loads them. Files loaded later override
+# earlier values, so product wins over odm, vendor, system_ext and system.
+PARTITION_PROP_FILES = [
+    ("system", ["default.prop", "system/etc/prop.default", "system/system/etc/prop.default",
+                "system/build.prop", "system/system/build.prop"]),
+    ("system_ext", ["system_ext/build.prop", "system_ext/etc/build.prop",
+                    "system/system_ext/build.prop", "system/system_ext/etc/build.prop"]),
+    ("vendor", ["vendor/default.prop", "vendor/build.prop"]),
+    ("odm", ["odm/build.prop", "odm/etc/build.prop", "vendor/odm/etc/build.prop"]),
+    ("product", ["product/build.prop", "product/etc/build.prop",
+                 "system/product/build.prop", "system/product/etc/build.prop"]),
+]
+# Default of ro.product.property_source_order, used when ro.product.<name> itself is unset
+PRODUCT_PROPERTY_SOURCE_ORDER = ["product", "odm", "vendor", "system_ext", "system"]
+MAX_IMPORT_DEPTH = 8
+# Bump when parse_prop_file changes so that cached parses are redone
+PARSER_VERSION = 1
+
+_EXPANSION = re.compile(r"\$\{([^}]+)\}")
+
+
+def parse_prop_lines(lines):
+    """Parse property file lines into ['prop', name, value] and ['import', path, filter] entries"""
+    entries = []
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        if line.startswith('import '):
+            parts = line.split()
+            if len(parts) >= 2:
+                entries.append(['import', parts[1], parts[2] if len(parts) > 2 else None])
+            continue
+        name, sep, value = line.partition('=')
+        if sep:
+            entries.append(['prop', name.strip(), value.strip()])
+    return entries
+
+
+def parse_prop_file(path):
+    """Stream a property file into ['prop', name, value] and ['import', path, filter] entries"""
+    with open(path, 'r', encoding='utf-8', errors='replace') as f:
+        return parse_prop_lines(f)
+
+
+class PropertyIndex:
+    """Merged build.prop properties of a dump, built in one pass with O(1) lookups"""
+
+    def __init__(self, root=None, cache=None):
+        self.root = root
+        self.cache = cache
+        self.props = {}
+        self.sources = {}
+        self.files = []
+        self.images = None
+        self._image_members = set()
+
+    @classmethod
+    def from_dump(cls, dump_folder, cache=None):
+        """Index a dump, reusing parses of unchanged files from an AnalysisCache if given.
+
+        Property files missing from the extracted tree are read straight from the dump's
+        partition images (system.img, vendor.img, ...) when it has them.
+        """
+        index = cls(dump_folder, cache)
+        with PartitionImages(dump_folder) as images:
+            index.images = images
+            for partition, relative_paths in PARTITION_PROP_FILES:
+                for relative_path in relative_paths:
+                    index._load_dump_file(relative_path, partition)
+            index.images = None
+        return index
+
+    def _load_dump_file(self, relative_path, partition, key_filter=None, depth=0):
+        path = os.path.join(self.root, relative_path)
+        if os.path.exists(path):
+            self.load_file(path, partition, key_filter, depth)
+            return True
+        member = self.images.locate(relative_path) if self.images is not None else None
+        if member is not None:
+            self.load_image_file(*member, partition, key_filter, depth)
+            return True
+        return False
+
+    def load_image_file(self, image, inner_path, partition, key_filter=None, depth=0):
+        """Read a property file from inside a partition image without extracting it"""
+        # Partitions of one super image share its path, so members are told apart by partition
+        member = f"{image.partition}:{inner_path}" if image.partition else inner_path
+        if (image.path, member) in self._image_members:
+            return
+        self._image_members.add((image.path, member))
+        # Changes to the image are what invalidates the properties read from it
+        if image.path not in self.files:
+            self.files.append(image.path)
+        try:
+            def parse():
+                return parse_prop_lines(image.read_text(inner_path).splitlines())
+
+            if self.cache is not None:
+                entries = self.cache.cached(image.path, f'build_prop:{member}', PARSER_VERSION, parse)
+            else:
+                entries = parse()
+        except (OSError, ValueError) as e:
+            logging.warning(f"Could not read property file {member} of {image.path}: {str(e)}")
+            return
+        self._add_entries(entries, partition, f"{image.path}:{member}", key_filter, depth)
+
+    def load_file(self, path, partition, key_filter=None, depth=0):
+        """Stream a property file into the index, later definitions overriding earlier ones"""
+        if path in self.files and depth:
+            return
+        self.files.append(path)
+        try:
+            if self.cache is not None:
+                entries = self.cache.cached(path, 'build_prop', PARSER_VERSION, lambda: parse_prop_file(path))
+            else:
+                entries = parse_prop_file(path)
+        except OSError as e:
+            logging.warning(f"Could not read property file {path}: {str(e)}")
+            return
+
+        self._add_entries(entries, partition, path, key_filter, depth)
+
+    def _add_entries(self, entries, partition, path, key_filter, depth):
+        for kind, name, value in entries:
+            if kind == 'import':
+                self._load_import(name, value, partition, depth)
+                continue
+            if key_filter and not fnmatch.fnmatchcase(name, key_filter):
+                continue
+            self.props[name] = value
+            self.sources[name] = (path, partition)
+
+    def _load_import(self, device_path, key_filter, partition, depth):
+        """Handle 'import <path> [<key filter>]', the path being a device path"""
+        if depth >= MAX_IMPORT_DEPTH:
+            return
+        device_path = _EXPANSION.sub(lambda m: self.props.get(m.group(1), ''), device_path)
+        if self.root:
+            self._load_dump_file(device_path.lstrip('/'), partition, key_filter, depth + 1)
+        elif os.path.exists(device_path):
+            self.load_file(device_path, partition, key_filter, depth + 1)
+
+    def get(self, name, default=None):
+        return self.props.get(name, default)
+
+    def __getitem__(self, name):
+        return self.props[name]
+
+    def __contains__(self, name):
+        return name in self.props
+
+    def __len__(self):
+        return len(self.props)
+
+    def source(self, name):
+        """(file, partition) the current value of a property came from"""
+        return self.sources.get(name)
+
+    def product_property(self, name, default=None):
+        """ro.product.<name>, falling back to the per-partition ro.product.<partition>.<name> values"""
+        value = self.props.get(f"ro.product.{name}")
+        if value:
+            return value
+        order = self.props.get("ro.product.property_source_order")
+        for partition in (order.split(',') if order else PRODUCT_PROPERTY_SOURCE_ORDER):
+            value = self.props.get(f"ro.product.{partition.strip()}.{name}")
+            if value:
+                return value
+        return default
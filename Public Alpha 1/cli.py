@@ -0,0 +1,348 @@
+import os
+import sys
+import json
+import logging
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from config import CONFIG
+from qemu_controller import QEMUController, DEFAULT_STORAGE_PROFILE
+from dump_analyzer import DumpAnalyzer, analyze_dump
+from analysis_cache import get_default_cache
+from vm_store import (load_vm_config, save_vm_config, list_vm_configs, get_vm_config_path, load_vm_runtime,
+                      save_vm_runtime, delete_vm_runtime)
+
+DEFAULT_MEMORY = 2048
+DEFAULT_JOBS = 8
+# How long status and snapshot wait for the monitor of an already running VM
+ATTACH_TIMEOUT = 5
+
+
+def load_manifest(path):
+    """Manifest entries as dicts; a manifest is a JSON list, or an object with a "vms" list, of VM names or dicts"""
+    with open(path, 'r') as f:
+        manifest = json.load(f)
+    if isinstance(manifest, dict):
+        manifest = manifest.get("vms", [])
+    if not isinstance(manifest, list):
+        raise ValueError(f"Manifest {path} must hold a list of virtual machines")
+    return [{"name": entry} if isinstance(entry, str) else dict(entry) for entry in manifest]
+
+
+def _runtime_record(controller, vm_name):
+    instance = controller.vms[vm_name]
+    return dict(controller.get_vm_status(vm_name), snapshot_tag=instance.snapshot_tag, command=instance.command)
+
+
+def _attach(controller, vm_name, timeout=ATTACH_TIMEOUT):
+    """Pick up a VM left running by an earlier invocation, None if it is not running anymore"""
+    runtime = load_vm_runtime(vm_name)
+    if runtime is None:
+        return None
+    instance = controller.attach_emulator(vm_name, runtime['pid'], runtime.get('ports', {}), runtime.get('model'),
+                                          runtime.get('disk_path'), runtime.get('snapshot_tag'),
+                                          runtime.get('command'))
+    if not instance.is_running():
+        delete_vm_runtime(vm_name)
+        return None
+    controller.wait_until_ready(vm_name, timeout)
+    return instance
+
+
+def _stopped_status(vm_name):
+    vm_config = load_vm_config(vm_name) if os.path.exists(get_vm_config_path(vm_name)) else {}
+    return {
+        "name": vm_name,
+        "model": vm_config.get('model'),
+        "disk_path": vm_config.get('qcow2_path', vm_config.get('virtual_disk_path')),
+        "state": "stopped",
+        "pid": None,
+        "accelerator": None,
+        "ports": {}
+    }
+
+
+def create_vm(controller, entry, args):
+    vm_name = entry['name']
+    if os.path.exists(get_vm_config_path(vm_name)):
+        raise FileExistsError(f"Virtual machine '{vm_name}' already exists")
+
+    model, ui_version = entry.get('model'), entry.get('ui_version')
+    if not model and entry.get('dump_folder'):
+        model, detected_ui_version = analyze_dump(entry['dump_folder'])
+        ui_version = ui_version or detected_ui_version
+    if model not in controller.config['samsung_models']:
+        raise ValueError(f"Unknown model: {model}")
+
+    vm_config = {
+        'name': vm_name,
+        'model': model,
+        'ui_version': ui_version,
+        'memory': entry.get('memory', DEFAULT_MEMORY),
+        'cpus': entry.get('cpus', 1),
+        'use_default_kernel': not entry.get('kernel_path'),
+        'kernel_path': entry.get('kernel_path'),
+        'disk_size': entry.get('disk_size', controller.config.get('virtual_disk_size', 4096)),
+        'base_image': entry.get('base_image'),
+        'storage': dict(DEFAULT_STORAGE_PROFILE, **(entry.get('storage') or {})),
+        'dump_folder': entry.get('dump_folder')
+    }
+    if entry.get('cluster_size'):
+        vm_config['storage']['cluster_size'] = entry['cluster_size']
+
+    cluster_size = vm_config['storage'].get('cluster_size')
+    # A disk left by import-firmware --vm, which no VM config refers to yet, becomes this VM's disk
+    adopted = (not vm_config['base_image'] and not entry.get('image')
+               and os.path.exists(controller.get_vm_disk_path(vm_name)))
+    if adopted:
+        vdisk_path = controller.get_vm_disk_path(vm_name)
+        logging.info(f"Using the existing disk {vdisk_path} for {vm_name}")
+    elif vm_config['base_image']:
+        from base_images import BaseImageCatalog
+        base_image = BaseImageCatalog().get(vm_config['base_image'])
+        if base_image is None:
+            raise ValueError(f"Unknown base image: {vm_config['base_image']}")
+        vdisk_path = controller.create_linked_clone(base_image['path'], vm_name, vm_config['disk_size'],
+                                                    cluster_size=cluster_size)
+        vm_config['backing_file'] = base_image['path']
+    elif entry.get('image'):
+        vdisk_path = controller.create_virtual_disk_from_image(entry['image'], vm_name, cluster_size=cluster_size,
+                                                               partition=entry.get('partition'))
+    else:
+        vdisk_path = controller.create_virtual_disk(vm_config['disk_size'], vm_name, cluster_size=cluster_size)
+    vm_config['virtual_disk_path'] = vdisk_path
+    vm_config['qcow2_path'] = vdisk_path
+
+    if entry.get('provision'):
+        try:
+            if not vm_config['dump_folder']:
+                raise ValueError("Provisioning partition drives needs a dump folder")
+            vm_config['drives'] = controller.provision_vm_disks(vm_name, vm_config['dump_folder'],
+                                                                cluster_size=cluster_size)
+        except Exception:
+            if not adopted:
+                os.remove(vdisk_path)
+            raise
+
+    save_vm_config(vm_config)
+    return vm_config
+
+
+def start_vm(controller, entry, args):
+    vm_name = entry['name']
+    if _attach(controller, vm_name, timeout=0) is not None:
+        raise RuntimeError(f"Virtual machine '{vm_name}' is already running")
+
+    vm_config = load_vm_config(vm_name)
+    controller.start_emulator(
+        vm_config['model'],
+        vm_config['ui_version'],
+        vm_config['memory'],
+        vm_config.get('kernel_zip', vm_config.get('kernel_path')),
+        vm_config.get('recovery_img'),
+        vm_name=vm_name,
+        disk_path=vm_config.get('qcow2_path', vm_config['virtual_disk_path']),
+        fast_start=args.fast,
+        cpus=vm_config.get('cpus', 1),
+        storage=vm_config.get('storage'),
+        detach=not args.wait,
+        drives=vm_config.get('drives')
+    )
+    controller.wait_until_ready(vm_name)
+    save_vm_runtime(vm_name, _runtime_record(controller, vm_name))
+    if args.wait:
+        controller.vms[vm_name].process.wait()
+        delete_vm_runtime(vm_name)
+    return controller.get_vm_status(vm_name)
+
+
+def stop_vm(controller, entry, args):
+    vm_name = entry['name']
+    if _attach(controller, vm_name) is None:
+        return _stopped_status(vm_name)
+    controller.stop_emulator(vm_name, timeout=args.timeout)
+    delete_vm_runtime(vm_name)
+    return controller.get_vm_status(vm_name)
+
+
+def vm_status(controller, entry, args):
+    vm_name = entry['name']
+    if _attach(controller, vm_name) is None:
+        return _stopped_status(vm_name)
+    return controller.get_vm_status(vm_name)
+
+
+def snapshot_vm(controller, entry, args):
+    vm_name = entry['name']
+    if args.list:
+        vm_config = load_vm_config(vm_name)
+        return {"name": vm_name, "snapshots": controller.list_snapshots(vm_config['virtual_disk_path'])}
+    if _attach(controller, vm_name) is None:
+        raise RuntimeError(f"Virtual machine '{vm_name}' is not running")
+    return {"name": vm_name, "tag": controller.save_boot_snapshot(vm_name)}
+
+
+def analyze_dump_folder(controller, entry, args):
+    dump_folder = entry['dump_folder']
+    if not os.path.isdir(dump_folder):
+        raise FileNotFoundError(f"Dump folder not found: {dump_folder}")
+    analyzer = DumpAnalyzer(dump_folder, cache=get_default_cache())
+    return dict(analyzer.analyze(), dump_folder=dump_folder)
+
+
+def import_kernel(controller, entry, args):
+    kernel_path = controller.add_kernel(entry['kernel_path'])
+    result = {"kernel_path": kernel_path}
+    if entry.get('name'):
+        vm_config = load_vm_config(entry['name'])
+        vm_config.pop('kernel_zip', None)
+        vm_config['kernel_path'] = kernel_path
+        vm_config['use_default_kernel'] = False
+        save_vm_config(vm_config)
+        result['name'] = entry['name']
+    return result
+
+
+def import_firmware(controller, entry, args):
+    return controller.import_firmware(entry['package'], dump_folder=entry.get('dump_folder'),
+                                      vm_name=entry.get('name'), cluster_size=entry.get('cluster_size'))
+
+
+def _entries(args):
+    """Targets of the command from the positional arguments and the manifest"""
+    if args.command == "analyze-dump":
+        entries = [{"dump_folder": folder} for folder in args.dump_folders]
+    elif args.command == "import-kernel":
+        entries = [{"kernel_path": path, "name": args.vm} for path in args.kernel_paths]
+    elif args.command == "import-firmware":
+        entries = [{"package": path, "dump_folder": args.dump_folder, "name": args.vm} for path in args.packages]
+    else:
+        entries = [{"name": name} for name in args.names]
+
+    if args.manifest:
+        entries.extend(load_manifest(args.manifest))
+    if args.command == "create":
+        defaults = {key: value for key, value in vars(args).items()
+                    if key in ('model', 'ui_version', 'memory', 'cpus', 'disk_size', 'kernel_path', 'base_image',
+                               'cluster_size', 'dump_folder', 'image', 'partition', 'provision') and value is not None}
+        entries = [dict(defaults, **entry) for entry in entries]
+    elif args.command == "status" and not entries:
+        entries = [{"name": vm_config['name']} for vm_config in list_vm_configs()]
+
+    required = {"analyze-dump": "dump_folder", "import-kernel": "kernel_path",
+                "import-firmware": "package"}.get(args.command, "name")
+    for entry in entries:
+        if not entry.get(required):
+            raise ValueError(f"Every {args.command} target needs a {required}: {entry}")
+    return entries
+
+
+def _label(entry):
+    return entry.get('package') or entry.get('name') or entry.get('dump_folder') or entry.get('kernel_path')
+
+
+def run_batch(handler, controller, entries, args):
+    """Run handler over every entry in parallel and collect a JSON-friendly result per entry"""
+    def run(entry):
+        try:
+            return {"target": _label(entry), "ok": True, "result": handler(controller, entry, args)}
+        except Exception as e:
+            logging.error(f"{args.command} failed for {_label(entry)}: {str(e)}")
+            return {"target": _label(entry), "ok": False, "error": str(e)}
+
+    if len(entries) <= 1:
+        return [run(entry) for entry in entries]
+    with ThreadPoolExecutor(max_workers=args.jobs, thread_name_prefix="cli") as executor:
+        return list(executor.map(run, entries))
+
+
+HANDLERS = {
+    "create": create_vm,
+    "start": start_vm,
+    "stop": stop_vm,
+    "status": vm_status,
+    "snapshot": snapshot_vm,
+    "analyze-dump": analyze_dump_folder,
+    "import-kernel": import_kernel,
+    "import-firmware": import_firmware,
+}
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="samsemung", description="Manage SamsEmung virtual machines without the GUI. "
+                                                                   "Results are printed as JSON on stdout.")
+    parser.add_argument("-v", "--verbose", action="store_true", help="log progress to stderr")
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--manifest", help="JSON file listing the virtual machines to operate on")
+    common.add_argument("-j", "--jobs", type=int, default=DEFAULT_JOBS, help="virtual machines handled in parallel")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    create = subparsers.add_parser("create", parents=[common], help="create virtual machines and their disks")
+    create.add_argument("names", nargs="*")
+    create.add_argument("--model")
+    create.add_argument("--ui-version")
+    create.add_argument("--memory", type=int)
+    create.add_argument("--cpus", type=int)
+    create.add_argument("--disk-size", type=int, help="disk size in MB")
+    create.add_argument("--kernel-path")
+    create.add_argument("--base-image", help="create the disk as a linked clone of this base image")
+    create.add_argument("--cluster-size")
+    create.add_argument("--image", help="create the disk from this raw or Android sparse image")
+    create.add_argument("--partition", help="with a super image as --image, use this logical partition of it")
+    create.add_argument("--dump-folder", help="detect the model from this dump when --model is not given")
+    create.add_argument("--provision", action="store_true", default=None,
+                        help="also build a drive per partition (system, vendor, ...) of the dump folder")
+
+    start = subparsers.add_parser("start", parents=[common], help="start virtual machines")
+    start.add_argument("names", nargs="*")
+    start.add_argument("--fast", action="store_true", help="resume from the saved boot state if there is one")
+    start.add_argument("--wait", action="store_true", help="stay in the foreground until the machines exit")
+
+    stop = subparsers.add_parser("stop", parents=[common], help="power down running virtual machines")
+    stop.add_argument("names", nargs="*")
+    stop.add_argument("--timeout", type=float, help="seconds to wait for the guest before killing QEMU")
+
+    status = subparsers.add_parser("status", parents=[common], help="show the state of virtual machines (all by default)")
+    status.add_argument("names", nargs="*")
+
+    snapshot = subparsers.add_parser("snapshot", parents=[common], help="save the booted state of running machines")
+    snapshot.add_argument("names", nargs="*")
+    snapshot.add_argument("--list", action="store_true", help="list the saved states instead")
+
+    analyze = subparsers.add_parser("analyze-dump", parents=[common], help="analyze firmware dump folders")
+    analyze.add_argument("dump_folders", nargs="*")
+
+    import_parser = subparsers.add_parser("import-kernel", parents=[common], help="add kernels to the artifact store")
+    import_parser.add_argument("kernel_paths", nargs="*")
+    import_parser.add_argument("--vm", help="also make this virtual machine boot the imported kernel")
+
+    firmware = subparsers.add_parser("import-firmware", parents=[common],
+                                     help="import Odin firmware packages (AP/BL/CP/CSC .tar.md5)")
+    firmware.add_argument("packages", nargs="*")
+    firmware.add_argument("--dump-folder", help="write the partition images (super.img, system.img, ...) here")
+    firmware.add_argument("--vm", help="turn system.img into the disk of this new virtual machine's name, "
+                                       "then run create with that name to set the machine up around it")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING, stream=sys.stderr,
+                        format="%(levelname)s: %(message)s")
+
+    try:
+        entries = _entries(args)
+    except (OSError, ValueError) as e:
+        json.dump({"command": args.command, "ok": False, "error": str(e), "results": []}, sys.stdout)
+        sys.stdout.write("\n")
+        return 2
+
+    controller = QEMUController(CONFIG)
+    results = run_batch(HANDLERS[args.command], controller, entries, args)
+    ok = all(result["ok"] for result in results)
+    json.dump({"command": args.command, "ok": ok, "results": results}, sys.stdout, indent=2, default=str)
+    sys.stdout.write("\n")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
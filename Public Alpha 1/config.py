@@ -16,7 +16,14 @@ DEFAULT_CONFIG = {
     "virtual_disk_path": "",
     "touchwiz_versions": ["TouchWiz 5", "TouchWiz 6", "TouchWiz 7"],
     "oneui_versions": ["One UI 1.0", "One UI 2.0", "One UI 3.0"],
-    "font": "default"
+    "font": "default",
+    "accelerator": "auto",
+    "tcg_tb_size": 512,
+    "analysis_cache_max_entries": 50000,
+    "use_ai_search": False,
+    "ai_search_batch_size": 64,
+    "ai_search_workers": 4,
+    "max_concurrent_jobs": 4
 }
 
 CONFIG_FILE = "samsemung_config.json"
@@ -0,0 +1,147 @@
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+DEFAULT_DETECTOR_TIMEOUT = 30
+DEFAULT_MAX_WORKERS = 8
+
+# name -> Detector, in registration order
+DETECTORS = {}
+_registry_lock = threading.Lock()
+
+
+class DetectorError(RuntimeError):
+    pass
+
+
+class Detector:
+    """A named dump detector with the files it reads and the detectors it needs first"""
+
+    def __init__(self, name, func, inputs=(), depends=(), timeout=DEFAULT_DETECTOR_TIMEOUT, public=True,
+                 tracks_property_imports=False):
+        self.name = name
+        self.func = func
+        self.inputs = list(inputs)
+        self.depends = list(depends)
+        self.timeout = timeout
+        # Private detectors only prepare state for others and are left out of the results
+        self.public = public
+        # Files pulled in by build.prop import lines count as inputs too
+        self.tracks_property_imports = tracks_property_imports
+
+
+def register_detector(name, func, inputs=(), depends=(), timeout=DEFAULT_DETECTOR_TIMEOUT, public=True,
+                      tracks_property_imports=False):
+    """Add or replace a detector; func(analyzer) returns its JSON-serialisable result"""
+    detector = Detector(name, func, inputs, depends, timeout, public, tracks_property_imports)
+    with _registry_lock:
+        for dependency in detector.depends:
+            if dependency not in DETECTORS:
+                raise DetectorError(f"Detector '{name}' depends on unknown detector '{dependency}'")
+        DETECTORS[name] = detector
+    return detector
+
+
+def unregister_detector(name):
+    with _registry_lock:
+        dependents = [d.name for d in DETECTORS.values() if name in d.depends]
+        if dependents:
+            raise DetectorError(f"Detector '{name}' is needed by: {', '.join(dependents)}")
+        DETECTORS.pop(name, None)
+
+
+def dependents_closure(names):
+    """The given detectors plus everything that depends on them, directly or not"""
+    selected = set(names)
+    changed = True
+    while changed:
+        changed = False
+        for detector in DETECTORS.values():
+            if detector.name not in selected and selected.intersection(detector.depends):
+                selected.add(detector.name)
+                changed = True
+    return selected
+
+
+def topological_order(names=None):
+    """Detector names ordered so that every detector comes after its dependencies"""
+    names = set(DETECTORS) if names is None else set(names)
+    order, visiting, done = [], set(), set()
+
+    def visit(name):
+        if name in done:
+            return
+        if name in visiting:
+            raise DetectorError(f"Detector dependency cycle through '{name}'")
+        visiting.add(name)
+        for dependency in DETECTORS[name].depends:
+            if dependency in names:
+                visit(dependency)
+        visiting.discard(name)
+        done.add(name)
+        order.append(name)
+
+    for name in DETECTORS:
+        if name in names:
+            visit(name)
+    return order
+
+
+def run_detectors(analyzer, names, max_workers=DEFAULT_MAX_WORKERS):
+    """Run detectors on a thread pool as soon as their dependencies have finished.
+
+    Results go to analyzer.results and failures to analyzer.errors. A detector that raises or
+    exceeds its timeout gets None, and so do the selected detectors depending on it. Detectors
+    outside `names` are not run; their earlier results are what dependents see.
+    """
+    order = topological_order(names)
+    pending = {name: set(DETECTORS[name].depends) & set(order) for name in order}
+    running = {}
+    skipped = {}
+    executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="detector")
+    for name in order:
+        analyzer.errors.pop(name, None)
+
+    def finish(name, value=None, error=None):
+        analyzer.results[name] = value
+        if error is not None:
+            analyzer.errors[name] = error
+            logging.error(f"Detector '{name}' failed: {error}")
+        for other, remaining in pending.items():
+            if name in remaining:
+                remaining.discard(name)
+                if error is not None:
+                    skipped.setdefault(other, name)
+
+    try:
+        while pending or running:
+            for name in [n for n, remaining in pending.items() if not remaining]:
+                del pending[name]
+                if name in skipped:
+                    finish(name, error=f"dependency '{skipped[name]}' failed")
+                    continue
+                detector = DETECTORS[name]
+                running[executor.submit(detector.func, analyzer)] = (name, time.monotonic() + detector.timeout)
+
+            if not running:
+                continue
+            now = time.monotonic()
+            done, _ = wait(running, timeout=max(0, min(deadline for _, deadline in running.values()) - now),
+                           return_when=FIRST_COMPLETED)
+            for future in done:
+                name, _ = running.pop(future)
+                try:
+                    finish(name, future.result())
+                except Exception as e:
+                    finish(name, error=str(e))
+
+            now = time.monotonic()
+            for future, (name, deadline) in list(running.items()):
+                if future not in done and deadline <= now:
+                    # The thread cannot be killed, it is abandoned and its result ignored
+                    del running[future]
+                    finish(name, error=f"timed out after {DETECTORS[name].timeout}s")
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+    return order
@@ -1,62 +1,189 @@
 import os
 import json
 import logging
+from operator import methodcaller
 from models.device_model import DeviceModel
+from build_prop import PropertyIndex, PARTITION_PROP_FILES
+from analysis_cache import get_default_cache
+from kernel_version import detect_kernel_version
+from fs_image import PARTITION_IMAGES
+from detectors import (DETECTORS, DEFAULT_MAX_WORKERS, register_detector, dependents_closure, topological_order,
+                       run_detectors)
+
+# Bump when a detector changes so that its cached results are recomputed
+KERNEL_DETECTOR_VERSION = 2
+
+# Property files of every partition, relative to the dump folder, and the partition images they
+# are read from when the dump has not been extracted
+PROPERTY_FILES = [path for _, paths in PARTITION_PROP_FILES for path in paths] + \
+                 [f"{partition}.img" for partition in PARTITION_IMAGES] + ["super.img"]
+
+# One UI is reported from ro.build.version.oneui, or from the SEP version (One UI = SEP - 9)
+FIRST_ONEUI_SEP_MAJOR = 10
+# Pre-SEP Samsung skins by ro.build.version.sdk
+TOUCHWIZ_BY_SDK = {
+    19: "TouchWiz 5",
+    21: "TouchWiz 6",
+    22: "TouchWiz 6",
+    23: "TouchWiz 7",
+}
 
 def analyze_dump(dump_folder):
-    analyzer = DumpAnalyzer(dump_folder)
+    analyzer = DumpAnalyzer(dump_folder, cache=get_default_cache())
     result = analyzer.analyze()
     return result['device_model']['model'] if result['device_model'] else "Unknown", result['touchwiz_version']
 
 class DumpAnalyzer:
-    def __init__(self, dump_folder):
+    def __init__(self, dump_folder, cache=None, max_workers=DEFAULT_MAX_WORKERS):
         self.dump_folder = dump_folder
+        self.cache = cache
+        self.max_workers = max_workers
+        self._properties = None
+        self.kernel_info = None
+        self.results = {}
+        self.errors = {}
+
+    @property
+    def properties(self):
+        """Property index of every partition's build.prop, built on first use"""
+        if self._properties is None:
+            self._properties = PropertyIndex.from_dump(self.dump_folder, self.cache)
+        return self._properties
 
     def analyze(self):
         try:
-            device_model = self._detect_device_model()
-            touchwiz_version = self._detect_touchwiz_version()
-            kernel_version = self._detect_kernel_version()
-
-            analysis_result = {
-                "device_model": device_model.to_dict() if device_model else None,
-                "touchwiz_version": touchwiz_version,
-                "kernel_version": kernel_version
-            }
-
+            analysis_result = self.refresh(DETECTORS)
             logging.info(f"Dump analysis completed: {json.dumps(analysis_result, indent=2)}")
             return analysis_result
         except Exception as e:
             logging.error(f"Error during dump analysis: {str(e)}")
             raise
 
+    def refresh(self, detectors):
+        """Re-run the given detectors and those depending on them, keeping the other results.
+
+        Returns the public results, with the names that were re-run available as last_run.
+        """
+        self.last_run = [name for name in run_detectors(self, dependents_closure(detectors), self.max_workers)
+                         if DETECTORS[name].public]
+        return {name: self.results.get(name) for name in topological_order() if DETECTORS[name].public}
+
+    def detector_inputs(self, name):
+        """Absolute paths a detector reads, including files pulled in by build.prop imports"""
+        detector = DETECTORS[name]
+        paths = [os.path.join(self.dump_folder, path) for path in detector.inputs]
+        if detector.tracks_property_imports and self._properties is not None:
+            paths.extend(path for path in self._properties.files if path not in paths)
+        return paths
+
+    def detectors_for_paths(self, changed_paths):
+        """Detectors with an input at, or below, one of the changed paths"""
+        dirty = set()
+        for name in DETECTORS:
+            for input_path in self.detector_inputs(name):
+                if any(input_path == path or input_path.startswith(path.rstrip(os.sep) + os.sep)
+                       for path in changed_paths):
+                    dirty.add(name)
+                    break
+        return dirty
+
+    def _load_properties(self):
+        # Rebuilt on every run so that changed property files are picked up (unchanged ones come
+        # from the cache), before the detectors reading it start in parallel
+        self._properties = PropertyIndex.from_dump(self.dump_folder, self.cache)
+        return len(self._properties)
+
     def _detect_device_model(self):
-        build_prop_path = os.path.join(self.dump_folder, "system", "build.prop")
-        if os.path.exists(build_prop_path):
-            with open(build_prop_path, 'r') as f:
-                content = f.read()
-                model = self._extract_property(content, "ro.product.model")
-                manufacturer = self._extract_property(content, "ro.product.manufacturer")
-                return DeviceModel(model, manufacturer)
+        if self.properties.files:
+            model = self.properties.product_property("model")
+            manufacturer = self.properties.product_property("manufacturer")
+            return DeviceModel(model, manufacturer)
         return None
 
+    def _detect_model(self):
+        return (self.results.get("device_model") or {}).get("model")
+
+    def _detect_manufacturer(self):
+        return (self.results.get("device_model") or {}).get("manufacturer")
+
     def _detect_touchwiz_version(self):
-        # This is a placeholder. In a real implementation, you'd need to analyze
-        # specific files or properties to determine the TouchWiz/OneUI version
+        oneui = self.properties.get("ro.build.version.oneui")
+        if oneui and oneui.isdigit():
+            value = int(oneui)
+            return f"One UI {value // 10000}.{value // 100 % 100}"
+
+        sep = self.properties.get("ro.build.version.sep")
+        if sep and sep.isdigit() and int(sep) // 10000 >= FIRST_ONEUI_SEP_MAJOR:
+            value = int(sep)
+            return f"One UI {value // 10000 - FIRST_ONEUI_SEP_MAJOR + 1}.{value // 100 % 100}"
+
+        sdk = self.properties.get("ro.build.version.sdk")
+        if sdk and sdk.isdigit() and int(sdk) in TOUCHWIZ_BY_SDK:
+            return TOUCHWIZ_BY_SDK[int(sdk)]
         return "Unknown"
 
+    def _detect_security_patch(self):
+        return self.properties.get("ro.build.version.security_patch")
+
+    def _detect_bootloader(self):
+        return self.properties.get("ro.bootloader") or self.properties.get("ro.boot.bootloader")
+
+    def _detect_csc(self):
+        return self.properties.get("ro.csc.sales_code") or self.properties.get("ro.oem.key1")
+
+    def _detect_soc(self):
+        soc_model = self.properties.get("ro.soc.model")
+        if soc_model:
+            manufacturer = self.properties.get("ro.soc.manufacturer")
+            return f"{manufacturer} {soc_model}" if manufacturer else soc_model
+        return self.properties.get("ro.board.platform") or self.properties.get("ro.hardware")
+
     def _detect_kernel_version(self):
         kernel_path = os.path.join(self.dump_folder, "boot", "kernel")
-        if os.path.exists(kernel_path):
-            # In a real implementation, you'd need to analyze the kernel file
-            # to extract its version. This might involve running strings on the file
-            # and looking for version information.
-            return "Found (version detection not implemented)"
-        return "Not found"
-
-    def _extract_property(self, content, property_name):
-        for line in content.splitlines():
-            if line.startswith(property_name):
-                return line.split('=')[1].strip()
-        return None
+        self.kernel_info = None
+        if not os.path.exists(kernel_path):
+            return "Not found"
+        if self.cache is not None:
+            self.kernel_info = self.cache.cached(kernel_path, 'kernel_version', KERNEL_DETECTOR_VERSION,
+                                                 lambda: self._read_kernel_version(kernel_path))
+        else:
+            self.kernel_info = self._read_kernel_version(kernel_path)
+        return self.kernel_info["version"] or "Unknown"
+
+    def _read_kernel_version(self, kernel_path):
+        try:
+            return detect_kernel_version(kernel_path)
+        except OSError as e:
+            logging.error(f"Error reading kernel {kernel_path}: {str(e)}")
+            return {"version": None, "banner": None, "format": None, "compression": None,
+                    "decompressed_size": None}
+
+    def _detect_kernel_details(self):
+        if self.kernel_info is None:
+            return None
+        return {key: self.kernel_info.get(key) for key in ("banner", "format", "compression", "decompressed_size")}
+
+    def _extract_property(self, property_name):
+        return self.properties.get(property_name)
+
+def _device_model_dict(analyzer):
+    device_model = analyzer._detect_device_model()
+    return device_model.to_dict() if isinstance(device_model, DeviceModel) else device_model
+
+register_detector("build_props", methodcaller("_load_properties"), inputs=PROPERTY_FILES, public=False,
+                  tracks_property_imports=True)
+register_detector("device_model", _device_model_dict, depends=["build_props"])
+register_detector("model", methodcaller("_detect_model"), depends=["device_model"])
+register_detector("manufacturer", methodcaller("_detect_manufacturer"), depends=["device_model"])
+register_detector("touchwiz_version", methodcaller("_detect_touchwiz_version"), depends=["build_props"])
+register_detector("kernel_version", methodcaller("_detect_kernel_version"), inputs=[os.path.join("boot", "kernel")],
+                  timeout=120)
+register_detector("kernel_details", methodcaller("_detect_kernel_details"), depends=["kernel_version"])
+register_detector("security_patch", methodcaller("_detect_security_patch"), depends=["build_props"])
+register_detector("bootloader", methodcaller("_detect_bootloader"), depends=["build_props"])
+register_detector("csc", methodcaller("_detect_csc"), depends=["build_props"])
+register_detector("soc", methodcaller("_detect_soc"), depends=["build_props"])
 
+def invalidate_dump_analysis(dump_folder=None):
+    """Forget cached analysis results of a dump folder, or of every dump"""
+    return get_default_cache().invalidate(dump_folder)
@@ -0,0 +1,184 @@
+import os
+import sys
+import time
+import errno
+import select
+import struct
+import ctypes
+import ctypes.util
+import logging
+import threading
+from analysis_cache import file_fingerprint
+from detectors import DETECTORS
+
+# inotify(7) event masks
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_IGNORED = 0x00008000
+WATCH_MASK = (IN_CLOSE_WRITE | IN_ATTRIB | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE |
+              IN_DELETE_SELF)
+_EVENT_HEADER = struct.Struct("iIII")
+
+
+class _InotifyBackend:
+    """Watches a set of directories through inotify, loaded with ctypes"""
+
+    def __init__(self):
+        libc_name = ctypes.util.find_library("c")
+        self._libc = ctypes.CDLL(libc_name, use_errno=True)
+        self._fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self._watches = {}
+
+    def update(self, directories, files):
+        for directory in set(self._watches.values()) - set(directories):
+            wd = next(wd for wd, path in self._watches.items() if path == directory)
+            self._libc.inotify_rm_watch(self._fd, wd)
+            del self._watches[wd]
+        for directory in set(directories) - set(self._watches.values()):
+            wd = self._libc.inotify_add_watch(self._fd, os.fsencode(directory), WATCH_MASK)
+            if wd < 0:
+                logging.warning(f"Cannot watch {directory}: {os.strerror(ctypes.get_errno())}")
+                continue
+            self._watches[wd] = directory
+
+    def wait(self, timeout):
+        """Paths changed within the timeout"""
+        readable, _, _ = select.select([self._fd], [], [], timeout)
+        if not readable:
+            return set()
+        try:
+            data = os.read(self._fd, 64 * 1024)
+        except OSError as e:
+            if e.errno == errno.EAGAIN:
+                return set()
+            raise
+
+        changed = set()
+        offset = 0
+        while offset + _EVENT_HEADER.size <= len(data):
+            wd, mask, _, length = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b"\0")
+            offset += length
+            directory = self._watches.get(wd)
+            if mask & IN_IGNORED:
+                self._watches.pop(wd, None)
+            if directory is not None:
+                changed.add(os.path.join(directory, os.fsdecode(name)) if name else directory)
+        return changed
+
+    def close(self):
+        os.close(self._fd)
+
+
+class _PollingBackend:
+    """Compares the size and mtime of the watched files on every poll"""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self._fingerprints = {}
+
+    def update(self, directories, files):
+        # Files already watched keep their old fingerprint, so a change made meanwhile is still seen
+        self._fingerprints = {path: self._fingerprints[path] if path in self._fingerprints else file_fingerprint(path)
+                              for path in files}
+
+    def wait(self, timeout):
+        time.sleep(min(timeout, self.interval))
+        changed = set()
+        for path, fingerprint in self._fingerprints.items():
+            current = file_fingerprint(path)
+            if current != fingerprint:
+                self._fingerprints[path] = current
+                changed.add(path)
+        return changed
+
+    def close(self):
+        pass
+
+
+class DumpWatcher:
+    """Re-runs the detectors of a DumpAnalyzer whose input files changed, in a background thread.
+
+    callback(results, detectors) is called from that thread after the first full analysis and
+    after every incremental one.
+    """
+
+    def __init__(self, analyzer, callback, debounce=0.5, poll_interval=2.0):
+        self.analyzer = analyzer
+        self.callback = callback
+        self.debounce = debounce
+        self.poll_interval = poll_interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="dump-watcher", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=5):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _create_backend(self):
+        if sys.platform.startswith("linux"):
+            try:
+                return _InotifyBackend()
+            except (OSError, AttributeError) as e:
+                logging.warning(f"inotify unavailable, polling the dump instead: {str(e)}")
+        return _PollingBackend(self.poll_interval)
+
+    def _watched_paths(self):
+        """Input files, plus the nearest existing directory of each so that new files are noticed"""
+        files = set()
+        directories = {self.analyzer.dump_folder}
+        for name in DETECTORS:
+            for path in self.analyzer.detector_inputs(name):
+                files.add(path)
+                directory = os.path.dirname(path)
+                while not os.path.isdir(directory) and directory.startswith(self.analyzer.dump_folder):
+                    directory = os.path.dirname(directory)
+                if os.path.isdir(directory):
+                    directories.add(directory)
+        return sorted(directories), sorted(files)
+
+    def _notify(self, detectors):
+        try:
+            results = self.analyzer.refresh(detectors)
+            self.callback(results, sorted(self.analyzer.last_run))
+        except Exception as e:
+            logging.error(f"Dump re-analysis failed: {str(e)}")
+
+    def _run(self):
+        backend = self._create_backend()
+        try:
+            # Watch before the first analysis so that no change made during it is missed
+            backend.update(*self._watched_paths())
+            self._notify(set(DETECTORS))
+            backend.update(*self._watched_paths())
+
+            pending = set()
+            while not self._stop.is_set():
+                changed = backend.wait(self.debounce)
+                if changed:
+                    # Keep collecting until the dump has been quiet for one debounce period
+                    pending |= changed
+                    continue
+                if not pending:
+                    continue
+                dirty = self.analyzer.detectors_for_paths(pending)
+                pending.clear()
+                if dirty:
+                    logging.info(f"Dump inputs changed, re-running: {', '.join(sorted(dirty))}")
+                    self._notify(dirty)
+                backend.update(*self._watched_paths())
+        finally:
+            backend.close()
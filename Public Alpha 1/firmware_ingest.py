@@ -0,0 +1,237 @@
+import os
+import re
+import shutil
+import hashlib
+import logging
+import tarfile
+import tempfile
+from kernel_formats import COPY_BUFFER_SIZE, split_compression, open_decompressed
+from sparse_image import convert_stream
+
+PACKAGE_SUFFIXES = (".tar.md5", ".tar")
+# Odin packages (AP_, BL_, CP_, CSC_, HOME_CSC_) are a tar followed by the md5sum line of that tar
+PACKAGE_PREFIXES = ("AP", "BL", "CP", "CSC", "HOME_CSC")
+MD5_TRAILER = re.compile(rb"([0-9a-fA-F]{32})[ \t]+\*?([^\x00\r\n]*)\r?\n?\Z")
+# The trailer always fits in the end of the file held back from the running MD5
+MAX_TRAILER_SIZE = 4096
+
+# Artifact store kind of the images imported into the store
+ARTIFACT_MEMBERS = {"boot.img": "kernel", "recovery.img": "recovery"}
+# Images written, still sparse, into the dump folder where the analyzer reads them in place
+DUMP_MEMBERS = ["super.img", "system.img", "system_ext.img", "vendor.img", "product.img", "odm.img", "userdata.img",
+                "vbmeta.img"]
+# Devices without dynamic partitions ship 'system.img.ext4', written to the dump as 'system.img'
+FILESYSTEM_SUFFIXES = (".ext4",)
+# Image converted into a VM disk on the way through, for devices without dynamic partitions
+DISK_MEMBER = "system.img"
+
+
+class FirmwareIngestError(ValueError):
+    pass
+
+
+class _Md5Reader:
+    """File object computing the MD5 of what is read through it, minus a possible trailer.
+
+    The last MAX_TRAILER_SIZE bytes read are held back from the hash until finish() tells the
+    md5sum trailer apart from the tar before it.
+    """
+
+    def __init__(self, f, progress=None):
+        self._file = f
+        self._md5 = hashlib.md5()
+        self._tail = b""
+        self._progress = progress
+        self.position = 0
+
+    def read(self, size=-1):
+        data = self._file.read(size)
+        self.position += len(data)
+        if len(data) >= MAX_TRAILER_SIZE:
+            self._md5.update(self._tail)
+            self._md5.update(memoryview(data)[:-MAX_TRAILER_SIZE])
+            self._tail = data[-MAX_TRAILER_SIZE:]
+        else:
+            tail = self._tail + data
+            self._md5.update(tail[:-MAX_TRAILER_SIZE])
+            self._tail = tail[-MAX_TRAILER_SIZE:]
+        if self._progress is not None:
+            self._progress(self.position)
+        return data
+
+    def finish(self):
+        """Read to the end; returns (MD5 of the tar, MD5 of the trailer or None if there is none)"""
+        while self.read(COPY_BUFFER_SIZE):
+            pass
+        match = MD5_TRAILER.search(self._tail)
+        if match is None:
+            self._md5.update(self._tail)
+            return self._md5.hexdigest(), None
+        self._md5.update(self._tail[:match.start()])
+        return self._md5.hexdigest(), match.group(1).decode().lower()
+
+
+class _TeeReader:
+    """File object copying everything read through it to another file"""
+
+    def __init__(self, f, out):
+        self._file = f
+        self._out = out
+
+    def read(self, size=-1):
+        data = self._file.read(size)
+        self._out.write(data)
+        return data
+
+
+def member_image_name(name):
+    """Image name of a package member and its compression, 'system.img.ext4.lz4' -> ('system.img', 'lz4')"""
+    name, compression = split_compression(os.path.basename(name))
+    for suffix in FILESYSTEM_SUFFIXES:
+        if name.lower().endswith(".img" + suffix):
+            name = name[:-len(suffix)]
+            break
+    return name, compression
+
+
+def is_firmware_package(path):
+    return os.path.basename(path).lower().endswith(PACKAGE_SUFFIXES)
+
+
+def package_label(path):
+    """Firmware version of an Odin package name, 'AP_G973FXXU9FUCD_CL1234_...' -> 'G973FXXU9FUCD'
+
+    CSC packages carry their CSC code first ('CSC_OXM_G973FOXM9FUCD_...'), so the version is the
+    first part with a digit in it.
+    """
+    name = os.path.basename(path)
+    for suffix in PACKAGE_SUFFIXES:
+        if name.lower().endswith(suffix):
+            name = name[:-len(suffix)]
+            break
+    for prefix in sorted(PACKAGE_PREFIXES, key=len, reverse=True):
+        if name.upper().startswith(prefix + "_"):
+            parts = name[len(prefix) + 1:].split("_")
+            return next((part for part in parts if any(c.isdigit() for c in part)), parts[0]) or name
+    return name
+
+
+def ingest_firmware(package_path, dump_folder=None, store=None, disk_path=None, cluster_size=None, verify=True,
+                    progress=None):
+    """Import an Odin firmware package in a single sequential read.
+
+    The trailing MD5 is computed while the tar streams by and lz4 members are decompressed on the
+    fly. boot.img and recovery.img go to the artifact store, partition images (super.img,
+    system.img, vbmeta.img, ...) to the dump folder, and system.img also into a qcow2 disk at
+    disk_path. Destinations that are not given are skipped. Nothing is kept unless the MD5
+    matches. progress(percent, message) is called as the package is read and may raise to stop.
+    Returns a summary of what went where.
+    """
+    total = os.path.getsize(package_path)
+    label = package_label(package_path)
+    if store is not None:
+        os.makedirs(store.root, exist_ok=True)
+    if dump_folder is not None:
+        os.makedirs(dump_folder, exist_ok=True)
+    # Staged next to the store so that adding them can hardlink instead of copying
+    staging_dir = tempfile.mkdtemp(prefix=".ingest-", dir=store.root) if store is not None else None
+    staged = []
+    current = {"member": None, "percent": None}
+
+    def report(position):
+        percent = position * 100 // total if total else 100
+        if progress is not None and percent != current["percent"]:
+            current["percent"] = percent
+            progress(percent, current["member"] or os.path.basename(package_path))
+
+    result = {"package": package_path, "md5": None, "verified": False, "artifacts": {}, "dump": [], "disk": None,
+              "skipped": []}
+    try:
+        with open(package_path, "rb") as f:
+            reader = _Md5Reader(f, report)
+            try:
+                with tarfile.open(fileobj=reader, mode="r|", bufsize=COPY_BUFFER_SIZE) as tar:
+                    for member in tar:
+                        if not member.isfile():
+                            continue
+                        name, compression = member_image_name(member.name)
+                        targets = _targets(name, dump_folder, store, disk_path)
+                        if not targets:
+                            result["skipped"].append(member.name)
+                            continue
+                        current["member"] = member.name
+                        logging.info(f"Importing {member.name} from {package_path}")
+                        with open_decompressed(tar.extractfile(member), compression) as stream:
+                            _route(stream, name, targets, staged, label, staging_dir, dump_folder, disk_path,
+                                   cluster_size, verify, None if compression else member.size)
+                        current["member"] = None
+            except tarfile.TarError as e:
+                raise FirmwareIngestError(f"{package_path} is not a valid firmware package: {str(e)}")
+            md5, expected = reader.finish()
+
+        result["md5"] = md5
+        result["verified"] = md5 == expected
+        if verify and expected is not None and md5 != expected:
+            raise FirmwareIngestError(f"MD5 mismatch for {package_path}: {md5} != {expected}")
+        if verify and expected is None and package_path.lower().endswith(".md5"):
+            raise FirmwareIngestError(f"{package_path} has no MD5 trailer")
+
+        for kind, part_path, final_path in staged:
+            if kind in ARTIFACT_MEMBERS.values():
+                digest = store.add(part_path, kind)
+                result["artifacts"][os.path.basename(final_path)] = digest
+            else:
+                os.replace(part_path, final_path)
+                if kind == "disk":
+                    result["disk"] = final_path
+                else:
+                    result["dump"].append(final_path)
+        staged = []
+    finally:
+        for _, part_path, _ in staged:
+            if os.path.exists(part_path):
+                os.remove(part_path)
+        if staging_dir is not None:
+            shutil.rmtree(staging_dir, ignore_errors=True)
+    logging.info(f"Imported {package_path}: {len(result['artifacts'])} artifacts, {len(result['dump'])} "
+                 f"partition images{', disk ' + result['disk'] if result['disk'] else ''}")
+    return result
+
+
+def _targets(name, dump_folder, store, disk_path):
+    targets = []
+    if name in ARTIFACT_MEMBERS and store is not None:
+        targets.append(ARTIFACT_MEMBERS[name])
+    if name in DUMP_MEMBERS and dump_folder is not None:
+        targets.append("dump")
+    if name == DISK_MEMBER and disk_path is not None:
+        targets.append("disk")
+    return targets
+
+
+def _route(stream, name, targets, staged, label, staging_dir, dump_folder, disk_path, cluster_size, verify,
+           size):
+    """Copy one decompressed member to its staging files, adding (kind, staged path, final path) to staged"""
+    out = None
+    if "dump" in targets:
+        final_path = os.path.join(dump_folder, name)
+        staged.append(("dump", final_path + ".part", final_path))
+        out = open(final_path + ".part", "wb")
+    elif targets[0] in ARTIFACT_MEMBERS.values():
+        staged.append((targets[0], os.path.join(staging_dir, f"{label}_{name}"), f"{label}_{name}"))
+        out = open(staged[-1][1], "wb")
+    try:
+        if "disk" in targets:
+            # The disk is converted from the same read, copying the image to the dump on the way
+            source = _TeeReader(stream, out) if out is not None else stream
+            staged.append(("disk", disk_path + ".part", disk_path))
+            convert_stream(source, disk_path + ".part", "qcow2", size=size, cluster_size=cluster_size, verify=verify,
+                           name=name)
+            # Whatever follows the image still belongs in the copy
+            while out is not None and source.read(COPY_BUFFER_SIZE):
+                pass
+        else:
+            shutil.copyfileobj(stream, out, COPY_BUFFER_SIZE)
+    finally:
+        if out is not None:
+            out.close()
@@ -0,0 +1,722 @@
+import io
+import os
+import mmap
+import errno
+import stat
+import bisect
+import struct
+import logging
+
+SUPERBLOCK_OFFSET = 1024
+EXT4_MAGIC = 0xEF53
+EROFS_MAGIC = 0xE0F5E1E2
+SPARSE_MAGIC = 0xED26FF3A
+# LP metadata geometry of a dynamic-partition super image, after its reserved first 4K
+LP_METADATA_GEOMETRY_MAGIC = 0x616C4467
+LP_PARTITION_RESERVED_BYTES = 4096
+MAX_SYMLINK_DEPTH = 40
+# Partitions whose <name>.img, or logical partition in super.img, in a dump folder is read in place
+PARTITION_IMAGES = ["system", "system_ext", "vendor", "odm", "product"]
+
+EXT4_ROOT_INODE = 2
+EXT4_EXTENT_MAGIC = 0xF30A
+EXT4_EXTENTS_FL = 0x80000
+EXT4_INLINE_DATA_FL = 0x10000000
+EXT4_INCOMPAT_FILETYPE = 0x2
+EXT4_INCOMPAT_META_BG = 0x10
+EXT4_INCOMPAT_64BIT = 0x80
+EXT4_INCOMPAT_ENCRYPT = 0x10000
+# Length of an extent above which it is an unwritten (preallocated) one
+EXT4_INIT_MAX_LEN = 32768
+EXT4_XATTR_MAGIC = 0xEA020000
+EXT4_XATTR_INDEX_SYSTEM = 7
+
+EROFS_LAYOUT_FLAT_PLAIN = 0
+EROFS_LAYOUT_FLAT_INLINE = 2
+EROFS_LAYOUT_CHUNK_BASED = 4
+EROFS_COMPRESSED_LAYOUTS = {1: "compressed (full indexes)", 3: "compressed (compact indexes)"}
+EROFS_CHUNK_FORMAT_BLKBITS_MASK = 0x1F
+EROFS_CHUNK_FORMAT_INDEXES = 0x20
+EROFS_NULL_ADDR = 0xFFFFFFFF
+EROFS_INCOMPAT_DEVICE_TABLE = 0x8
+EROFS_DIRENT = struct.Struct("<QHBB")
+
+# On-disk inode layouts from the kernel's fs/erofs/erofs_fs.h
+_EROFS_COMPACT_INODE = struct.Struct("<HHHHIIII")
+_EROFS_EXTENDED_INODE = struct.Struct("<HHHHQII")
+
+
+class FilesystemImageError(ValueError):
+    pass
+
+
+class MmapSource:
+    """Read-only byte source over a memory-mapped file"""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "rb")
+        try:
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self._file.close()
+            raise FilesystemImageError(f"Empty image: {path}")
+        self.size = len(self._mmap)
+
+    def read_at(self, offset, length):
+        return self._mmap[offset:offset + length]
+
+    def data_ranges(self):
+        """(offset, length) ranges of the file that may hold data, leaving out the holes of a sparse file"""
+        if not hasattr(os, "SEEK_DATA"):
+            return [(0, self.size)]
+        ranges, offset = [], 0
+        fd = self._file.fileno()
+        try:
+            while offset < self.size:
+                start = os.lseek(fd, offset, os.SEEK_DATA)
+                offset = min(os.lseek(fd, start, os.SEEK_HOLE), self.size)
+                ranges.append((start, offset - start))
+        except OSError as e:
+            # ENXIO: no data past offset; anything else means the filesystem cannot tell
+            if e.errno != errno.ENXIO:
+                return [(0, self.size)]
+        return ranges
+
+    def close(self):
+        self._mmap.close()
+        self._file.close()
+
+
+class ExtentFile(io.RawIOBase):
+    """Read-only file whose content is a list of (file offset, source offset, length) extents of a source.
+
+    Ranges no extent covers, and extents with a source offset of None, read as zeros. An extent
+    whose source offset is a bytes pattern reads as that pattern repeated.
+    """
+
+    def __init__(self, source, extents, size, owns_source=False):
+        super().__init__()
+        self.source = source
+        self.path = getattr(source, "path", None)
+        self._owns_source = owns_source
+        self.extents = sorted(extents)
+        self.size = size
+        self._starts = [extent[0] for extent in self.extents]
+        self._position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            offset += self.size
+        if offset < 0:
+            raise ValueError("Negative seek position")
+        self._position = offset
+        return offset
+
+    def read_at(self, offset, length):
+        """Read without moving the file position"""
+        end = min(offset + length, self.size)
+        chunks = []
+        position = offset
+        index = max(0, bisect.bisect_right(self._starts, offset) - 1)
+        while position < end:
+            while index < len(self.extents) and self.extents[index][0] + self.extents[index][2] <= position:
+                index += 1
+            if index < len(self.extents) and self.extents[index][0] <= position:
+                start, source_offset, extent_length = self.extents[index]
+                count = min(end, start + extent_length) - position
+                if source_offset is None:
+                    chunks.append(bytes(count))
+                elif isinstance(source_offset, bytes):
+                    skip = (position - start) % len(source_offset)
+                    repeats = (skip + count) // len(source_offset) + 1
+                    chunks.append((source_offset * repeats)[skip:skip + count])
+                else:
+                    chunks.append(self.source.read_at(source_offset + position - start, count))
+            else:
+                count = min(end, self.extents[index][0] if index < len(self.extents) else end) - position
+                chunks.append(bytes(count))
+            position += count
+        return b"".join(chunks)
+
+    def data_ranges(self):
+        """(offset, length) ranges that may hold non-zero data: the mapped extents minus the holes of the source"""
+        source_ranges = self.source.data_ranges() if hasattr(self.source, "data_ranges") else None
+        source_starts = [start for start, _ in source_ranges or []]
+        ranges = []
+        for start, source_offset, length in self.extents:
+            length = min(length, self.size - start)
+            if source_offset is None or length <= 0:
+                continue
+            if isinstance(source_offset, bytes) or source_ranges is None:
+                ranges.append((start, length))
+                continue
+            end = source_offset + length
+            index = max(0, bisect.bisect_right(source_starts, source_offset) - 1)
+            while index < len(source_ranges) and source_ranges[index][0] < end:
+                data_start, data_length = source_ranges[index]
+                low, high = max(data_start, source_offset), min(data_start + data_length, end)
+                if low < high:
+                    ranges.append((start + low - source_offset, high - low))
+                index += 1
+        return ranges
+
+    def readinto(self, buffer):
+        data = self.read_at(self._position, len(buffer))
+        buffer[:len(data)] = data
+        self._position += len(data)
+        return len(data)
+
+    def readall(self):
+        data = self.read_at(self._position, self.size - self._position)
+        self._position += len(data)
+        return data
+
+    def close(self):
+        if not self.closed and self._owns_source:
+            self.source.close()
+        super().close()
+
+
+class Inode:
+    """File metadata shared by the filesystem readers, with the raw on-disk fields kept in raw"""
+
+    def __init__(self, number, mode, size, raw):
+        self.number = number
+        self.mode = mode
+        self.size = size
+        self.raw = raw
+
+    def is_dir(self):
+        return stat.S_ISDIR(self.mode)
+
+    def is_file(self):
+        return stat.S_ISREG(self.mode)
+
+    def is_symlink(self):
+        return stat.S_ISLNK(self.mode)
+
+
+class FilesystemImage:
+    """Read-only access to the files of a filesystem image, reading only the blocks a file occupies.
+
+    The source is a path (memory-mapped) or any object with read_at(offset, length) and size,
+    such as an ExtentFile of a partition inside a larger image.
+    """
+
+    kind = None
+
+    def __init__(self, source, owns_source=False):
+        if isinstance(source, (str, os.PathLike)):
+            self._source = MmapSource(os.fspath(source))
+            self._owns_source = True
+        else:
+            self._source = source
+            self._owns_source = owns_source
+        self.path = getattr(self._source, "path", None)
+        # Name of the logical partition when the image lives inside a super image
+        self.partition = getattr(self._source, "partition", None)
+        self._directories = {}
+        try:
+            self._parse()
+        except (struct.error, FilesystemImageError):
+            self.close()
+            raise
+
+    def _read(self, offset, length):
+        data = self._source.read_at(offset, length)
+        if len(data) < length:
+            raise FilesystemImageError(f"{self.kind} image is truncated at offset {offset}")
+        return data
+
+    # Filesystem specific parts
+    def _parse(self):
+        raise NotImplementedError
+
+    def _root(self):
+        raise NotImplementedError
+
+    def _inode(self, number):
+        raise NotImplementedError
+
+    def _open_inode(self, inode):
+        raise NotImplementedError
+
+    def _entries(self, inode):
+        """(name, inode number) pairs of a directory, without '.' and '..'"""
+        raise NotImplementedError
+
+    def _readlink(self, inode):
+        return self._open_inode(inode).read().decode("utf-8", errors="surrogateescape")
+
+    def _directory(self, inode):
+        entries = self._directories.get(inode.number)
+        if entries is None:
+            entries = dict(self._entries(inode))
+            self._directories[inode.number] = entries
+        return entries
+
+    def resolve(self, path, follow_symlinks=True):
+        """Inode of an absolute path inside the image, following symlinks within the image"""
+        parts = [part for part in path.split("/") if part and part != "."]
+        inode, parents, links = self._root(), [], 0
+        while parts:
+            name = parts.pop(0)
+            if name == "..":
+                inode = parents.pop() if parents else self._root()
+                continue
+            if not inode.is_dir():
+                raise NotADirectoryError(f"Not a directory in {self.path}: {path}")
+            number = self._directory(inode).get(name)
+            if number is None:
+                raise FileNotFoundError(f"No such file in {self.path}: {path}")
+            child = self._inode(number)
+            if child.is_symlink() and (parts or follow_symlinks):
+                links += 1
+                if links > MAX_SYMLINK_DEPTH:
+                    raise OSError(f"Too many levels of symbolic links in {self.path}: {path}")
+                target = self._readlink(child)
+                if target.startswith("/"):
+                    inode, parents = self._root(), []
+                parts = [part for part in target.split("/") if part and part != "."] + parts
+                continue
+            parents.append(inode)
+            inode = child
+        return inode
+
+    def exists(self, path):
+        try:
+            self.resolve(path)
+            return True
+        except (OSError, FilesystemImageError):
+            return False
+
+    def isfile(self, path):
+        try:
+            return self.resolve(path).is_file()
+        except (OSError, FilesystemImageError):
+            return False
+
+    def isdir(self, path):
+        try:
+            return self.resolve(path).is_dir()
+        except (OSError, FilesystemImageError):
+            return False
+
+    def listdir(self, path="/"):
+        inode = self.resolve(path)
+        if not inode.is_dir():
+            raise NotADirectoryError(f"Not a directory in {self.path}: {path}")
+        return sorted(self._directory(inode))
+
+    def stat(self, path, follow_symlinks=True):
+        inode = self.resolve(path, follow_symlinks)
+        return {"inode": inode.number, "mode": inode.mode, "size": inode.size}
+
+    def readlink(self, path):
+        inode = self.resolve(path, follow_symlinks=False)
+        if not inode.is_symlink():
+            raise OSError(f"Not a symbolic link in {self.path}: {path}")
+        return self._readlink(inode)
+
+    def open(self, path):
+        """Binary file object reading the file's blocks straight from the image"""
+        inode = self.resolve(path)
+        if inode.is_dir():
+            raise IsADirectoryError(f"Is a directory in {self.path}: {path}")
+        return self._open_inode(inode)
+
+    def read_bytes(self, path):
+        with self.open(path) as f:
+            return f.read()
+
+    def read_text(self, path, encoding="utf-8", errors="replace"):
+        return self.read_bytes(path).decode(encoding, errors)
+
+    def close(self):
+        if self._owns_source:
+            self._source.close()
+        self._directories = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class Ext4Image(FilesystemImage):
+    """ext2/3/4 image: extent trees, block maps, inline data and linear or hashed directories"""
+
+    kind = "ext4"
+
+    def _parse(self):
+        superblock = self._read(SUPERBLOCK_OFFSET, 1024)
+        if struct.unpack_from("<H", superblock, 56)[0] != EXT4_MAGIC:
+            raise FilesystemImageError(f"Not an ext4 image: {self.path}")
+        self.inodes_count = struct.unpack_from("<I", superblock, 0)[0]
+        first_data_block, log_block_size = struct.unpack_from("<II", superblock, 20)
+        self.block_size = 1024 << log_block_size
+        self.inodes_per_group = struct.unpack_from("<I", superblock, 40)[0]
+        revision = struct.unpack_from("<I", superblock, 76)[0]
+        self.inode_size = struct.unpack_from("<H", superblock, 88)[0] if revision else 128
+        self.incompat = struct.unpack_from("<I", superblock, 96)[0]
+        if self.incompat & EXT4_INCOMPAT_META_BG:
+            raise FilesystemImageError(f"ext4 images with meta_bg are not supported: {self.path}")
+        if self.incompat & EXT4_INCOMPAT_ENCRYPT:
+            logging.warning(f"{self.path} uses ext4 encryption, encrypted names and files cannot be read")
+        self.volume_name = superblock[120:136].split(b"\x00", 1)[0].decode("utf-8", errors="replace")
+
+        is_64bit = self.incompat & EXT4_INCOMPAT_64BIT
+        self.descriptor_size = struct.unpack_from("<H", superblock, 254)[0] if is_64bit else 32
+        groups = (self.inodes_count + self.inodes_per_group - 1) // self.inodes_per_group
+        table = self._read((first_data_block + 1) * self.block_size, groups * self.descriptor_size)
+        self._inode_tables = []
+        for group in range(groups):
+            offset = group * self.descriptor_size
+            location = struct.unpack_from("<I", table, offset + 8)[0]
+            if is_64bit and self.descriptor_size >= 64:
+                location |= struct.unpack_from("<I", table, offset + 0x28)[0] << 32
+            self._inode_tables.append(location)
+
+    def _root(self):
+        return self._inode(EXT4_ROOT_INODE)
+
+    def _inode(self, number):
+        if not 0 < number <= self.inodes_count:
+            raise FilesystemImageError(f"Invalid inode number {number} in {self.path}")
+        group, index = divmod(number - 1, self.inodes_per_group)
+        raw = self._read(self._inode_tables[group] * self.block_size + index * self.inode_size, self.inode_size)
+        mode, _, size = struct.unpack_from("<HHI", raw, 0)
+        size |= struct.unpack_from("<I", raw, 0x6C)[0] << 32
+        return Inode(number, mode, size, raw)
+
+    def _flags(self, inode):
+        return struct.unpack_from("<I", inode.raw, 0x20)[0]
+
+    def _open_inode(self, inode):
+        flags = self._flags(inode)
+        if flags & EXT4_INLINE_DATA_FL:
+            return io.BytesIO(self._inline_data(inode)[:inode.size])
+        if flags & EXT4_EXTENTS_FL:
+            runs = []
+            self._extent_runs(inode.raw[0x28:0x64], runs)
+        elif inode.is_symlink() and inode.size < 60:
+            # Fast symlink, the target is stored in the block pointers
+            return io.BytesIO(inode.raw[0x28:0x28 + inode.size])
+        else:
+            runs = self._block_map_runs(inode.raw[0x28:0x64], -(-inode.size // self.block_size))
+        block_size = self.block_size
+        extents = [(block * block_size, None if physical is None else physical * block_size, count * block_size)
+                   for block, physical, count in runs]
+        return ExtentFile(self._source, extents, inode.size)
+
+    def _extent_runs(self, node, runs):
+        magic, entries, _, depth = struct.unpack_from("<4H", node, 0)
+        if magic != EXT4_EXTENT_MAGIC:
+            raise FilesystemImageError(f"Corrupt extent tree in {self.path}")
+        for entry in range(entries):
+            offset = 12 + 12 * entry
+            if depth == 0:
+                block, length, start_high, start_low = struct.unpack_from("<IHHI", node, offset)
+                if length > EXT4_INIT_MAX_LEN:
+                    # Unwritten extents read as zeros
+                    runs.append((block, None, length - EXT4_INIT_MAX_LEN))
+                else:
+                    runs.append((block, (start_high << 32) | start_low, length))
+            else:
+                _, leaf_low, leaf_high = struct.unpack_from("<IIH", node, offset)
+                self._extent_runs(self._read(((leaf_high << 32) | leaf_low) * self.block_size, self.block_size),
+                                  runs)
+
+    def _block_map_runs(self, block_pointers, block_count):
+        """Runs of (logical block, physical block, count) from the direct and (double/triple) indirect pointers"""
+        pointers = struct.unpack("<15I", block_pointers)
+        blocks = list(pointers[:12])
+        per_block = self.block_size // 4
+        for level, pointer in enumerate(pointers[12:], 1):
+            if len(blocks) >= block_count:
+                break
+            self._collect_indirect(pointer, level, per_block, blocks, block_count)
+
+        runs = []
+        for logical, physical in enumerate(blocks[:block_count]):
+            if physical == 0:
+                continue
+            if runs and runs[-1][0] + runs[-1][2] == logical and runs[-1][1] + runs[-1][2] == physical:
+                runs[-1] = (runs[-1][0], runs[-1][1], runs[-1][2] + 1)
+            else:
+                runs.append((logical, physical, 1))
+        return runs
+
+    def _collect_indirect(self, pointer, level, per_block, blocks, block_count):
+        if pointer == 0:
+            blocks.extend([0] * min(per_block ** level, block_count - len(blocks)))
+            return
+        children = struct.unpack(f"<{per_block}I", self._read(pointer * self.block_size, self.block_size))
+        for child in children:
+            if len(blocks) >= block_count:
+                return
+            if level == 1:
+                blocks.append(child)
+            else:
+                self._collect_indirect(child, level - 1, per_block, blocks, block_count)
+
+    def _inline_data(self, inode):
+        """Inline data: the 60 bytes of block pointers followed by the system.data extended attribute"""
+        data = bytes(inode.raw[0x28:0x64])
+        if self.inode_size <= 128:
+            return data
+        extra_size = struct.unpack_from("<H", inode.raw, 0x80)[0]
+        start = 0x80 + extra_size
+        if start + 4 > self.inode_size or struct.unpack_from("<I", inode.raw, start)[0] != EXT4_XATTR_MAGIC:
+            return data
+        entries = start + 4
+        offset = entries
+        while offset + 16 <= self.inode_size and struct.unpack_from("<I", inode.raw, offset)[0]:
+            name_length, name_index, value_offset, _, value_size = struct.unpack_from("<BBHII", inode.raw, offset)
+            name = bytes(inode.raw[offset + 16:offset + 16 + name_length])
+            if name_index == EXT4_XATTR_INDEX_SYSTEM and name == b"data":
+                return data + bytes(inode.raw[entries + value_offset:entries + value_offset + value_size])
+            offset += (16 + name_length + 3) & ~3
+        return data
+
+    def _entries(self, inode):
+        if self._flags(inode) & EXT4_INLINE_DATA_FL:
+            # Inline directories start with the parent's inode number instead of '.' and '..'
+            data = self._inline_data(inode)[4:inode.size]
+        else:
+            data = self._open_inode(inode).read()
+        has_file_type = self.incompat & EXT4_INCOMPAT_FILETYPE
+        offset = 0
+        while offset + 8 <= len(data):
+            number, record_length = struct.unpack_from("<IH", data, offset)
+            name_length = data[offset + 6] if has_file_type else struct.unpack_from("<H", data, offset + 6)[0]
+            if record_length < 8:
+                # Damaged entry, carry on with the next block
+                offset = (offset // self.block_size + 1) * self.block_size
+                continue
+            name = data[offset + 8:offset + 8 + name_length]
+            if number and name not in (b".", b".."):
+                yield name.decode("utf-8", errors="surrogateescape"), number
+            offset += record_length
+
+
+class ErofsImage(FilesystemImage):
+    """EROFS image with uncompressed (plain, inline-tail and chunk-based) files.
+
+    Directories are never compressed, so a compressed image can be listed, but reading a
+    compressed file raises FilesystemImageError.
+    """
+
+    kind = "erofs"
+
+    def _parse(self):
+        superblock = self._read(SUPERBLOCK_OFFSET, 128)
+        if struct.unpack_from("<I", superblock, 0)[0] != EROFS_MAGIC:
+            raise FilesystemImageError(f"Not an EROFS image: {self.path}")
+        self.block_size = 1 << superblock[12]
+        self.root_nid = struct.unpack_from("<H", superblock, 14)[0]
+        self.blocks_count, self.meta_blkaddr = struct.unpack_from("<II", superblock, 36)
+        self.volume_name = superblock[64:80].split(b"\x00", 1)[0].decode("utf-8", errors="replace")
+        self.incompat = struct.unpack_from("<I", superblock, 80)[0]
+        if self.incompat & EROFS_INCOMPAT_DEVICE_TABLE:
+            raise FilesystemImageError(f"Multi-device EROFS images are not supported: {self.path}")
+
+    def _root(self):
+        return self._inode(self.root_nid)
+
+    def _inode(self, nid):
+        offset = self.meta_blkaddr * self.block_size + nid * 32
+        raw = self._read(offset, 32)
+        fmt = struct.unpack_from("<H", raw, 0)[0]
+        if fmt & 1:
+            raw = self._read(offset, 64)
+            _, xattr_count, mode, _, size, data, _ = _EROFS_EXTENDED_INODE.unpack_from(raw, 0)
+            inode_size = 64
+        else:
+            _, xattr_count, mode, _, size, _, data, _ = _EROFS_COMPACT_INODE.unpack_from(raw, 0)
+            inode_size = 32
+        xattr_size = 12 + (xattr_count - 1) * 4 if xattr_count else 0
+        layout = (fmt >> 1) & 0x7
+        # Inline data and chunk indexes follow the inode and its extended attributes
+        return Inode(nid, mode, size, (layout, data, offset + inode_size + xattr_size))
+
+    def _open_inode(self, inode):
+        layout, data, tail_offset = inode.raw
+        block_size, size = self.block_size, inode.size
+        if layout == EROFS_LAYOUT_FLAT_PLAIN:
+            extents = [(0, data * block_size, size)] if size else []
+        elif layout == EROFS_LAYOUT_FLAT_INLINE:
+            full = size // block_size * block_size
+            extents = [(0, data * block_size, full)] if full else []
+            if size > full:
+                extents.append((full, tail_offset, size - full))
+        elif layout == EROFS_LAYOUT_CHUNK_BASED:
+            extents = self._chunk_extents(inode, data, tail_offset)
+        elif layout in EROFS_COMPRESSED_LAYOUTS:
+            raise FilesystemImageError(f"Cannot read {EROFS_COMPRESSED_LAYOUTS[layout]} EROFS file "
+                                       f"(inode {inode.number}) in {self.path}")
+        else:
+            raise FilesystemImageError(f"Unknown EROFS data layout {layout} in {self.path}")
+        return ExtentFile(self._source, extents, size)
+
+    def _chunk_extents(self, inode, chunk_format, index_offset):
+        chunk_size = self.block_size << (chunk_format & EROFS_CHUNK_FORMAT_BLKBITS_MASK)
+        chunks = -(-inode.size // chunk_size)
+        if chunk_format & EROFS_CHUNK_FORMAT_INDEXES:
+            index_offset = (index_offset + 7) & ~7
+            raw = self._read(index_offset, chunks * 8)
+            addresses = [struct.unpack_from("<HHI", raw, 8 * chunk)[2] for chunk in range(chunks)]
+        else:
+            addresses = struct.unpack(f"<{chunks}I", self._read(index_offset, chunks * 4))
+        return [(chunk * chunk_size, address * self.block_size, min(chunk_size, inode.size - chunk * chunk_size))
+                for chunk, address in enumerate(addresses) if address != EROFS_NULL_ADDR]
+
+    def _entries(self, inode):
+        data = self._open_inode(inode).read()
+        for block_start in range(0, len(data), self.block_size):
+            block = data[block_start:block_start + self.block_size]
+            count = struct.unpack_from("<H", block, 8)[0] // EROFS_DIRENT.size
+            dirents = [EROFS_DIRENT.unpack_from(block, EROFS_DIRENT.size * index) for index in range(count)]
+            for index, (nid, name_offset, _, _) in enumerate(dirents):
+                name_end = dirents[index + 1][1] if index + 1 < count else len(block)
+                name = block[name_offset:name_end].split(b"\x00", 1)[0]
+                if name not in (b".", b".."):
+                    yield name.decode("utf-8", errors="surrogateescape"), nid
+
+
+FILESYSTEM_TYPES = [Ext4Image, ErofsImage]
+
+
+def detect_filesystem(source):
+    """'ext4', 'erofs', 'sparse' or 'super' from the image's magic numbers, None if unknown"""
+    if isinstance(source, (str, os.PathLike)):
+        try:
+            with open(source, "rb") as f:
+                header = f.read(LP_PARTITION_RESERVED_BYTES + 4)
+        except OSError:
+            return None
+    else:
+        header = source.read_at(0, LP_PARTITION_RESERVED_BYTES + 4)
+    if len(header) >= 4 and struct.unpack_from("<I", header, 0)[0] == SPARSE_MAGIC:
+        return "sparse"
+    if len(header) < SUPERBLOCK_OFFSET + 64:
+        return None
+    if struct.unpack_from("<I", header, SUPERBLOCK_OFFSET)[0] == EROFS_MAGIC:
+        return "erofs"
+    if struct.unpack_from("<H", header, SUPERBLOCK_OFFSET + 56)[0] == EXT4_MAGIC:
+        return "ext4"
+    if len(header) == LP_PARTITION_RESERVED_BYTES + 4 and \
+            struct.unpack_from("<I", header, LP_PARTITION_RESERVED_BYTES)[0] == LP_METADATA_GEOMETRY_MAGIC:
+        return "super"
+    return None
+
+
+def open_filesystem_image(source, owns_source=False):
+    """Open an ext4 or EROFS image from a path or a read_at() source.
+
+    Android sparse images are read in place through a map of their chunks.
+    """
+    kind = detect_filesystem(source)
+    if kind == "sparse":
+        from sparse_image import open_sparse_image, SparseImageError
+        try:
+            source = open_sparse_image(source)
+        except SparseImageError as e:
+            raise FilesystemImageError(str(e))
+        owns_source = True
+        kind = detect_filesystem(source)
+    for image_type in FILESYSTEM_TYPES:
+        if image_type.kind == kind:
+            return image_type(source, owns_source)
+    if owns_source:
+        source.close()
+    raise FilesystemImageError(f"Not an ext4 or EROFS image: {source}")
+
+
+class PartitionImages:
+    """Partition images of a dump folder (system.img, vendor.img, ...) whose files are read in place.
+
+    A dump-relative path such as 'vendor/build.prop' maps onto /build.prop of vendor.img.
+    system.img may be a system-as-root image, where the same file lives under /system.
+    Partitions without their own image are looked up in the dump's super.img.
+    """
+
+    def __init__(self, dump_folder):
+        self.dump_folder = dump_folder
+        self._images = {}
+        self._super = False
+
+    def super_image(self):
+        """The dump's opened super.img, None if it has none"""
+        if self._super is False:
+            self._super = None
+            super_path = os.path.join(self.dump_folder, "super.img")
+            if os.path.isfile(super_path):
+                from super_image import SuperImage
+                try:
+                    self._super = SuperImage(super_path)
+                except (OSError, ValueError) as e:
+                    logging.warning(f"Cannot read super image {super_path}: {str(e)}")
+        return self._super
+
+    def image(self, partition):
+        """Opened image of a partition, None if the dump has no readable image of it"""
+        if partition not in self._images:
+            image_path = os.path.join(self.dump_folder, f"{partition}.img")
+            image = None
+            if partition in PARTITION_IMAGES and os.path.isfile(image_path):
+                try:
+                    image = open_filesystem_image(image_path)
+                except (OSError, FilesystemImageError) as e:
+                    logging.warning(f"Cannot read partition image {image_path}: {str(e)}")
+            elif partition in PARTITION_IMAGES and self.super_image() is not None and partition in self._super:
+                view = self._super.open(partition)
+                try:
+                    image = open_filesystem_image(view, owns_source=True)
+                except (OSError, FilesystemImageError) as e:
+                    view.close()
+                    logging.warning(f"Cannot read {partition} of {self._super.path}: {str(e)}")
+            self._images[partition] = image
+        return self._images[partition]
+
+    def locate(self, relative_path):
+        """(image, path inside the image) holding a dump-relative file, None if no image has it"""
+        relative_path = relative_path.replace(os.sep, "/").lstrip("/")
+        partition, _, inner_path = relative_path.partition("/")
+        if not inner_path:
+            return None
+        image = self.image(partition)
+        if image is None:
+            return None
+        for candidate in (f"/{inner_path}", f"/{relative_path}"):
+            if image.isfile(candidate):
+                return image, candidate
+        return None
+
+    def close(self):
+        for image in self._images.values():
+            if image is not None:
+                image.close()
+        self._images = {}
+        if self._super:
+            self._super.close()
+        self._super = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
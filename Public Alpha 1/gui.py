@@ -4,11 +4,10 @@ from PyQt6.QtWidgets import (QMainWindow, QTabWidget, QWidget, QVBoxLayout, QHBo
                              QLabel, QComboBox, QPushButton, QTextEdit, QFileDialog,
                              QLineEdit, QSpinBox, QCheckBox, QMessageBox, QGroupBox)
 from PyQt6.QtGui import QIntValidator
-from PyQt6.QtCore import Qt, QThread, pyqtSignal, QTimer
+from PyQt6.QtCore import Qt, QThread, pyqtSignal
 from qemu_controller import QEMUController
 from config import CONFIG, save_config
 from dump_analyzer import analyze_dump
-from ai_file_searcher import AIFileSearcher
 
 
 class EmulatorThread(QThread):
@@ -43,13 +42,18 @@ class EmulatorThread(QThread):
 
 
 class MainWindow(QMainWindow):
+    emulator_state_changed = pyqtSignal(str, str)
+
     def __init__(self):
         super().__init__()
         self.setWindowTitle("SamsEmung - Samsung Smartphone Emulator")
         self.setGeometry(100, 100, 1000, 800)
 
         self.qemu_controller = QEMUController(CONFIG)
-        self.ai_file_searcher = AIFileSearcher()
+        # QMP state changes arrive on the controller's event loop thread
+        self.qemu_controller.add_state_listener(self.emulator_state_changed.emit)
+        self.emulator_state_changed.connect(self.on_emulator_state_changed)
+        self._ai_file_searcher = None
 
         if 'boot_img_path' in CONFIG:
             self.qemu_controller.set_boot_img_path(CONFIG['boot_img_path'])
@@ -212,8 +216,6 @@ class MainWindow(QMainWindow):
             self.emulator_thread.command.connect(self.log_output.append)
             self.emulator_thread.ai_suggestion.connect(self.handle_ai_suggestion)
             self.emulator_thread.start()
-
-            QTimer.singleShot(10000, self.check_emulator_status)
         except FileNotFoundError as e:
             self.handle_error(str(e))
             reply = QMessageBox.question(self, 'Kernel Not Found',
@@ -236,8 +238,6 @@ class MainWindow(QMainWindow):
         self.emulator_thread.ai_suggestion.connect(self.handle_ai_suggestion)
         self.emulator_thread.start()
 
-        QTimer.singleShot(10000, self.check_emulator_status)
-
     def stop_emulator(self):
         self.emulator_thread = EmulatorThread(self.qemu_controller, 'stop')
         self.emulator_thread.success.connect(self.log_output.append)
@@ -325,16 +325,29 @@ class MainWindow(QMainWindow):
         self.kernel_in_dump_checkbox.setChecked(kernel_in_dump)
         self.kernel_in_dump_checkbox.setEnabled(True)
 
-    def check_emulator_status(self):
-        if self.qemu_controller.is_running():
+    def on_emulator_state_changed(self, vm_name, state):
+        if state == "running":
             self.log_output.append("Emulator started successfully.")
-        else:
+        elif state == "paused":
+            self.log_output.append("Emulator paused.")
+        elif state == "crashed":
             self.handle_error("Emulator failed to start or crashed. Please check the logs for more information.")
 
+    @property
+    def ai_file_searcher(self):
+        """The classifier based searcher, imported with numpy only when first needed"""
+        if self._ai_file_searcher is None:
+            from ai_file_searcher import AIFileSearcher
+            self._ai_file_searcher = AIFileSearcher(batch_size=CONFIG.get('ai_search_batch_size', 64),
+                                                    max_workers=CONFIG.get('ai_search_workers', 4))
+        return self._ai_file_searcher
+
     def thorough_kernel_search(self):
         model = self.model_combo.currentText()
         dump_folder = self.dump_folder_input.text()
         found_kernel = self.qemu_controller._thorough_kernel_search(dump_folder)
+        if not found_kernel and CONFIG.get('use_ai_search'):
+            found_kernel = self.ai_file_searcher.search_kernel_file(dump_folder)
         if found_kernel:
             self.log_output.append(f"Kernel file found: {found_kernel}")
             QMessageBox.information(self, 'Kernel Found', f"Kernel file found: {found_kernel}")
@@ -0,0 +1,225 @@
+import os
+import shutil
+import logging
+import tarfile
+import threading
+import subprocess
+
+try:
+    import lz4.frame as lz4_frame
+except ImportError:
+    lz4_frame = None
+
+# Enough bytes to see every magic below (the bzImage one sits at offset 0x202)
+HEADER_SIZE = 1024
+COPY_BUFFER_SIZE = 1024 * 1024
+
+# Base score of each file name a kernel usually ships under
+KERNEL_NAMES = {
+    "kernel": 50,
+    "image": 50,
+    "image.gz": 45,
+    "zimage": 45,
+    "bzimage": 45,
+    "boot.img": 40,
+}
+# Header formats a kernel (or an image carrying one) can have
+KERNEL_FORMATS = {"android-boot", "arm64-image", "zimage", "bzimage", "gzip", "lz4", "xz"}
+ARCHIVE_SUFFIXES = (".tar.md5", ".tar")
+COMPRESSED_SUFFIXES = {".lz4": "lz4"}
+
+
+def identify_header(header):
+    """Return the format name of a file from its first bytes, or None"""
+    if header.startswith(b"ANDROID!"):
+        return "android-boot"
+    if header.startswith(b"VNDRBOOT"):
+        return "vendor-boot"
+    if header[56:60] == b"ARMd":
+        return "arm64-image"
+    if header[0x24:0x28] == b"\x18\x28\x6f\x01":
+        return "zimage"
+    if header[0x202:0x206] == b"HdrS":
+        return "bzimage"
+    if header.startswith(b"\x1f\x8b"):
+        return "gzip"
+    if header.startswith(b"\x04\x22\x4d\x18") or header.startswith(b"\x02\x21\x4c\x18"):
+        return "lz4"
+    if header.startswith(b"\xfd7zXZ\x00"):
+        return "xz"
+    if header.startswith(b"PK\x03\x04"):
+        return "zip"
+    if header[257:262] == b"ustar":
+        return "tar"
+    return None
+
+
+def split_compression(name):
+    """Split 'boot.img.lz4' into ('boot.img', 'lz4')"""
+    for suffix, compression in COMPRESSED_SUFFIXES.items():
+        if name.lower().endswith(suffix):
+            return name[:-len(suffix)], compression
+    return name, None
+
+
+def is_archive(name):
+    return os.path.basename(name).lower().endswith(ARCHIVE_SUFFIXES)
+
+
+def name_score(name):
+    """Score a member by its file name alone, None if it cannot be a kernel"""
+    return KERNEL_NAMES.get(os.path.basename(name).lower())
+
+
+def kernel_score(name, header):
+    """Rank a candidate by name and header bytes, higher is better, None to reject"""
+    score = name_score(name)
+    if score is None:
+        return None
+    fmt = identify_header(header)
+    if fmt in KERNEL_FORMATS:
+        return score + 50
+    if fmt is not None:
+        # A kernel name on a zip, tar or vendor_boot image is not a kernel
+        return None
+    return score
+
+
+class _ProcessReader:
+    """File object over the stdout of a decompressor fed from another file object"""
+
+    def __init__(self, args, source):
+        self.process = subprocess.Popen(args, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                        stderr=subprocess.DEVNULL)
+        self._feeder = threading.Thread(target=self._feed, args=(source,), daemon=True)
+        self._feeder.start()
+
+    def _feed(self, source):
+        try:
+            shutil.copyfileobj(source, self.process.stdin, COPY_BUFFER_SIZE)
+        except (BrokenPipeError, ValueError):
+            pass
+        finally:
+            try:
+                self.process.stdin.close()
+            except OSError:
+                pass
+
+    def read(self, size=-1):
+        return self.process.stdout.read(size)
+
+    def close(self):
+        self.process.stdout.close()
+        if self.process.poll() is None:
+            self.process.kill()
+        self.process.wait()
+        self._feeder.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def open_decompressed(fileobj, compression):
+    """Wrap a readable file object so that reads return decompressed bytes"""
+    if compression is None:
+        return fileobj
+    if compression == "lz4":
+        if lz4_frame is not None:
+            return lz4_frame.LZ4FrameFile(fileobj, "rb")
+        if shutil.which("lz4"):
+            return _ProcessReader(["lz4", "-dc"], fileobj)
+        raise RuntimeError("lz4 support requires the 'lz4' Python package or the lz4 command")
+    raise ValueError(f"Unsupported compression: {compression}")
+
+
+class _KernelSink:
+    """Keeps the best candidate seen so far in a temporary file next to the destination"""
+
+    def __init__(self, dest_path):
+        self.dest_path = dest_path
+        self.part_path = dest_path + ".part"
+        self.score = None
+        self.source = None
+
+    def offer(self, label, score, header, stream):
+        """Copy a candidate out of its stream if it beats the current one"""
+        if score is None or (self.score is not None and score <= self.score):
+            return False
+        with open(self.part_path, "wb") as out:
+            out.write(header)
+            shutil.copyfileobj(stream, out, COPY_BUFFER_SIZE)
+        self.score = score
+        self.source = label
+        return True
+
+    def commit(self):
+        if self.source is None:
+            return None
+        os.replace(self.part_path, self.dest_path)
+        return self.source
+
+    def discard(self):
+        if os.path.exists(self.part_path):
+            os.remove(self.part_path)
+
+
+def _scan_tar(fileobj, label, sink):
+    """Stream through a (possibly compressed) tar, copying out only kernel candidates"""
+    with tarfile.open(fileobj=fileobj, mode="r|*") as tar:
+        for member in tar:
+            if not member.isfile():
+                continue
+            inner_name, compression = split_compression(member.name)
+            if name_score(inner_name) is None:
+                continue
+            member_label = f"{label}/{member.name}"
+            with open_decompressed(tar.extractfile(member), compression) as stream:
+                header = stream.read(HEADER_SIZE)
+                score = kernel_score(inner_name, header)
+                if sink.offer(member_label, score, header, stream):
+                    logging.info(f"Kernel candidate {member_label} (score {score})")
+
+
+def extract_kernel_from_zip(zip_ref, dest_path):
+    """Stream the best kernel candidate of an open ZipFile to dest_path.
+
+    Candidates are ranked from the central directory and their first bytes. Nested tar(.md5)
+    archives and lz4 members are only scanned when the zip has no direct candidate with a
+    recognised kernel header. Returns the chosen member path, or None if nothing matched.
+    """
+    candidates = []
+    archives = []
+    for info in zip_ref.infolist():
+        if info.is_dir():
+            continue
+        inner_name, compression = split_compression(info.filename)
+        if is_archive(inner_name):
+            archives.append((info, compression))
+            continue
+        if name_score(inner_name) is None:
+            continue
+        with open_decompressed(zip_ref.open(info), compression) as stream:
+            header = stream.read(HEADER_SIZE)
+        score = kernel_score(inner_name, header)
+        if score is not None:
+            candidates.append((score, info, compression))
+
+    sink = _KernelSink(dest_path)
+    try:
+        if candidates:
+            score, info, compression = max(candidates, key=lambda c: c[0])
+            with open_decompressed(zip_ref.open(info), compression) as stream:
+                header = stream.read(HEADER_SIZE)
+                sink.offer(info.filename, score, header, stream)
+
+        if sink.score is None or sink.score <= max(KERNEL_NAMES.values()):
+            for info, compression in archives:
+                with open_decompressed(zip_ref.open(info), compression) as stream:
+                    _scan_tar(stream, info.filename, sink)
+
+        return sink.commit()
+    finally:
+        sink.discard()
@@ -0,0 +1,340 @@
+import re
+import lzma
+import mmap
+import zlib
+import struct
+import logging
+from bootimg import BootImage, BootImageError
+from kernel_formats import HEADER_SIZE, identify_header, open_decompressed
+
+try:
+    import lz4.block as lz4_block
+except ImportError:
+    lz4_block = None
+
+BANNER = b"Linux version "
+MAX_BANNER_LENGTH = 512
+CHUNK_SIZE = 1024 * 1024
+
+GZIP_MAGIC = b"\x1f\x8b\x08"
+XZ_MAGIC = b"\xfd7zXZ\x00"
+LZ4_FRAME_MAGIC = b"\x04\x22\x4d\x18"
+LZ4_LEGACY_MAGIC = b"\x02\x21\x4c\x18"
+DTB_MAGIC = b"\xd0\x0d\xfe\xed"
+DTB_HEADER_SIZE = 40
+# The legacy format (lz4 -l, used for kernels) decompresses each block to at most 8 MiB
+LZ4_LEGACY_BLOCK_SIZE = 8 * 1024 * 1024
+# Payload magics searched for inside a self-decompressing ARM zImage
+ZIMAGE_PAYLOADS = [(GZIP_MAGIC, "gzip"), (XZ_MAGIC, "xz"), (LZ4_LEGACY_MAGIC, "lz4-legacy")]
+
+_VERSION = re.compile(r"Linux version (\S+)")
+
+
+class _MmapReader:
+    """Read-only file object over a byte range of an mmap"""
+
+    def __init__(self, mm, start, end):
+        self._mm = mm
+        self._pos = start
+        self._end = end
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = self._end - self._pos
+        data = self._mm[self._pos:min(self._pos + size, self._end)]
+        self._pos += len(data)
+        return data
+
+    def tell(self):
+        return self._pos
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _banner_end(buffer, pos):
+    """End of the banner starting at pos, None if more data is needed to tell"""
+    window = buffer[pos:pos + MAX_BANNER_LENGTH]
+    ends = [i for i in (window.find(b"\n"), window.find(b"\0")) if i >= 0]
+    if ends:
+        return pos + min(ends)
+    if len(window) >= MAX_BANNER_LENGTH:
+        return pos + MAX_BANNER_LENGTH
+    return None
+
+
+def find_banner(chunks):
+    """Return the first 'Linux version <digit>...' line in a stream of chunks, reading no further"""
+    buffer = b""
+    start = 0
+    for chunk in chunks:
+        buffer = buffer[start:] + chunk
+        start = 0
+        while True:
+            pos = buffer.find(BANNER, start)
+            if pos < 0:
+                # Keep enough of the tail to match a banner split across chunks
+                start = max(0, len(buffer) - len(BANNER) + 1)
+                break
+            after = pos + len(BANNER)
+            if after >= len(buffer):
+                start = pos
+                break
+            if not buffer[after:after + 1].isdigit():
+                start = after
+                continue
+            end = _banner_end(buffer, pos)
+            if end is None:
+                start = pos
+                break
+            return buffer[pos:end].decode("ascii", errors="replace").strip()
+
+    pos = buffer.find(BANNER, start)
+    if pos >= 0 and buffer[pos + len(BANNER):pos + len(BANNER) + 1].isdigit():
+        return buffer[pos:pos + MAX_BANNER_LENGTH].split(b"\n")[0].split(b"\0")[0].decode(
+            "ascii", errors="replace").strip()
+    return None
+
+
+def _raw_chunks(reader):
+    while True:
+        data = reader.read(CHUNK_SIZE)
+        if not data:
+            return
+        yield data
+
+
+def _gzip_chunks(reader):
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    for data in _raw_chunks(reader):
+        while data and not decompressor.eof:
+            yield decompressor.decompress(data, CHUNK_SIZE)
+            data = decompressor.unconsumed_tail
+        if decompressor.eof:
+            return
+
+
+def _xz_chunks(reader):
+    decompressor = lzma.LZMADecompressor()
+    for data in _raw_chunks(reader):
+        yield decompressor.decompress(data, CHUNK_SIZE)
+        while not decompressor.eof and not decompressor.needs_input:
+            yield decompressor.decompress(b"", CHUNK_SIZE)
+        if decompressor.eof:
+            return
+
+
+def _lz4_legacy_chunks(reader):
+    if lz4_block is None:
+        # The lz4 command understands the legacy format too
+        yield from _lz4_chunks(reader)
+        return
+    reader.read(len(LZ4_LEGACY_MAGIC))
+    while True:
+        size_field = reader.read(4)
+        if len(size_field) < 4:
+            return
+        if size_field == LZ4_LEGACY_MAGIC:
+            continue
+        block = reader.read(struct.unpack("<I", size_field)[0])
+        try:
+            yield lz4_block.decompress(block, uncompressed_size=LZ4_LEGACY_BLOCK_SIZE)
+        except lz4_block.LZ4BlockError:
+            # Trailing data (an appended DTB, padding) after the last block
+            return
+
+
+def _lz4_chunks(reader):
+    with open_decompressed(reader, "lz4") as stream:
+        yield from _raw_chunks(stream)
+
+
+DECOMPRESSORS = {
+    None: _raw_chunks,
+    "gzip": _gzip_chunks,
+    "xz": _xz_chunks,
+    "lz4": _lz4_chunks,
+    "lz4-legacy": _lz4_legacy_chunks,
+}
+
+
+def _compression_of(header):
+    if header.startswith(LZ4_LEGACY_MAGIC):
+        return "lz4-legacy"
+    fmt = identify_header(header)
+    return fmt if fmt in ("gzip", "xz", "lz4") else None
+
+
+def _read_varint(data, pos):
+    value, shift = 0, 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return value, pos
+        shift += 7
+
+
+def _xz_uncompressed_size(mm, start, end):
+    """Sum of the uncompressed sizes in the xz index, read from the stream footer"""
+    footer = mm[end - 12:end]
+    if end - start < 24 or footer[10:12] != b"YZ":
+        return None
+    index_size = (struct.unpack("<I", footer[4:8])[0] + 1) * 4
+    index = mm[end - 12 - index_size:end - 12]
+    if not index or index[0] != 0:
+        return None
+    count, pos = _read_varint(index, 1)
+    total = 0
+    for _ in range(count):
+        _, pos = _read_varint(index, pos)
+        uncompressed, pos = _read_varint(index, pos)
+        total += uncompressed
+    return total
+
+
+def _appended_dtbs_start(mm, start, end):
+    """Start of the DTBs appended to a compressed kernel (Image.gz-dtb), end if there are none.
+
+    A match of the magic inside the compressed data would not chain, DTB by DTB, exactly to end.
+    """
+    offset = mm.find(DTB_MAGIC, start, end)
+    while offset >= 0:
+        position = offset
+        while position + DTB_HEADER_SIZE <= end and mm[position:position + 4] == DTB_MAGIC:
+            total_size, = struct.unpack(">I", mm[position + 4:position + 8])
+            if total_size < DTB_HEADER_SIZE:
+                break
+            position += total_size
+        if position == end:
+            return offset
+        offset = mm.find(DTB_MAGIC, offset + 1, end)
+    return end
+
+
+def _gzip_member_end(mm, start, end):
+    """End offset of the gzip member at start, None if it is truncated or corrupt.
+
+    Finding it means inflating the whole member (the output is thrown away as it comes), so this
+    is only done when an exact size was asked for.
+    """
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    reader = _MmapReader(mm, start, end)
+    try:
+        for data in _raw_chunks(reader):
+            while data and not decompressor.eof:
+                decompressor.decompress(data, CHUNK_SIZE)
+                data = decompressor.unconsumed_tail
+            if decompressor.eof:
+                return reader.tell() - len(decompressor.unused_data)
+    except zlib.error:
+        pass
+    return None
+
+
+def _decompressed_size(mm, start, end, compression, exact=False):
+    """Decompressed size as recorded by the container, None if it cannot be told.
+
+    The gzip trailer is looked for in front of any appended DTBs; with exact, the member is
+    inflated to find where it really ends.
+    """
+    if compression is None:
+        return end - start
+    if compression == "gzip":
+        # ISIZE, the size modulo 2**32 from the trailer at the end of the member
+        member_end = _gzip_member_end(mm, start, end) if exact else _appended_dtbs_start(mm, start, end)
+        if member_end is None:
+            return None
+        return struct.unpack("<I", mm[member_end - 4:member_end])[0]
+    if compression == "xz":
+        return _xz_uncompressed_size(mm, start, end)
+    if compression == "lz4" and mm[start + 4] & 0x08:
+        # Frame header with the content size flag set
+        return struct.unpack("<Q", mm[start + 6:start + 14])[0]
+    return None
+
+
+def _search(mm, start, end, compression):
+    """(banner, format of the decompressed data) for a payload of the given compression"""
+    first = []
+
+    def remember_first(chunks):
+        for chunk in chunks:
+            if not first:
+                first.append(chunk[:HEADER_SIZE])
+            yield chunk
+
+    chunks = DECOMPRESSORS[compression](_MmapReader(mm, start, end))
+    try:
+        banner = find_banner(remember_first(chunks))
+    except (zlib.error, lzma.LZMAError, RuntimeError, OSError) as e:
+        logging.debug(f"Could not decompress {compression} kernel payload: {str(e)}")
+        banner = None
+    finally:
+        # Stops the decompressor (and any lz4 process) as soon as the banner was found
+        chunks.close()
+    return banner, identify_header(first[0]) if first else None
+
+
+def _analyze_payload(mm, start, end, exact_size=False):
+    header = mm[start:start + HEADER_SIZE]
+    fmt = identify_header(header)
+
+    if fmt == "zimage":
+        for magic, compression in ZIMAGE_PAYLOADS:
+            offset = mm.find(magic, start, end)
+            while offset >= 0:
+                banner, _ = _search(mm, offset, end, compression)
+                if banner:
+                    return {"banner": banner, "format": "zimage", "compression": compression,
+                            "decompressed_size": None}
+                offset = mm.find(magic, offset + 1, end)
+        return {"banner": None, "format": "zimage", "compression": None, "decompressed_size": None}
+
+    compression = _compression_of(header)
+    banner, inner_format = _search(mm, start, end, compression)
+    return {
+        "banner": banner,
+        "format": inner_format if compression else fmt,
+        "compression": compression,
+        "decompressed_size": _decompressed_size(mm, start, end, compression, exact_size),
+    }
+
+
+def detect_kernel_version(path, exact_size=False):
+    """Find the kernel version banner of a raw, compressed, zImage or boot image kernel.
+
+    Decompression is streamed in bounded chunks and stops at the banner. Returns a dict with
+    version, banner, format, compression and decompressed_size (None where unknown). With
+    exact_size, a gzip kernel is inflated to the end to be sure where its size is recorded.
+    """
+    with open(path, "rb") as f:
+        try:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            return {"version": None, "banner": None, "format": None, "compression": None,
+                    "decompressed_size": None}
+        with mm:
+            start, end = 0, len(mm)
+            container = None
+            if mm[:8] == b"ANDROID!":
+                try:
+                    with BootImage(path) as image:
+                        offset, size = image.sections.get("kernel", (0, 0))
+                    start, end, container = offset, offset + size, "android-boot"
+                except BootImageError as e:
+                    logging.warning(f"Could not parse boot image {path}: {str(e)}")
+            info = _analyze_payload(mm, start, end, exact_size)
+
+    match = _VERSION.match(info["banner"] or "")
+    info["version"] = match.group(1) if match else None
+    if container:
+        info["container"] = container
+    return info
@@ -1,13 +1,36 @@
 import sys
-from PyQt6.QtWidgets import QApplication
-from ui.main_window import MainWindow
+import argparse
+from startup_profile import PROFILER
 
 def main():
-    app = QApplication(sys.argv)
-    window = MainWindow()
-    window.show()
+    # Subcommands run headless, without ever importing Qt
+    if len(sys.argv) > 1 and not sys.argv[1].startswith("-"):
+        from cli import main as cli_main
+        sys.exit(cli_main(sys.argv[1:]))
+
+    parser = argparse.ArgumentParser(description="SamsEmung - Samsung Smartphone Emulator")
+    parser.add_argument("--profile-startup", action="store_true",
+                        help="print an import and construction timing breakdown once the window is up")
+    args, qt_args = parser.parse_known_args()
+    if args.profile_startup:
+        PROFILER.enable()
+
+    with PROFILER.phase("import PyQt6"):
+        from PyQt6.QtWidgets import QApplication
+        from PyQt6.QtCore import QTimer
+    with PROFILER.phase("import ui.main_window"):
+        from ui.main_window import MainWindow
+
+    with PROFILER.phase("create QApplication"):
+        app = QApplication(sys.argv[:1] + qt_args)
+    with PROFILER.phase("construct MainWindow"):
+        window = MainWindow()
+    with PROFILER.phase("show MainWindow"):
+        window.show()
+    if args.profile_startup:
+        # Runs once the event loop has processed the first round of events
+        QTimer.singleShot(0, PROFILER.print_report)
     sys.exit(app.exec())
 
 if __name__ == "__main__":
     main()
-
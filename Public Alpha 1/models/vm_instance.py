@@ -0,0 +1,31 @@
+class VMInstance:
+    """Runtime state of a single virtual machine tracked by QEMUController"""
+
+    def __init__(self, name, model=None, disk_path=None):
+        self.name = name
+        self.model = model
+        self.disk_path = disk_path
+        self.process = None
+        self.state = "stopped"
+        self.ports = {}
+        self.command = None
+        self.qmp = None
+        self.snapshot_tag = None
+        self.accelerator = None
+
+    def __str__(self):
+        return f"{self.name} ({self.state})"
+
+    def is_running(self):
+        return self.process is not None and self.process.poll() is None
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "model": self.model,
+            "disk_path": self.disk_path,
+            "state": self.state,
+            "pid": self.process.pid if self.process else None,
+            "accelerator": self.accelerator,
+            "ports": dict(self.ports)
+        }
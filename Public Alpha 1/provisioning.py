@@ -0,0 +1,83 @@
+import os
+import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from fs_image import PARTITION_IMAGES
+from sparse_image import convert_image
+from super_image import SuperImage
+
+# Partitions of a dump that become drives of their own, in the order they are attached
+PROVISIONED_PARTITIONS = PARTITION_IMAGES + ["userdata"]
+DEFAULT_MAX_WORKERS = 4
+
+
+def find_partition_sources(dump_folder, partitions=None):
+    """Where each partition of a dump is read from: its own <name>.img, else its logical partition in super.img.
+
+    Returns {partition: (image path, logical partition or None)} for the partitions the dump has,
+    in the order of partitions.
+    """
+    partitions = PROVISIONED_PARTITIONS if partitions is None else partitions
+    super_path = os.path.join(dump_folder, "super.img")
+    super_partitions = set()
+    if os.path.isfile(super_path):
+        try:
+            with SuperImage(super_path) as super_image:
+                super_partitions = {partition for partition in partitions if partition in super_image}
+        except (OSError, ValueError) as e:
+            logging.warning(f"Cannot read super image {super_path}: {str(e)}")
+
+    sources = {}
+    for partition in partitions:
+        image_path = os.path.join(dump_folder, f"{partition}.img")
+        if os.path.isfile(image_path):
+            sources[partition] = (image_path, None)
+        elif partition in super_partitions:
+            sources[partition] = (super_path, partition)
+    return sources
+
+
+def provision_partition(image_path, output_path, partition=None, cluster_size=None):
+    """Build the qcow2 image of one partition, from a partition image or from a super image's logical partition"""
+    if partition:
+        with SuperImage(image_path) as super_image, super_image.open(partition) as view:
+            return convert_image(view, output_path, "qcow2", cluster_size=cluster_size)
+    return convert_image(image_path, output_path, "qcow2", cluster_size=cluster_size)
+
+
+def provision_partitions(sources, output_paths, cluster_size=None, max_workers=DEFAULT_MAX_WORKERS, progress=None):
+    """Build a qcow2 image for every partition in sources, several partitions at once.
+
+    Only what the images hold is read: holes, unmapped extents and DONT_CARE chunks are skipped,
+    and clusters that are all zeros are left unallocated. progress(percent, message) is called
+    as partitions finish and may raise to stop. If anything fails the images already built are
+    removed. Returns one drive per partition, in the order of sources.
+    """
+    drives = {}
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="provision") as executor:
+            futures = {executor.submit(provision_partition, image_path, output_paths[name], partition, cluster_size):
+                       name for name, (image_path, partition) in sources.items()}
+            try:
+                for future in as_completed(futures):
+                    name = futures[future]
+                    result = future.result()
+                    drives[name] = {
+                        "partition": name,
+                        "path": output_paths[name],
+                        "source": result["source"],
+                        "size": result["size"],
+                        "allocated": result["allocated"],
+                    }
+                    logging.info(f"Provisioned {name}: {result['allocated']} of {result['size']} bytes allocated")
+                    if progress is not None:
+                        progress(len(drives) * 100 // len(futures), f"{name} ready")
+            except BaseException:
+                for future in futures:
+                    future.cancel()
+                raise
+    except BaseException:
+        for name in sources:
+            if os.path.exists(output_paths[name]):
+                os.remove(output_paths[name])
+        raise
+    return [drives[name] for name in sources]
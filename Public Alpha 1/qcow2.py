@@ -0,0 +1,167 @@
+import struct
+
+QCOW2_MAGIC = b"QFI\xfb"
+QCOW2_VERSION = 3
+DEFAULT_CLUSTER_SIZE = 64 * 1024
+MIN_CLUSTER_BITS = 9
+MAX_CLUSTER_BITS = 21
+# 16-bit refcounts, the qemu-img default
+REFCOUNT_ORDER = 4
+# Set on L1/L2 entries whose cluster has a refcount of exactly one
+QCOW_OFLAG_COPIED = 1 << 63
+
+_HEADER = struct.Struct(">4sIQIIQIIQQIIQQQQII")
+
+
+def parse_cluster_size(value):
+    """Cluster size in bytes from an int or a qemu-img style string such as '64K' or '2M'"""
+    if value is None or value == "":
+        return DEFAULT_CLUSTER_SIZE
+    if isinstance(value, str):
+        units = {"K": 1024, "M": 1024 * 1024}
+        value = value.strip().upper()
+        value = int(value[:-1]) * units[value[-1]] if value[-1] in units else int(value)
+    if value & (value - 1) or not 1 << MIN_CLUSTER_BITS <= value <= 1 << MAX_CLUSTER_BITS:
+        raise ValueError(f"Invalid qcow2 cluster size: {value}")
+    return value
+
+
+class Qcow2Writer:
+    """Writes a qcow2 (v3) image front to back without qemu-img.
+
+    Guest data has to be written in increasing offset order. Only clusters holding non-zero
+    bytes get allocated; everything else stays unallocated and reads as zeros. The L2 tables,
+    L1 table and refcounts are laid out after the data when the writer is closed. Without a
+    size, the disk ends with the last byte written.
+    """
+
+    def __init__(self, path, size, cluster_size=None):
+        self.path = path
+        self.size = size
+        self.cluster_size = parse_cluster_size(cluster_size)
+        self.cluster_bits = self.cluster_size.bit_length() - 1
+        self.data_clusters = 0
+        self._file = open(path, "wb")
+        self._zero_cluster = bytes(self.cluster_size)
+        # Guest cluster index -> host offset
+        self._mapping = {}
+        self._host_offset = self.cluster_size
+        self._cluster = None
+        self._buffer = None
+        self._end = 0
+        self._closed = False
+
+    def write(self, offset, data):
+        """Write guest data at offset, which must not go back before the cluster last written to"""
+        data = memoryview(data)
+        if self.size is not None and offset + len(data) > self.size:
+            raise ValueError(f"Write past the end of the {self.size} byte disk")
+        self._end = max(self._end, offset + len(data))
+        cluster_size = self.cluster_size
+        while len(data):
+            cluster, within = divmod(offset, cluster_size)
+            if cluster != self._cluster:
+                self._flush()
+                if self._cluster is not None and cluster < self._cluster:
+                    raise ValueError("qcow2 data must be written in increasing offset order")
+                self._cluster = cluster
+            count = min(len(data), cluster_size - within)
+            if count == cluster_size and self._buffer is None:
+                # Whole clusters skip the buffer
+                self._store(cluster, data[:count])
+            else:
+                if self._buffer is None:
+                    self._buffer = bytearray(cluster_size)
+                self._buffer[within:within + count] = data[:count]
+            data = data[count:]
+            offset += count
+
+    def _flush(self):
+        if self._buffer is not None:
+            self._store(self._cluster, self._buffer)
+            self._buffer = None
+
+    def _store(self, cluster, data):
+        if data == self._zero_cluster:
+            return
+        if cluster in self._mapping:
+            raise ValueError("qcow2 data must be written in increasing offset order")
+        self._file.seek(self._host_offset)
+        self._file.write(data)
+        self._mapping[cluster] = self._host_offset
+        self._host_offset += self.cluster_size
+        self.data_clusters += 1
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            self._flush()
+            if self.size is None:
+                self.size = self._end
+            self._write_metadata()
+        finally:
+            self._file.close()
+
+    def _write_metadata(self):
+        cluster_size = self.cluster_size
+        l2_entries = cluster_size // 8
+        guest_clusters = -(-self.size // cluster_size)
+        l1_size = max(1, -(-guest_clusters // l2_entries))
+
+        l1_table = [0] * l1_size
+        l2_tables = {}
+        for cluster, host_offset in self._mapping.items():
+            l2_tables.setdefault(cluster // l2_entries, [0] * l2_entries)[cluster % l2_entries] = \
+                host_offset | QCOW_OFLAG_COPIED
+        offset = self._host_offset
+        for l1_index in sorted(l2_tables):
+            self._write_table(offset, l2_tables[l1_index])
+            l1_table[l1_index] = offset | QCOW_OFLAG_COPIED
+            offset += cluster_size
+
+        l1_offset = offset
+        self._write_table(l1_offset, l1_table)
+        offset += -(-l1_size * 8 // cluster_size) * cluster_size
+
+        # The refcount structures count themselves, so grow them until they cover everything
+        used_clusters = offset // cluster_size
+        per_block = cluster_size * 8 // (1 << REFCOUNT_ORDER)
+        blocks, table_clusters = 0, 0
+        while True:
+            needed_blocks = -(-(used_clusters + blocks + table_clusters) // per_block)
+            needed_table_clusters = -(-needed_blocks * 8 // cluster_size)
+            if (needed_blocks, needed_table_clusters) == (blocks, table_clusters):
+                break
+            blocks, table_clusters = needed_blocks, needed_table_clusters
+        total_clusters = used_clusters + blocks + table_clusters
+
+        refcount_table = []
+        for block in range(blocks):
+            covered = max(0, min(per_block, total_clusters - block * per_block))
+            self._file.seek(offset)
+            self._file.write(struct.pack(f">{covered}H", *([1] * covered)).ljust(cluster_size, b"\x00"))
+            refcount_table.append(offset)
+            offset += cluster_size
+        refcount_table_offset = offset
+        self._write_table(refcount_table_offset, refcount_table)
+        self._file.seek(refcount_table_offset + table_clusters * cluster_size - 1)
+        self._file.write(b"\x00")
+
+        header = _HEADER.pack(QCOW2_MAGIC, QCOW2_VERSION, 0, 0, self.cluster_bits, self.size, 0, l1_size,
+                              l1_offset, refcount_table_offset, table_clusters, 0, 0, 0, 0, 0, REFCOUNT_ORDER,
+                              _HEADER.size)
+        self._file.seek(0)
+        # The header is followed by an empty header extension area (end marker)
+        self._file.write(header + bytes(8))
+
+    def _write_table(self, offset, entries):
+        self._file.seek(offset)
+        self._file.write(struct.pack(f">{len(entries)}Q", *entries))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
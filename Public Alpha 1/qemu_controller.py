@@ -1,32 +1,548 @@
 import os
+import json
+import asyncio
+import hashlib
+import shutil
 import subprocess
 import tempfile
 from pathlib import Path
 import logging
+import platform
 import sys
 import zipfile
-import shutil
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from models.vm_instance import VMInstance
+from vm_store import VMS_DIR, get_vm_log_path
+from kernel_formats import HEADER_SIZE, extract_kernel_from_zip, kernel_score, name_score
+from bootimg import BootImage, BootImageError, is_boot_image, unpack_boot_image
+from artifact_store import ArtifactStore
+from signature_scanner import KERNEL_KINDS, scan_directory
+from sparse_image import convert_image
+from super_image import SuperImage
+from firmware_ingest import ingest_firmware
+from provisioning import find_partition_sources, provision_partitions
+
+DEFAULT_VM_NAME = "default"
+SNAPSHOT_TAG_PREFIX = "samsemung-boot-"
+
+# Map QMP run states and events onto VMInstance.state
+QMP_STATUS_STATES = {
+    "running": "running",
+    "paused": "paused",
+    "suspended": "paused",
+    "prelaunch": "paused",
+    "inmigrate": "paused",
+    "debug": "paused",
+    "save-vm": "paused",
+    "restore-vm": "paused",
+    "shutdown": "stopping",
+    "internal-error": "crashed",
+    "io-error": "crashed",
+    "guest-panicked": "crashed",
+}
+# Normalise platform.machine() to the architecture names used in samsung_models
+HOST_ARCHITECTURES = {
+    "x86_64": "x86_64",
+    "amd64": "x86_64",
+    "aarch64": "arm64",
+    "arm64": "arm64",
+}
+MACHINE_TYPES = {
+    "x86_64": "q35",
+}
+# Emulated CPUs must match the guest's instruction set: cortex-a15 is ARMv7 only, aarch64 kernels need an ARMv8 core
+TCG_CPU_MODELS = {
+    "arm": "cortex-a15",
+    "arm64": "cortex-a57",
+    "x86_64": "max",
+}
+# Per-VM storage profile, stored under 'storage' in the VM JSON
+STORAGE_INTERFACES = ["virtio-blk", "virtio-scsi"]
+AIO_MODES = ["threads", "native", "io_uring"]
+CACHE_MODES = ["writeback", "none", "unsafe"]
+DISCARD_MODES = ["unmap", "ignore"]
+CLUSTER_SIZES = ["64K", "128K", "256K", "512K", "1M", "2M"]
+DEFAULT_STORAGE_PROFILE = {
+    "interface": "virtio-blk",
+    "iothread": True,
+    "aio": "threads",
+    "cache": "writeback",
+    "discard": "unmap",
+    "l2_cache_size": "",
+    "cluster_size": "64K",
+}
+QMP_EVENT_STATES = {
+    "STOP": "paused",
+    "RESUME": "running",
+    "SHUTDOWN": "stopping",
+    "GUEST_PANICKED": "crashed",
+}
+
+
+class QMPError(RuntimeError):
+    pass
+
+
+class QMPClient:
+    """Minimal asyncio client for the QEMU Machine Protocol"""
+
+    def __init__(self, host, port, event_callback=None):
+        self.host = host
+        self.port = port
+        self.event_callback = event_callback
+        self._reader = None
+        self._writer = None
+        self._pending = {}
+        self._next_id = 0
+        self._read_task = None
+
+    async def connect(self, timeout=1.0, retry_interval=0.05):
+        """Connect and negotiate capabilities, retrying while QEMU opens the socket"""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while True:
+            try:
+                self._reader, self._writer = await asyncio.open_connection(self.host, self.port)
+                break
+            except OSError:
+                if loop.time() >= deadline:
+                    raise
+                await asyncio.sleep(retry_interval)
+
+        greeting = json.loads(await asyncio.wait_for(self._reader.readline(), timeout))
+        if 'QMP' not in greeting:
+            raise QMPError(f"Unexpected QMP greeting: {greeting}")
+        self._read_task = asyncio.create_task(self._read_loop())
+        await self.execute('qmp_capabilities', timeout=timeout)
+        return greeting['QMP']
+
+    async def execute(self, command, arguments=None, timeout=None):
+        if self._writer is None or self._read_task is None or self._read_task.done():
+            raise ConnectionError("QMP connection is closed")
+
+        self._next_id += 1
+        message_id = f"samsemung-{self._next_id}"
+        message = {'execute': command, 'id': message_id}
+        if arguments:
+            message['arguments'] = arguments
+
+        future = asyncio.get_running_loop().create_future()
+        self._pending[message_id] = future
+        try:
+            self._writer.write(json.dumps(message).encode() + b"\n")
+            await self._writer.drain()
+            response = await asyncio.wait_for(future, timeout)
+        finally:
+            self._pending.pop(message_id, None)
+
+        if 'error' in response:
+            raise QMPError(f"QMP command '{command}' failed: {response['error'].get('desc', response['error'])}")
+        return response.get('return')
+
+    async def _read_loop(self):
+        try:
+            while True:
+                line = await self._reader.readline()
+                if not line:
+                    break
+                message = json.loads(line)
+                if 'event' in message:
+                    if self.event_callback:
+                        self.event_callback(message['event'], message.get('data', {}))
+                else:
+                    future = self._pending.get(message.get('id'))
+                    if future and not future.done():
+                        future.set_result(message)
+        except (ConnectionError, ValueError) as e:
+            logging.debug(f"QMP connection to {self.host}:{self.port} lost: {str(e)}")
+        finally:
+            for future in self._pending.values():
+                if not future.done():
+                    future.set_exception(ConnectionError("QMP connection closed"))
+
+    async def wait_closed(self):
+        if self._read_task is not None:
+            await asyncio.shield(self._read_task)
+
+    async def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            try:
+                await self._writer.wait_closed()
+            except ConnectionError:
+                pass
+        if self._read_task is not None:
+            await asyncio.wait([self._read_task], timeout=1.0)
+
+
+class _AttachedProcess:
+    """Popen-like handle of a QEMU process started by another SamsEmung process"""
+
+    def __init__(self, pid, command=None):
+        import psutil
+        self._psutil = psutil
+        self.pid = pid
+        self.returncode = None
+        try:
+            self._process = psutil.Process(pid)
+            # A recycled pid belongs to some other program
+            if command and self._process.cmdline() != list(command):
+                self.returncode = 0
+        except psutil.NoSuchProcess:
+            self._process = None
+            self.returncode = 0
+        except psutil.AccessDenied:
+            pass
+
+    def poll(self):
+        if self.returncode is None:
+            try:
+                if self._process.status() == self._psutil.STATUS_ZOMBIE or not self._process.is_running():
+                    self.returncode = 0
+            except self._psutil.NoSuchProcess:
+                self.returncode = 0
+        return self.returncode
+
+    def wait(self, timeout=None):
+        if self.returncode is None:
+            try:
+                returncode = self._process.wait(timeout)
+            except self._psutil.TimeoutExpired:
+                raise subprocess.TimeoutExpired(str(self.pid), timeout)
+            except self._psutil.NoSuchProcess:
+                returncode = None
+            # The exit code of a process that is not our child cannot be known
+            self.returncode = returncode or 0
+        return self.returncode
+
+    def terminate(self):
+        self._signal("terminate")
+
+    def kill(self):
+        self._signal("kill")
+
+    def _signal(self, method):
+        if self.returncode is None:
+            try:
+                getattr(self._process, method)()
+            except self._psutil.NoSuchProcess:
+                self.returncode = 0
 
 
 class QEMUController:
     def __init__(self, config):
         self.config = config
-        self.process = None
+        self.vms = {}
+        self._vms_lock = threading.RLock()
+        self._current_vm = None
+        self._state_listeners = []
+        self._event_listeners = []
+        self._loop = None
+        self._executor = ThreadPoolExecutor(max_workers=config.get('max_parallel_vm_ops', 8),
+                                            thread_name_prefix="vm-op")
         self.kernel_dir = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'kernels')
         self.recovery_dir = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'recovery')
+        self.disk_dir = os.path.join(VMS_DIR, 'disks')
+        # Kernels, ramdisks and DTBs unpacked from boot images, keyed by image sha256
+        self.unpacked_dir = os.path.join(self.kernel_dir, 'unpacked')
         os.makedirs(self.kernel_dir, exist_ok=True)
         os.makedirs(self.recovery_dir, exist_ok=True)
+        self.artifacts = ArtifactStore()
+
+    @property
+    def process(self):
+        """Process of the most recently started VM (kept for the single-VM callers)"""
+        instance = self.vms.get(self._current_vm)
+        return instance.process if instance else None
+
+    @process.setter
+    def process(self, process):
+        with self._vms_lock:
+            instance = self._get_or_create_instance(self._current_vm or DEFAULT_VM_NAME)
+            instance.process = process
+            instance.state = "running" if process else "stopped"
+            self._current_vm = instance.name
+
+    def add_state_listener(self, callback):
+        """Register callback(vm_name, state) called whenever a VM changes state"""
+        self._state_listeners.append(callback)
+
+    def remove_state_listener(self, callback):
+        if callback in self._state_listeners:
+            self._state_listeners.remove(callback)
+
+    def add_event_listener(self, callback):
+        """Register callback(vm_name, event, data) for QMP events of every VM"""
+        self._event_listeners.append(callback)
+
+    def remove_event_listener(self, callback):
+        if callback in self._event_listeners:
+            self._event_listeners.remove(callback)
+
+    def _set_state(self, instance, state):
+        if instance.state == state:
+            return
+        instance.state = state
+        logging.debug(f"VM '{instance.name}' is now {state}")
+        for callback in list(self._state_listeners):
+            try:
+                callback(instance.name, state)
+            except Exception as e:
+                logging.error(f"VM state listener failed: {str(e)}")
 
-    def create_virtual_disk(self, size):
-        """Create a new virtual disk"""
+    def _get_or_create_instance(self, vm_name, model=None, disk_path=None):
+        with self._vms_lock:
+            instance = self.vms.get(vm_name)
+            if instance is None:
+                instance = VMInstance(vm_name, model, disk_path)
+                self.vms[vm_name] = instance
+            if model:
+                instance.model = model
+            if disk_path:
+                instance.disk_path = disk_path
+            return instance
+
+    def _resolve_vm(self, vm_name):
+        return self.vms.get(vm_name or self._current_vm)
+
+    def _allocate_port(self):
+        """Find a free localhost port that no registered VM is using"""
+        with self._vms_lock:
+            used = {port for instance in self.vms.values() for port in instance.ports.values()}
+        port = self.config.get('vm_base_port', 5555)
+        while port < 65535:
+            if port not in used:
+                with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+                    try:
+                        sock.bind(("127.0.0.1", port))
+                        return port
+                    except OSError:
+                        pass
+            port += 1
+        raise RuntimeError("No free port available for the virtual machine")
+
+    def _reserve_ports(self, instance):
+        with self._vms_lock:
+            for name in ('adb', 'qmp'):
+                if name not in instance.ports:
+                    instance.ports[name] = self._allocate_port()
+        return instance.ports
+
+    def _get_loop(self):
+        """Event loop running the QMP clients of every VM on a background thread"""
+        with self._vms_lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(target=self._loop.run_forever, name="qmp-loop", daemon=True).start()
+        return self._loop
+
+    def _run_coroutine(self, coroutine, timeout=None):
+        return asyncio.run_coroutine_threadsafe(coroutine, self._get_loop()).result(timeout)
+
+    def _watch_vm(self, instance, process):
+        asyncio.run_coroutine_threadsafe(self._monitor_vm(instance, process), self._get_loop())
+
+    async def _monitor_vm(self, instance, process):
+        """Attach QMP to a freshly started VM and follow its state until QEMU exits"""
+        client = QMPClient("127.0.0.1", instance.ports['qmp'],
+                           event_callback=lambda event, data: self._on_qmp_event(instance, event, data))
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.config.get('qmp_connect_timeout', 30)
+        while True:
+            try:
+                await client.connect(timeout=1.0)
+                break
+            except (OSError, asyncio.TimeoutError, QMPError, ValueError) as e:
+                if process.poll() is not None:
+                    break
+                if loop.time() >= deadline:
+                    logging.warning(f"QMP is not available for '{instance.name}': {str(e)}")
+                    self._set_state(instance, "running")
+                    return
+
+        if process.poll() is None:
+            instance.qmp = client
+            try:
+                status = await client.execute('query-status', timeout=5)
+                self._set_state(instance, QMP_STATUS_STATES.get(status['status'], "running"))
+            except (QMPError, ConnectionError, asyncio.TimeoutError) as e:
+                logging.warning(f"Could not query status of '{instance.name}': {str(e)}")
+            await client.wait_closed()
+            instance.qmp = None
+
+        returncode = await loop.run_in_executor(None, process.wait)
+        if instance.process is process:
+            instance.process = None
+            self._set_state(instance, "stopped" if returncode == 0 else "crashed")
+            logging.info(f"QEMU emulator '{instance.name}' exited with code {returncode}")
+
+    def _on_qmp_event(self, instance, event, data):
+        logging.debug(f"QMP event from '{instance.name}': {event} {data}")
+        state = QMP_EVENT_STATES.get(event)
+        if state:
+            self._set_state(instance, state)
+        for callback in list(self._event_listeners):
+            try:
+                callback(instance.name, event, data)
+            except Exception as e:
+                logging.error(f"QMP event listener failed: {str(e)}")
+
+    def execute_qmp(self, command, arguments=None, vm_name=None, timeout=5):
+        """Run a QMP command on a VM and return its result"""
+        instance = self._resolve_vm(vm_name)
+        if instance is None or instance.qmp is None:
+            raise RuntimeError("QMP is not connected for this virtual machine")
+        return self._run_coroutine(instance.qmp.execute(command, arguments, timeout=timeout), timeout)
+
+    def query_status(self, vm_name=None):
+        """Return the QMP run state of a VM (e.g. 'running' or 'paused')"""
+        return self.execute_qmp('query-status', vm_name=vm_name)['status']
+
+    def pause_emulator(self, vm_name=None):
+        self.execute_qmp('stop', vm_name=vm_name)
+
+    def resume_emulator(self, vm_name=None):
+        self.execute_qmp('cont', vm_name=vm_name)
+
+    def get_vm_status(self, vm_name=None):
+        """Return the registry entry of a VM as a dict, refreshing its state from the process"""
+        instance = self._resolve_vm(vm_name)
+        if instance is None:
+            return None
+        if instance.process is not None and instance.process.poll() is not None:
+            returncode = instance.process.returncode
+            instance.process = None
+            self._set_state(instance, "stopped" if returncode == 0 else "crashed")
+        return instance.to_dict()
+
+    def list_vms(self):
+        """Return the status of every registered VM"""
+        with self._vms_lock:
+            names = list(self.vms)
+        return [self.get_vm_status(name) for name in names]
+
+    def is_running(self, vm_name=None):
+        instance = self._resolve_vm(vm_name)
+        return instance is not None and instance.is_running()
+
+    def unregister_vm(self, vm_name):
+        """Remove a stopped VM from the registry"""
+        with self._vms_lock:
+            instance = self.vms.get(vm_name)
+            if instance and instance.is_running():
+                raise RuntimeError(f"Virtual machine '{vm_name}' is still running")
+            self.vms.pop(vm_name, None)
+            if self._current_vm == vm_name:
+                self._current_vm = None
+
+    def _qemu_img(self, *args):
+        """Run qemu-img with the given arguments and return its stdout"""
+        cmd = [os.path.join(self.config['qemu_path'], "qemu-img"), *args]
         try:
-            vdisk_folder = Path(tempfile.gettempdir()) / "samsemung_vdisk"
-            vdisk_folder.mkdir(parents=True, exist_ok=True)
-            vdisk_path = vdisk_folder / "samsung_vdisk.qcow2"
+            result = subprocess.run(cmd, check=True, capture_output=True, text=True)
+        except subprocess.CalledProcessError as e:
+            raise RuntimeError(f"qemu-img {args[0]} failed: {e.stderr.strip()}")
+        except OSError as e:
+            raise RuntimeError(f"Could not run qemu-img: {str(e)}")
+        return result.stdout
+
+    def get_snapshot_tag(self, model, memory, kernel_zip, recovery_img, cpus=1):
+        """Snapshot tag fingerprinting the boot configuration a saved state belongs to"""
+        digest = hashlib.sha256()
+        for path in (kernel_zip, recovery_img):
+            digest.update(str(path).encode())
+            try:
+                stat = os.stat(path)
+                digest.update(f"{stat.st_size}:{stat.st_mtime_ns}".encode())
+            except (OSError, TypeError):
+                pass
+        digest.update(f"{model}|{memory}|{cpus}|{self.config.get('kernel_params')}".encode())
+        return SNAPSHOT_TAG_PREFIX + digest.hexdigest()[:16]
+
+    def list_snapshots(self, disk_path):
+        """List the internal snapshots of a qcow2 disk, also while a VM is using it"""
+        info = json.loads(self._qemu_img("info", "-U", "--output=json", disk_path))
+        return [
+            {
+                "id": snapshot.get("id"),
+                "tag": snapshot.get("name"),
+                "vm_state_size": snapshot.get("vm-state-size", 0),
+                "date": snapshot.get("date-sec"),
+            }
+            for snapshot in info.get("snapshots", [])
+        ]
+
+    def _vm_using_disk(self, disk_path):
+        with self._vms_lock:
+            for instance in self.vms.values():
+                if instance.is_running() and instance.disk_path and \
+                        os.path.abspath(instance.disk_path) == os.path.abspath(disk_path):
+                    return instance
+        return None
+
+    def delete_snapshot(self, disk_path, tag):
+        """Delete a snapshot, through the monitor if a running VM holds the disk"""
+        instance = self._vm_using_disk(disk_path)
+        if instance is not None and instance.qmp is not None:
+            self._human_monitor_command(instance.name, f"delvm {tag}")
+        else:
+            self._qemu_img("snapshot", "-d", tag, disk_path)
+        logging.info(f"Deleted snapshot '{tag}' from {disk_path}")
+
+    def invalidate_snapshots(self, disk_path, keep_tag=None):
+        """Delete saved boot states that do not match the current boot configuration"""
+        removed = []
+        for snapshot in self.list_snapshots(disk_path):
+            tag = snapshot["tag"]
+            if tag and tag.startswith(SNAPSHOT_TAG_PREFIX) and tag != keep_tag:
+                self.delete_snapshot(disk_path, tag)
+                removed.append(tag)
+        return removed
 
-            # If the file already exists, remove it
-            if vdisk_path.exists():
-                vdisk_path.unlink()
+    def _human_monitor_command(self, vm_name, command_line, timeout=5):
+        output = self.execute_qmp('human-monitor-command', {'command-line': command_line},
+                                  vm_name=vm_name, timeout=timeout)
+        if output and "error" in output.lower():
+            raise RuntimeError(output.strip())
+        return output
+
+    def save_boot_snapshot(self, vm_name=None):
+        """Save the state of a booted VM so later starts can resume from it"""
+        instance = self._resolve_vm(vm_name)
+        if instance is None or instance.qmp is None:
+            raise RuntimeError("Virtual machine is not running. Cannot save its state.")
+
+        tag = instance.snapshot_tag
+        self.invalidate_snapshots(instance.disk_path, keep_tag=tag)
+        if any(snapshot["tag"] == tag for snapshot in self.list_snapshots(instance.disk_path)):
+            self._human_monitor_command(instance.name, f"delvm {tag}")
+        self._human_monitor_command(instance.name, f"savevm {tag}",
+                                    timeout=self.config.get('snapshot_timeout', 600))
+        logging.info(f"Saved booted state of '{instance.name}' as {tag}")
+        return tag
+
+    def get_vm_disk_path(self, vm_name):
+        return os.path.join(self.disk_dir, f"{vm_name}.qcow2")
+
+    def create_virtual_disk(self, size, vm_name=None, cluster_size=None):
+        """Create a new virtual disk, a per-VM one if vm_name is given"""
+        try:
+            if vm_name:
+                vdisk_path = Path(self.get_vm_disk_path(vm_name))
+                vdisk_path.parent.mkdir(parents=True, exist_ok=True)
+                if vdisk_path.exists():
+                    raise FileExistsError(f"Virtual disk already exists: {vdisk_path}")
+            else:
+                vdisk_folder = Path(tempfile.gettempdir()) / "samsemung_vdisk"
+                vdisk_folder.mkdir(parents=True, exist_ok=True)
+                vdisk_path = vdisk_folder / "samsung_vdisk.qcow2"
+
+                # If the file already exists, remove it
+                if vdisk_path.exists():
+                    vdisk_path.unlink()
 
             cmd = [
                 os.path.join(self.config['qemu_path'], "qemu-img"),
@@ -35,6 +551,8 @@ class QEMUController:
                 str(vdisk_path),
                 f"{size}M"
             ]
+            if cluster_size:
+                cmd[4:4] = ["-o", f"cluster_size={cluster_size}"]
 
             # Run the command and capture output
             result = subprocess.run(
@@ -59,12 +577,112 @@ class QEMUController:
             logging.error(f"Error creating virtual disk: {str(e)}")
             raise RuntimeError(f"Error creating virtual disk: {str(e)}")
 
+    def create_linked_clone(self, base_path, vm_name, size=None, cluster_size=None):
+        """Create a per-VM qcow2 overlay whose unchanged clusters are read from a base image"""
+        if not os.path.exists(base_path):
+            raise FileNotFoundError(f"Base image not found: {base_path}")
+
+        clone_path = self.get_vm_disk_path(vm_name)
+        if os.path.exists(clone_path):
+            raise FileExistsError(f"Virtual disk already exists: {clone_path}")
+        os.makedirs(self.disk_dir, exist_ok=True)
+
+        args = ["create", "-f", "qcow2", "-F", "qcow2", "-b", os.path.abspath(base_path), clone_path]
+        if cluster_size:
+            args[3:3] = ["-o", f"cluster_size={cluster_size}"]
+        if size:
+            args.append(f"{size}M")
+        self._qemu_img(*args)
+        logging.info(f"Linked clone of {base_path} created at: {clone_path}")
+        return clone_path
+
+    def create_virtual_disk_from_image(self, image_path, vm_name, cluster_size=None, partition=None):
+        """Create a VM's qcow2 disk from a partition image, an Android sparse image or a raw one.
+
+        With a partition, image_path is a super image and only that logical partition is used,
+        read straight out of it. The image is converted in one pass without qemu-img; only
+        non-zero clusters are allocated.
+        """
+        if not os.path.exists(image_path):
+            raise FileNotFoundError(f"Image not found: {image_path}")
+        disk_path = self.get_vm_disk_path(vm_name)
+        if os.path.exists(disk_path):
+            raise FileExistsError(f"Virtual disk already exists: {disk_path}")
+        os.makedirs(self.disk_dir, exist_ok=True)
+        if partition:
+            with SuperImage(image_path) as super_image, super_image.open(partition) as view:
+                result = convert_image(view, disk_path, "qcow2", cluster_size=cluster_size)
+        else:
+            result = convert_image(image_path, disk_path, "qcow2", cluster_size=cluster_size)
+        logging.info(f"Virtual disk created from {result['source']} at: {disk_path} "
+                     f"({result['allocated']} of {result['size']} bytes allocated)")
+        return disk_path
+
+    def get_vm_partition_disk_path(self, vm_name, partition):
+        return os.path.join(self.disk_dir, f"{vm_name}-{partition}.qcow2")
+
+    def provision_vm_disks(self, vm_name, dump_folder, cluster_size=None, progress=None):
+        """Build a qcow2 drive for every partition of a dump (system, vendor, ..., userdata) for a VM.
+
+        Partitions come from their own images or from the dump's super.img, are built in parallel
+        and only take the space of the data they hold. Returns the drives for the VM's
+        configuration, to be passed to start_emulator.
+        """
+        if not os.path.isdir(dump_folder):
+            raise FileNotFoundError(f"Dump folder not found: {dump_folder}")
+        sources = find_partition_sources(dump_folder)
+        if not sources:
+            raise FileNotFoundError(f"No partition images or super.img in {dump_folder}")
+        output_paths = {partition: self.get_vm_partition_disk_path(vm_name, partition) for partition in sources}
+        for output_path in output_paths.values():
+            if os.path.exists(output_path):
+                raise FileExistsError(f"Virtual disk already exists: {output_path}")
+        os.makedirs(self.disk_dir, exist_ok=True)
+        drives = provision_partitions(sources, output_paths, cluster_size=cluster_size, progress=progress)
+        logging.info(f"Provisioned {len(drives)} partition drives for '{vm_name}' from {dump_folder}")
+        return drives
+
+    def import_firmware(self, package_path, dump_folder=None, vm_name=None, cluster_size=None, progress=None):
+        """Import an Odin firmware package (AP/BL/CP/CSC .tar.md5) in one sequential read.
+
+        boot.img and recovery.img are added to the artifact store, partition images are written to
+        the dump folder, and with a VM name system.img becomes that VM's disk, which creating a VM
+        of that name then adopts. Nothing is kept if the package's MD5 does not match.
+        """
+        if not os.path.exists(package_path):
+            raise FileNotFoundError(f"Firmware package not found: {package_path}")
+        disk_path = None
+        if vm_name:
+            disk_path = self.get_vm_disk_path(vm_name)
+            if os.path.exists(disk_path):
+                raise FileExistsError(f"Virtual disk already exists: {disk_path}")
+            os.makedirs(self.disk_dir, exist_ok=True)
+        return ingest_firmware(package_path, dump_folder, self.artifacts, disk_path, cluster_size=cluster_size,
+                               progress=progress)
+
+    def get_backing_file(self, disk_path):
+        """Return the backing image of a qcow2 disk, or None for a standalone disk"""
+        info = json.loads(self._qemu_img("info", "-U", "--output=json", disk_path))
+        return info.get("full-backing-filename") or info.get("backing-filename")
+
+    def rebase_disk(self, disk_path, new_base_path):
+        """Point an overlay at another base image, keeping the guest-visible content"""
+        if self._vm_using_disk(disk_path):
+            raise RuntimeError("Cannot rebase a disk while its virtual machine is running")
+        self._qemu_img("rebase", "-f", "qcow2", "-F", "qcow2", "-b", os.path.abspath(new_base_path), disk_path)
+        logging.info(f"Rebased {disk_path} onto {new_base_path}")
+
+    def flatten_disk(self, disk_path):
+        """Copy the backing data into an overlay so it no longer depends on its base image"""
+        if self._vm_using_disk(disk_path):
+            raise RuntimeError("Cannot flatten a disk while its virtual machine is running")
+        self._qemu_img("rebase", "-f", "qcow2", "-b", "", disk_path)
+        logging.info(f"Flattened {disk_path}")
+
     def add_kernel(self, zip_path):
-        """Add kernel zip file to the kernels directory"""
+        """Add a kernel zip file to the artifact store"""
         try:
-            kernel_name = os.path.basename(zip_path)
-            dest_path = os.path.join(self.kernel_dir, kernel_name)
-            shutil.copy2(zip_path, dest_path)
+            dest_path = self.artifacts.path(self.artifacts.add(zip_path, 'kernel'))
             logging.info(f"Kernel zip added: {dest_path}")
             return dest_path
         except Exception as e:
@@ -74,13 +692,14 @@ class QEMUController:
     def add_twrp_recovery(self, recovery_img_path):
         """Add TWRP recovery image and modify it to appear as a Samsung device"""
         try:
-            # Copy the TWRP recovery image
-            recovery_name = os.path.basename(recovery_img_path)
-            dest_path = os.path.join(self.recovery_dir, recovery_name)
-            shutil.copy2(recovery_img_path, dest_path)
-
-            # Modify the recovery image to appear as a Samsung device
-            self._modify_twrp_for_samsung(dest_path)
+            # Store objects can be hardlinks or reflinks of the imported file and are named by their
+            # content, so the image is patched in a private copy which is then added as is
+            os.makedirs(self.artifacts.root, exist_ok=True)
+            with tempfile.TemporaryDirectory(prefix=".recovery-", dir=self.artifacts.root) as tmpdir:
+                patched_path = os.path.join(tmpdir, os.path.basename(recovery_img_path))
+                shutil.copyfile(recovery_img_path, patched_path)
+                self._modify_twrp_for_samsung(patched_path)
+                dest_path = self.artifacts.path(self.artifacts.add(patched_path, 'recovery'))
 
             logging.info(f"Modified TWRP recovery added: {dest_path}")
             return dest_path
@@ -98,52 +717,256 @@ class QEMUController:
         # Placeholder for actual modification logic
         pass
 
-    def start_emulator(self, model, ui_version, memory, kernel_zip, recovery_img):
-        """Start the emulator with the given configuration"""
+    def start_emulator(self, model, ui_version, memory, kernel_zip, recovery_img, vm_name=None, disk_path=None,
+                       fast_start=False, cpus=1, storage=None, detach=False, drives=None):
+        """Start the emulator with the given configuration, from a saved boot state if fast_start is set.
+
+        drives are partition drives attached after the main disk, as built by provision_vm_disks.
+        A detached QEMU gets its own session and logs to the VM's log file, so it keeps running
+        once the calling process exits.
+        """
+        vm_name = vm_name or model
         try:
-            architecture = self.config['samsung_models'].get(model, "arm64")
-            qemu_path = self._get_qemu_path(architecture)
+            with self._vms_lock:
+                instance = self._get_or_create_instance(vm_name, model, disk_path)
+                if instance.is_running():
+                    raise RuntimeError(f"Virtual machine '{vm_name}' is already running")
+                self._set_state(instance, "starting")
 
-            vdisk_path = self.config.get('qcow2_path', self.config.get('virtual_disk_path'))
-            if not vdisk_path or not os.path.exists(vdisk_path):
-                raise FileNotFoundError("Virtual disk not found. Please create a virtual disk in settings.")
+            instance.snapshot_tag = self.get_snapshot_tag(model, memory, kernel_zip, recovery_img, cpus)
+            loadvm = self._find_boot_snapshot(instance) if fast_start else None
 
-            cmd = [
-                qemu_path,
-                "-machine", "type=virt",
-                "-cpu", "cortex-a15",
-                "-kernel", kernel_zip,
-                "-initrd", recovery_img,
-                "-drive", f"file={vdisk_path},format=qcow2",
-                "-m", f"{memory}M" if memory > 0 else "1024M",
-            ]
-
-            # Add kernel parameters if specified
-            kernel_params = self.config.get('kernel_params')
-            if kernel_params:
-                cmd.extend(["-append", kernel_params])
+            cmd = self._build_command(instance, model, memory, kernel_zip, recovery_img, cpus=cpus, storage=storage,
+                                      loadvm=loadvm, drives=drives)
 
             env = os.environ.copy()
             env["GTK_PATH"] = ""
 
-            self.process = subprocess.Popen(cmd, env=env)
-            logging.info(f"Started QEMU emulator for {model}")
+            if detach:
+                log_path = get_vm_log_path(vm_name)
+                os.makedirs(os.path.dirname(log_path), exist_ok=True)
+                with open(log_path, 'ab') as log_file:
+                    instance.process = subprocess.Popen(cmd, env=env, stdin=subprocess.DEVNULL, stdout=log_file,
+                                                        stderr=subprocess.STDOUT, start_new_session=True)
+            else:
+                instance.process = subprocess.Popen(cmd, env=env)
+            instance.command = cmd
+            self._current_vm = vm_name
+            self._watch_vm(instance, instance.process)
+            logging.info(f"Started QEMU emulator '{vm_name}' for {model}")
 
             return cmd
 
         except subprocess.CalledProcessError as e:
             logging.error(f"Failed to start QEMU: {e}")
+            self._mark_start_failed(vm_name)
             raise
         except FileNotFoundError as e:
             logging.error(str(e))
+            self._mark_start_failed(vm_name)
             raise
         except Exception as e:
             logging.error(f"Unexpected error while starting emulator: {str(e)}")
+            self._mark_start_failed(vm_name)
             raise
 
-    def create_dump_file(self, output_path):
+    def attach_emulator(self, vm_name, pid, ports, model=None, disk_path=None, snapshot_tag=None, command=None):
+        """Register a QEMU process started by another process and connect to its QMP monitor"""
+        with self._vms_lock:
+            instance = self._get_or_create_instance(vm_name, model, disk_path)
+            if instance.is_running():
+                return instance
+            process = _AttachedProcess(pid, command)
+            if process.poll() is not None:
+                return instance
+            instance.process = process
+            instance.ports = dict(ports)
+            instance.snapshot_tag = snapshot_tag
+            instance.command = command
+            self._set_state(instance, "starting")
+        self._watch_vm(instance, process)
+        return instance
+
+    def wait_until_ready(self, vm_name=None, timeout=None):
+        """Wait until QMP reports the state of a starting VM, True unless the timeout expired"""
+        instance = self._resolve_vm(vm_name)
+        timeout = timeout if timeout is not None else self.config.get('qmp_connect_timeout', 30)
+        deadline = time.monotonic() + timeout
+        while instance is not None and instance.state == "starting" and instance.is_running():
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(0.05)
+        return True
+
+    def _mark_start_failed(self, vm_name):
+        instance = self.vms.get(vm_name)
+        if instance is not None and not instance.is_running():
+            self._set_state(instance, "stopped")
+
+    def _find_boot_snapshot(self, instance):
+        """Return the saved boot state matching this start, dropping stale ones"""
+        disk_path = self._get_disk_path(instance)
+        try:
+            self.invalidate_snapshots(disk_path, keep_tag=instance.snapshot_tag)
+            if any(snapshot["tag"] == instance.snapshot_tag for snapshot in self.list_snapshots(disk_path)):
+                logging.info(f"Fast start of '{instance.name}' from saved state {instance.snapshot_tag}")
+                return instance.snapshot_tag
+        except RuntimeError as e:
+            logging.warning(f"Could not read saved states of {disk_path}: {str(e)}")
+        logging.info(f"No saved boot state for '{instance.name}', cold booting")
+        return None
+
+    def _get_disk_path(self, instance):
+        vdisk_path = instance.disk_path or self.config.get('qcow2_path') or self.config.get('virtual_disk_path')
+        if not vdisk_path or not os.path.exists(vdisk_path):
+            raise FileNotFoundError("Virtual disk not found. Please create a virtual disk in settings.")
+        instance.disk_path = vdisk_path
+        return vdisk_path
+
+    def _kvm_available(self, architecture):
+        """KVM only helps when the guest architecture matches the host CPU"""
+        host_architecture = HOST_ARCHITECTURES.get(platform.machine().lower())
+        return (sys.platform.startswith("linux") and host_architecture == architecture
+                and os.access("/dev/kvm", os.R_OK | os.W_OK))
+
+    def select_accelerator(self, architecture, cpus=1):
+        """Return (accelerator name, -accel/-cpu/-smp arguments) for a guest"""
+        requested = self.config.get('accelerator', 'auto')
+        host_cpus = os.cpu_count() or 1
+        if cpus > host_cpus:
+            logging.warning(f"{cpus} vCPUs requested but the host only has {host_cpus} CPUs")
+
+        if requested in ('auto', 'kvm') and self._kvm_available(architecture):
+            accelerator = "kvm"
+            args = ["-accel", "kvm", "-cpu", "host"]
+        else:
+            if requested == 'kvm':
+                logging.warning(f"KVM is not available for {architecture} guests on this host, falling back to TCG")
+            accelerator = "tcg"
+            tb_size = self.config.get('tcg_tb_size', 512)
+            args = ["-accel", f"tcg,thread=multi,tb-size={tb_size}",
+                    "-cpu", TCG_CPU_MODELS.get(architecture, "max")]
+
+        args.extend(["-smp", str(max(1, cpus))])
+        return accelerator, args
+
+    def _build_drive_args(self, disk_path, storage=None, index=0, drive_format="qcow2", serial=None):
+        """Return the -object/-drive/-device arguments attaching a disk with a storage profile.
+
+        A serial names the disk in the guest, as /dev/disk/by-id/virtio-<serial> for virtio-blk.
+        """
+        storage = dict(DEFAULT_STORAGE_PROFILE, **(storage or {}))
+        drive_id = f"drive{index}"
+        aio = storage['aio']
+        cache = storage['cache']
+
+        if aio in ("native", "io_uring") and not sys.platform.startswith("linux"):
+            logging.warning(f"aio={aio} is only available on Linux, using aio=threads")
+            aio = "threads"
+        if aio == "native" and cache != "none":
+            # Linux native AIO needs O_DIRECT, which only cache=none provides
+            logging.warning(f"aio=native requires cache=none (got cache={cache}), using aio=threads")
+            aio = "threads"
+
+        drive = f"file={disk_path},format={drive_format},if=none,id={drive_id},cache={cache},aio={aio}"
+        drive += f",discard={storage['discard']}"
+        if storage['discard'] == "unmap":
+            drive += ",detect-zeroes=unmap"
+        if drive_format == "qcow2" and storage.get('l2_cache_size'):
+            drive += f",l2-cache-size={storage['l2_cache_size']}"
+
+        args = []
+        iothread = f"iothread{index}" if storage.get('iothread') else None
+        if iothread:
+            args.extend(["-object", f"iothread,id={iothread}"])
+        args.extend(["-drive", drive])
+
+        serial_arg = f",serial={serial}" if serial else ""
+        if storage['interface'] == "virtio-scsi":
+            controller = f"virtio-scsi-pci,id=scsi{index}" + (f",iothread={iothread}" if iothread else "")
+            args.extend(["-device", controller, "-device", f"scsi-hd,drive={drive_id},bus=scsi{index}.0{serial_arg}"])
+        else:
+            device = f"virtio-blk-pci,drive={drive_id}" + (f",iothread={iothread}" if iothread else "")
+            args.extend(["-device", device + serial_arg])
+        return args
+
+    def _build_command(self, instance, model, memory, kernel_zip, recovery_img, cpus=1, storage=None, loadvm=None,
+                       drives=None):
+        architecture = self.config['samsung_models'].get(model, "arm64")
+        qemu_path = self._get_qemu_path(architecture)
+
+        vdisk_path = self._get_disk_path(instance)
+
+        ports = self._reserve_ports(instance)
+
+        accelerator, accel_args = self.select_accelerator(architecture, cpus)
+        if instance.accelerator != accelerator:
+            logging.info(f"Using {accelerator.upper()} acceleration with {cpus} vCPU(s) for '{instance.name}'")
+            instance.accelerator = accelerator
+
+        kernel, initrd, boot_cmdline = self.resolve_boot_artifacts(kernel_zip, recovery_img)
+
+        cmd = [
+            qemu_path,
+            "-machine", f"type={MACHINE_TYPES.get(architecture, 'virt')}",
+            *accel_args,
+            "-kernel", kernel,
+        ]
+        if initrd:
+            cmd.extend(["-initrd", initrd])
+        cmd += self._build_drive_args(vdisk_path, storage)
+        for index, drive in enumerate(drives or [], start=1):
+            if not os.path.exists(drive['path']):
+                raise FileNotFoundError(f"Partition drive not found: {drive['path']}")
+            cmd += self._build_drive_args(drive['path'], storage, index=index, serial=drive.get('partition'))
+        cmd += [
+            "-m", f"{memory}M" if memory > 0 else "1024M",
+            "-netdev", f"user,id=net0,hostfwd=tcp:127.0.0.1:{ports['adb']}-:5555",
+            "-device", "virtio-net-pci,netdev=net0",
+            "-qmp", f"tcp:127.0.0.1:{ports['qmp']},server=on,wait=off",
+        ]
+
+        # Boot image cmdline first so that the configured kernel parameters can override it
+        kernel_params = " ".join(filter(None, [boot_cmdline, self.config.get('kernel_params')]))
+        if kernel_params:
+            cmd.extend(["-append", kernel_params])
+
+        if loadvm:
+            cmd.extend(["-loadvm", loadvm])
+
+        return cmd
+
+    def resolve_boot_artifacts(self, kernel_zip, recovery_img):
+        """Turn the configured kernel and recovery into the -kernel, -initrd and -append values.
+
+        Kernel zips are reduced to their kernel and Android boot images are unpacked (once per
+        content hash), so QEMU gets the real kernel and ramdisk plus the cmdline from the header.
+        """
+        kernel, initrd, cmdline = kernel_zip, recovery_img, ""
+
+        if kernel and zipfile.is_zipfile(kernel):
+            extracted = os.path.join(self.kernel_dir, f"{os.path.basename(kernel).replace('.zip', '')}_kernel.img")
+            kernel = extracted if os.path.exists(extracted) else self.add_kernel_from_zip(kernel)
+
+        if is_boot_image(kernel):
+            boot = unpack_boot_image(kernel, self.unpacked_dir)
+            if 'kernel' not in boot['files']:
+                raise BootImageError(f"{kernel} is a {boot['kind']} image without a kernel")
+            kernel = boot['files']['kernel']
+            initrd = initrd or boot['files'].get('ramdisk')
+            cmdline = boot['cmdline']
+
+        if is_boot_image(initrd):
+            recovery = unpack_boot_image(initrd, self.unpacked_dir)
+            initrd = recovery['files'].get('ramdisk', initrd)
+            cmdline = cmdline or recovery['cmdline']
+
+        return kernel, initrd, cmdline
+
+    def create_dump_file(self, output_path, vm_name=None):
         """Create a dump file of the current emulator state"""
-        if not self.process:
+        instance = self._resolve_vm(vm_name)
+        if instance is None or not instance.process:
             raise RuntimeError("Emulator is not running. Cannot create dump file.")
 
         try:
@@ -171,26 +994,59 @@ class QEMUController:
         else:
             raise ValueError(f"Unsupported architecture: {architecture}")
 
-    def stop_emulator(self):
-        """Stop the running emulator"""
-        if self.process:
-            self.process.terminate()
-            try:
-                self.process.wait(timeout=5)
-            except subprocess.TimeoutExpired:
-                self.process.kill()
-            self.process = None
-            logging.info("Stopped QEMU emulator")
+    def stop_emulator(self, vm_name=None, timeout=None):
+        """Stop a running emulator (the most recently started one by default)"""
+        instance = self._resolve_vm(vm_name)
+        if instance and instance.process:
+            self._set_state(instance, "stopping")
+            process = instance.process
+            if instance.qmp is not None:
+                # Ask the guest to power down and only kill QEMU if it does not comply
+                timeout = timeout if timeout is not None else self.config.get('powerdown_timeout', 30)
+                try:
+                    self._run_coroutine(instance.qmp.execute('system_powerdown', timeout=5), 5)
+                    process.wait(timeout=timeout)
+                except Exception as e:
+                    logging.warning(f"Graceful powerdown of '{instance.name}' failed, killing QEMU: {str(e)}")
+                    process.kill()
+                    process.wait()
+            else:
+                process.terminate()
+                try:
+                    process.wait(timeout=5)
+                except subprocess.TimeoutExpired:
+                    process.kill()
+            instance.process = None
+            self._set_state(instance, "stopped")
+            logging.info(f"Stopped QEMU emulator '{instance.name}'")
         else:
             logging.warning("No running emulator to stop")
 
+    def submit(self, fn, *args, **kwargs):
+        """Run a controller call on the worker pool and return a Future"""
+        return self._executor.submit(fn, *args, **kwargs)
+
+    def stop_emulator_async(self, vm_name=None):
+        """Stop a VM on the controller's worker pool and return a Future"""
+        return self.submit(self.stop_emulator, vm_name or self._current_vm)
+
+    def stop_all(self, wait=True):
+        """Stop every running VM concurrently"""
+        with self._vms_lock:
+            names = [name for name, instance in self.vms.items() if instance.is_running()]
+        futures = [self.stop_emulator_async(name) for name in names]
+        if wait:
+            for future in futures:
+                future.result()
+        return futures
+
     def get_available_kernels(self):
-        """Get a list of available kernels in the kernels directory"""
-        return [f for f in os.listdir(self.kernel_dir) if f.endswith('.zip')]
+        """Get the names of the kernels in the artifact store"""
+        return sorted(name for entry in self.artifacts.list_artifacts('kernel') for name in entry['names'])
 
     def get_available_recoveries(self):
-        """Get a list of available recovery images in the recovery directory"""
-        return [f for f in os.listdir(self.recovery_dir) if f.endswith('.img')]
+        """Get the names of the recovery images in the artifact store"""
+        return sorted(name for entry in self.artifacts.list_artifacts('recovery') for name in entry['names'])
 
     def validate_kernel(self, kernel_path):
         """Validate that the given file is a valid kernel"""
@@ -207,11 +1063,17 @@ class QEMUController:
 
         # Check file header for common kernel signatures
         try:
+            if is_boot_image(kernel_path):
+                with BootImage(kernel_path) as image:
+                    kernel_size = image.sections.get('kernel', (0, 0))[1]
+                    logging.info(f"Valid Android {image.kind} image v{image.header_version} detected "
+                                 f"(kernel {kernel_size} bytes)")
+                    return image.kind == 'boot' and kernel_size > 0
+
             with open(kernel_path, 'rb') as f:
-                header = f.read(16)
-                # Check for ARM boot header magic
-                if header[0:8] == b'ANDROID!':
-                    logging.info("Valid Android boot image detected")
+                header = f.read(HEADER_SIZE)
+                if header[56:60] == b'ARMd':
+                    logging.info("Valid ARM64 kernel image detected")
                     return True
                 elif header[0x202:0x206] == b'HdrS':
                     logging.info("Valid Linux kernel image detected")
@@ -231,30 +1093,40 @@ class QEMUController:
             qemu_path = os.path.join(self.config['qemu_path'],
                                      "qemu-system-" + architecture + (".exe" if sys.platform == "win32" else ""))
 
+            # Same machine, accelerator and CPU as a real start, so that the test tells whether that would run
+            _, accel_args = self.select_accelerator(architecture)
             cmd = [
                 qemu_path,
-                "-machine", "type=virt",
-                "-cpu", "cortex-a15",
+                "-machine", f"type={MACHINE_TYPES.get(architecture, 'virt')}",
+                *accel_args,
                 "-m", f"{memory}M" if memory > 0 else "1024M",
                 "-nographic",  # Run without GUI for testing
                 "-monitor", "none",
                 "-serial", "none",
-                "-smp", "1",
                 "-boot", "order=c",
             ]
 
             env = os.environ.copy()
             env["GTK_PATH"] = ""
 
-            self.process = subprocess.Popen(cmd, env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
-                                            creationflags=subprocess.CREATE_NO_WINDOW)
+            instance = self._get_or_create_instance(f"{model} (test)", model)
+            if instance.is_running():
+                raise RuntimeError(f"Virtual machine '{instance.name}' is already running")
+            process = subprocess.Popen(cmd, env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                       creationflags=getattr(subprocess, 'CREATE_NO_WINDOW', 0))
+            instance.process = process
+            instance.command = cmd
+            self._current_vm = instance.name
+            self._set_state(instance, "running")
             logging.info(f"Started QEMU emulator in test mode for {model}")
 
             # Wait for a short time to see if the emulator crashes immediately
             try:
-                self.process.wait(timeout=5)
-                stdout, stderr = self.process.communicate()
-                if self.process.returncode != 0:
+                process.wait(timeout=5)
+                stdout, stderr = process.communicate()
+                instance.process = None
+                self._set_state(instance, "stopped" if process.returncode == 0 else "crashed")
+                if process.returncode != 0:
                     raise RuntimeError(f"Emulator test failed. Error: {stderr.decode('utf-8')}")
             except subprocess.TimeoutExpired:
                 # If the process doesn't exit within 5 seconds, we assume it's running fine
@@ -270,59 +1142,53 @@ class QEMUController:
             raise
 
     def add_kernel_from_zip(self, zip_path):
-        """Extract kernel from zip file and add it to the kernels directory"""
+        """Stream the best kernel candidate of a zip file into the kernels directory"""
         try:
+            kernel_name = os.path.basename(zip_path).replace('.zip', '')
+            dest_path = os.path.join(self.kernel_dir, f"{kernel_name}_kernel.img")
             with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-                # Create a temporary directory to extract the contents
-                with tempfile.TemporaryDirectory() as tmpdirname:
-                    zip_ref.extractall(tmpdirname)
-
-                    # Look for kernel file recursively
-                    kernel_file = self._find_kernel_file(tmpdirname)
-
-                    if kernel_file:
-                        kernel_name = os.path.basename(zip_path).replace('.zip', '')
-                        dest_path = os.path.join(self.kernel_dir, f"{kernel_name}_kernel.img")
-                        shutil.copy2(kernel_file, dest_path)
-                        logging.info(f"Kernel extracted and added: {dest_path}")
-                        return dest_path
-                    else:
-                        raise FileNotFoundError("No kernel file found in the zip archive")
+                source = extract_kernel_from_zip(zip_ref, dest_path)
+
+            if source is None:
+                raise FileNotFoundError("No kernel file found in the zip archive")
+            logging.info(f"Kernel {source} extracted and added: {dest_path}")
+            return dest_path
         except Exception as e:
             logging.error(f"Error adding kernel from zip: {str(e)}")
             raise
 
     def _find_kernel_file(self, directory):
-        """Recursively search for a kernel file in the given directory"""
+        """Recursively search for the best ranked kernel file in the given directory"""
+        best_score, best_path = None, None
         for root, _, files in os.walk(directory):
             for file in files:
-                if file == 'kernel' or file.endswith('.img'):
-                    return os.path.join(root, file)
-        return None
+                if name_score(file) is None:
+                    continue
+                path = os.path.join(root, file)
+                with open(path, 'rb') as f:
+                    score = kernel_score(file, f.read(HEADER_SIZE))
+                if score is not None and (best_score is None or score > best_score):
+                    best_score, best_path = score, path
+        return best_path
 
-    def get_command_line(self, model, ui_version, memory, kernel_zip, recovery_img):
-        """Get the command line that would be used to start the emulator"""
-        architecture = self.config['samsung_models'].get(model, "arm64")
-        qemu_path = self._get_qemu_path(architecture)
+    def _thorough_kernel_search(self, directory):
+        """Find a kernel by name first, then by scanning every file for kernel and boot image signatures"""
+        found = self._find_kernel_file(directory)
+        if found:
+            return found
 
-        vdisk_path = self.config.get('qcow2_path') or self.config.get('virtual_disk_path')
-        if not vdisk_path or not os.path.exists(vdisk_path):
-            raise FileNotFoundError("Virtual disk not found. Please create a virtual disk in settings.")
-
-        cmd = [
-            qemu_path,
-            "-machine", "type=virt",
-            "-cpu", "cortex-a15",
-            "-kernel", kernel_zip,
-            "-initrd", recovery_img,
-            "-drive", f"file={vdisk_path},format=qcow2",
-            "-m", f"{memory}M" if memory > 0 else "1024M",
-        ]
-
-        # Add kernel parameters if specified
-        kernel_params = self.config.get('kernel_params')
-        if kernel_params:
-            cmd.extend(["-append", kernel_params])
-
-        return " ".join(cmd)
+        candidates = scan_directory(directory, kinds=KERNEL_KINDS)
+        for candidate in candidates:
+            if candidate.offset == 0:
+                logging.info(f"Kernel candidate found by signature: {candidate.path} ({candidate.kind})")
+                return candidate.path
+        for candidate in candidates[:10]:
+            logging.info(f"Embedded {candidate.kind} candidate in {candidate.path} at offset {candidate.offset:#x}")
+        return None
 
+    def get_command_line(self, vm_name=None):
+        """Command line the VM was started with, None if it was not started by this controller"""
+        instance = self._resolve_vm(vm_name)
+        if instance is None or not instance.command:
+            return None
+        return " ".join(instance.command)
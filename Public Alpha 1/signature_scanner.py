@@ -0,0 +1,162 @@
+import os
+import mmap
+import struct
+import logging
+
+# Each worker maps and searches one chunk at a time
+DEFAULT_CHUNK_SIZE = 64 * 1024 * 1024
+# Below this a file is scanned in-process, starting workers would cost more than the scan
+MIN_PARALLEL_SIZE = 2 * DEFAULT_CHUNK_SIZE
+
+# kind -> (magic, offset of the magic from the start of the candidate, score)
+SIGNATURES = {
+    "android-boot": (b"ANDROID!", 0, 100),
+    "arm64-image": (b"ARMd", 0x38, 90),
+    "zimage": (b"\x18\x28\x6f\x01", 0x24, 80),
+    "bzimage": (b"HdrS", 0x202, 70),
+    "vendor-boot": (b"VNDRBOOT", 0, 60),
+    "gzip": (b"\x1f\x8b\x08", 0, 30),
+    "lz4-legacy": (b"\x02\x21\x4c\x18", 0, 30),
+    "xz": (b"\xfd7zXZ\x00", 0, 30),
+    "lz4": (b"\x04\x22\x4d\x18", 0, 25),
+    "dtb": (b"\xd0\x0d\xfe\xed", 0, 20),
+}
+KERNEL_KINDS = {"android-boot", "arm64-image", "zimage", "bzimage"}
+# Bonus for a candidate that starts a file, as opposed to one found inside a bigger blob
+FILE_START_BONUS = 10
+
+
+def _valid_android_boot(data, offset):
+    header_version = struct.unpack_from("<I", data, offset + 40)[0]
+    if header_version in (3, 4):
+        return True
+    page_size = struct.unpack_from("<I", data, offset + 36)[0]
+    return header_version <= 2 and page_size in (2048, 4096, 8192, 16384)
+
+
+def _valid_arm64_image(data, offset):
+    # text_offset is a multiple of 4 KiB, image_size (0 on old kernels) below 1 GiB
+    text_offset, image_size = struct.unpack_from("<QQ", data, offset + 8)
+    return text_offset % 4096 == 0 and image_size < 1 << 30
+
+
+def _valid_gzip(data, offset):
+    # Reserved flag bits are zero in every real gzip member
+    return data[offset + 3] & 0xE0 == 0
+
+
+def _valid_dtb(data, offset):
+    total_size, = struct.unpack_from(">I", data, offset + 4)
+    version, = struct.unpack_from(">I", data, offset + 20)
+    return 0x38 < total_size < 1 << 24 and 16 <= version <= 17
+
+
+VALIDATORS = {
+    "android-boot": (_valid_android_boot, 48),
+    "arm64-image": (_valid_arm64_image, 24),
+    "gzip": (_valid_gzip, 4),
+    "dtb": (_valid_dtb, 24),
+}
+# Bytes a chunk reads past its end so that signatures straddling the boundary are found
+OVERLAP = max(max(len(magic) + anchor, VALIDATORS.get(kind, (None, 0))[1])
+              for kind, (magic, anchor, _) in SIGNATURES.items())
+
+
+class Candidate:
+    """A signature match: what looks like a `kind` payload at `offset` of `path`"""
+
+    def __init__(self, path, offset, kind, score):
+        self.path = path
+        self.offset = offset
+        self.kind = kind
+        self.score = score
+
+    def to_dict(self):
+        return {"path": self.path, "offset": self.offset, "kind": self.kind, "score": self.score}
+
+    def __repr__(self):
+        return f"Candidate({self.path!r}, {self.offset:#x}, {self.kind!r}, {self.score})"
+
+
+def _scan_chunk(path, start, length, kinds):
+    """Matches (offset, kind) of candidates starting in [start, start + length) of one file"""
+    size = os.path.getsize(path)
+    map_start = start - start % mmap.ALLOCATIONGRANULARITY
+    map_end = min(size, start + length + OVERLAP)
+    matches = []
+    with open(path, "rb") as f:
+        with mmap.mmap(f.fileno(), map_end - map_start, access=mmap.ACCESS_READ, offset=map_start) as mm:
+            if hasattr(mm, "madvise") and hasattr(mmap, "MADV_SEQUENTIAL"):
+                mm.madvise(mmap.MADV_SEQUENTIAL)
+            for kind in kinds:
+                magic, anchor, _ = SIGNATURES[kind]
+                validator, needed = VALIDATORS.get(kind, (None, 0))
+                # Search positions of the magic whose candidate start falls inside this chunk, the last
+                # of which ends len(magic) - 1 bytes into the overlap
+                end = start + length + anchor + len(magic) - 1 - map_start
+                position = mm.find(magic, start + anchor - map_start, end)
+                while position >= 0:
+                    offset = position - anchor
+                    if validator is None or (offset + needed <= len(mm) and validator(mm, offset)):
+                        matches.append((offset + map_start, kind))
+                    position = mm.find(magic, position + 1, end)
+    return matches
+
+
+def _tasks(paths, chunk_size):
+    for path in paths:
+        size = os.path.getsize(path)
+        for start in range(0, size, chunk_size):
+            yield path, start, min(chunk_size, size - start)
+
+
+def _rank(path, matches):
+    candidates = []
+    for offset, kind in matches:
+        score = SIGNATURES[kind][2] + (FILE_START_BONUS if offset == 0 else 0)
+        candidates.append(Candidate(path, offset, kind, score))
+    return candidates
+
+
+def scan_files(paths, kinds=None, chunk_size=DEFAULT_CHUNK_SIZE, max_workers=None):
+    """Search files for kernel, boot image, compression and DTB signatures.
+
+    Files are split into chunks searched in worker processes, each through its own mmap window,
+    so big raw dumps keep every core and the disk busy. Returns the candidates, best first.
+    """
+    kinds = sorted(kinds or SIGNATURES)
+    paths = [path for path in paths if os.path.isfile(path)]
+    tasks = list(_tasks(paths, chunk_size))
+    candidates = []
+
+    if sum(length for _, _, length in tasks) < MIN_PARALLEL_SIZE or max_workers == 1:
+        for path, start, length in tasks:
+            try:
+                candidates.extend(_rank(path, _scan_chunk(path, start, length, kinds)))
+            except OSError as e:
+                logging.warning(f"Could not scan {path}: {str(e)}")
+    else:
+        # Imported here as it pulls in multiprocessing, which small scans and startup do without
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            futures = [(path, executor.submit(_scan_chunk, path, start, length, kinds))
+                       for path, start, length in tasks]
+            for path, future in futures:
+                try:
+                    candidates.extend(_rank(path, future.result()))
+                except OSError as e:
+                    logging.warning(f"Could not scan {path}: {str(e)}")
+
+    candidates.sort(key=lambda c: (-c.score, c.path, c.offset))
+    return candidates
+
+
+def scan_directory(directory, kinds=None, chunk_size=DEFAULT_CHUNK_SIZE, max_workers=None):
+    """scan_files over every regular file below directory"""
+    paths = []
+    for root, _, files in os.walk(directory):
+        for file in files:
+            path = os.path.join(root, file)
+            if not os.path.islink(path):
+                paths.append(path)
+    return scan_files(paths, kinds, chunk_size, max_workers)
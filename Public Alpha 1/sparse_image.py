@@ -0,0 +1,373 @@
+import os
+import zlib
+import struct
+import logging
+from qcow2 import Qcow2Writer
+
+SPARSE_MAGIC = 0xED26FF3A
+SPARSE_MAJOR_VERSION = 1
+CHUNK_TYPE_RAW = 0xCAC1
+CHUNK_TYPE_FILL = 0xCAC2
+CHUNK_TYPE_DONT_CARE = 0xCAC3
+CHUNK_TYPE_CRC32 = 0xCAC4
+# Largest piece of RAW data or expanded FILL data held in memory at once
+COPY_BUFFER_SIZE = 1024 * 1024
+OUTPUT_FORMATS = ["raw", "qcow2"]
+
+# Layouts from AOSP system/core/libsparse/sparse_format.h
+_HEADER = struct.Struct("<IHHHHIIII")
+_CHUNK_HEADER = struct.Struct("<HHII")
+
+
+class SparseImageError(ValueError):
+    pass
+
+
+def _gf2_times(matrix, vector):
+    total, row = 0, 0
+    while vector:
+        if vector & 1:
+            total ^= matrix[row]
+        vector >>= 1
+        row += 1
+    return total
+
+
+def _zero_operators():
+    """CRC-32 register transforms for 2**n zero bytes, as in zlib's crc32_combine"""
+    # One zero bit
+    operator = [0xEDB88320] + [1 << row for row in range(31)]
+    for _ in range(3):
+        operator = [_gf2_times(operator, column) for column in operator]
+    operators = [operator]
+    for _ in range(63):
+        operators.append([_gf2_times(operators[-1], column) for column in operators[-1]])
+    return operators
+
+
+_ZERO_OPERATORS = None
+
+
+def crc32_zeros(crc, length):
+    """zlib.crc32(bytes(length), crc) without touching length bytes"""
+    global _ZERO_OPERATORS
+    if _ZERO_OPERATORS is None:
+        _ZERO_OPERATORS = _zero_operators()
+    register = crc ^ 0xFFFFFFFF
+    power = 0
+    while length:
+        if length & 1:
+            register = _gf2_times(_ZERO_OPERATORS[power], register)
+        length >>= 1
+        power += 1
+    return register ^ 0xFFFFFFFF
+
+
+def is_sparse_image(path):
+    """True if the file starts with the Android sparse image magic"""
+    try:
+        with open(path, "rb") as f:
+            header = f.read(4)
+    except (OSError, TypeError):
+        return False
+    return len(header) == 4 and struct.unpack("<I", header)[0] == SPARSE_MAGIC
+
+
+class SparseImageReader:
+    """Streams an Android sparse image from a file object, reading it once from front to back.
+
+    Iterating yields (offset, length, data) pieces of the expanded image in order: data is the
+    bytes of a RAW piece, the 4 byte pattern of a FILL chunk, or None for a DONT_CARE hole.
+    With verify, the CRC-32 of the expanded image is computed on the way and checked against
+    CRC32 chunks and the header checksum.
+    """
+
+    def __init__(self, f, verify=True):
+        self._file = f
+        self.verify = verify
+        header = self._read_exact(_HEADER.size)
+        (magic, major, _, header_size, chunk_header_size, self.block_size, self.total_blocks, self.total_chunks,
+         self.checksum) = _HEADER.unpack(header)
+        if magic != SPARSE_MAGIC:
+            raise SparseImageError("Not an Android sparse image")
+        if major != SPARSE_MAJOR_VERSION:
+            raise SparseImageError(f"Unsupported sparse image version {major}")
+        if header_size < _HEADER.size or chunk_header_size < _CHUNK_HEADER.size:
+            raise SparseImageError("Invalid sparse image header")
+        if not self.block_size or self.block_size % 4:
+            raise SparseImageError(f"Invalid sparse image block size {self.block_size}")
+        self._chunk_header_size = chunk_header_size
+        self._skip(header_size - _HEADER.size)
+        self.size = self.total_blocks * self.block_size
+        self.crc = 0
+
+    def _read_exact(self, length):
+        data = self._file.read(length)
+        if len(data) != length:
+            raise SparseImageError("Sparse image is truncated")
+        return data
+
+    def _skip(self, length):
+        while length > 0:
+            length -= len(self._read_exact(min(length, COPY_BUFFER_SIZE)))
+
+    def __iter__(self):
+        offset = 0
+        for _ in range(self.total_chunks):
+            chunk_type, _, blocks, total_size = _CHUNK_HEADER.unpack(self._read_exact(_CHUNK_HEADER.size))
+            self._skip(self._chunk_header_size - _CHUNK_HEADER.size)
+            payload_size = total_size - self._chunk_header_size
+            length = blocks * self.block_size
+            if chunk_type != CHUNK_TYPE_CRC32 and offset + length > self.size:
+                raise SparseImageError("Sparse image chunks run past the image size")
+
+            if chunk_type == CHUNK_TYPE_RAW:
+                if payload_size != length:
+                    raise SparseImageError(f"RAW chunk at {offset} has {payload_size} bytes for {length}")
+                end = offset + length
+                while offset < end:
+                    data = self._read_exact(min(end - offset, COPY_BUFFER_SIZE))
+                    if self.verify:
+                        self.crc = zlib.crc32(data, self.crc)
+                    yield offset, len(data), data
+                    offset += len(data)
+            elif chunk_type == CHUNK_TYPE_FILL:
+                if payload_size != 4:
+                    raise SparseImageError(f"FILL chunk at {offset} has a {payload_size} byte pattern")
+                pattern = self._read_exact(4)
+                if self.verify:
+                    self.crc = self._fill_crc(self.crc, pattern, length)
+                yield offset, length, pattern
+                offset += length
+            elif chunk_type == CHUNK_TYPE_DONT_CARE:
+                self._skip(payload_size)
+                if self.verify:
+                    self.crc = crc32_zeros(self.crc, length)
+                yield offset, length, None
+                offset += length
+            elif chunk_type == CHUNK_TYPE_CRC32:
+                expected = struct.unpack("<I", self._read_exact(4))[0]
+                self._skip(payload_size - 4)
+                if self.verify and expected != self.crc:
+                    raise SparseImageError(f"CRC mismatch at offset {offset}: {self.crc:08x} != {expected:08x}")
+            else:
+                raise SparseImageError(f"Unknown sparse chunk type {chunk_type:#x} at offset {offset}")
+
+        if offset != self.size:
+            raise SparseImageError(f"Sparse image chunks cover {offset} of {self.size} bytes")
+        if self.verify and self.checksum and self.checksum != self.crc:
+            raise SparseImageError(f"Image checksum mismatch: {self.crc:08x} != {self.checksum:08x}")
+
+    @staticmethod
+    def _fill_crc(crc, pattern, length):
+        if pattern == bytes(4):
+            return crc32_zeros(crc, length)
+        for piece in _expand_fill(pattern, length):
+            crc = zlib.crc32(piece, crc)
+        return crc
+
+
+def _expand_fill(pattern, length):
+    """Pieces of at most COPY_BUFFER_SIZE bytes making up a FILL chunk"""
+    buffer = pattern * (min(length, COPY_BUFFER_SIZE) // 4)
+    while length:
+        piece = min(length, len(buffer))
+        yield buffer if piece == len(buffer) else buffer[:piece]
+        length -= piece
+
+
+def _raw_pieces(f, size=None):
+    """(offset, length, data) pieces of a raw image, in the same form as SparseImageReader.
+
+    Without a size, the image is whatever the file object holds up to its end.
+    """
+    offset = 0
+    while size is None or offset < size:
+        data = f.read(COPY_BUFFER_SIZE if size is None else min(size - offset, COPY_BUFFER_SIZE))
+        if not data:
+            if size is None:
+                return
+            raise SparseImageError(f"Image ended at {offset} of {size} bytes")
+        yield offset, len(data), data
+        offset += len(data)
+
+
+class _PrefixedReader:
+    """File object reading some already consumed bytes before the rest of another file object"""
+
+    def __init__(self, prefix, f):
+        self._prefix = prefix
+        self._file = f
+
+    def read(self, size=-1):
+        if not self._prefix:
+            return self._file.read(size)
+        if size is None or size < 0:
+            data, self._prefix = self._prefix + self._file.read(), b""
+            return data
+        data, self._prefix = self._prefix[:size], self._prefix[size:]
+        if len(data) < size:
+            data += self._file.read(size - len(data))
+        return data
+
+
+def _extent_pieces(view):
+    """(offset, length, data) pieces of an ExtentFile, its unmapped ranges and holes left out without reading them"""
+    for start, length in view.data_ranges():
+        end = start + length
+        while start < end:
+            data = view.read_at(start, min(end - start, COPY_BUFFER_SIZE))
+            yield start, len(data), data
+            start += len(data)
+
+
+def _write_raw(pieces, size, output_path):
+    """Write the expanded image leaving holes for DONT_CARE and zero-filled ranges, returns its size"""
+    end = 0
+    with open(output_path, "wb") as out:
+        for offset, length, data in pieces:
+            end = offset + length
+            if data is None:
+                continue
+            if len(data) == length:
+                out.seek(offset)
+                out.write(data)
+            elif data != bytes(4):
+                out.seek(offset)
+                for piece in _expand_fill(data, length):
+                    out.write(piece)
+        size = end if size is None else size
+        out.truncate(size)
+    return size
+
+
+def _write_qcow2(pieces, size, output_path, cluster_size):
+    with Qcow2Writer(output_path, size, cluster_size) as writer:
+        for offset, length, data in pieces:
+            if data is None:
+                continue
+            if len(data) == length:
+                writer.write(offset, data)
+            elif data != bytes(4):
+                for piece in _expand_fill(data, length):
+                    writer.write(offset, piece)
+                    offset += len(piece)
+    return writer.size, writer.data_clusters * writer.cluster_size
+
+
+def _write(pieces, size, output_path, output_format, cluster_size):
+    """Write the pieces in the output format, returns the image size and the allocated bytes of a qcow2"""
+    if output_format == "qcow2":
+        return _write_qcow2(pieces, size, output_path, cluster_size)
+    return _write_raw(pieces, size, output_path), None
+
+
+def _remove_output(output_path):
+    if os.path.exists(output_path):
+        os.remove(output_path)
+
+
+def convert_stream(f, output_path, output_format="raw", size=None, cluster_size=None, verify=True, name=None):
+    """Convert a sparse or raw image read front to back from a file object, which need not be seekable.
+
+    This is how images are converted while they are being decompressed out of an archive. A raw
+    image ends at the given size, or where the file object ends. Returns a summary of the
+    conversion, the partial output is removed if it fails.
+    """
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f"Unsupported output format: {output_format}")
+    try:
+        header = f.read(_HEADER.size)
+        sparse = len(header) >= 4 and struct.unpack_from("<I", header)[0] == SPARSE_MAGIC
+        f = _PrefixedReader(header, f)
+        if sparse:
+            reader = SparseImageReader(f, verify)
+            size, pieces = reader.size, iter(reader)
+        else:
+            pieces = _raw_pieces(f, size)
+        size, allocated = _write(pieces, size, output_path, output_format, cluster_size)
+    except BaseException:
+        _remove_output(output_path)
+        raise
+    logging.info(f"Converted {name or 'image stream'} to {output_format} image {output_path}")
+    return {
+        "source": name,
+        "output": output_path,
+        "format": output_format,
+        "sparse": sparse,
+        "size": size,
+        "allocated": allocated,
+        "crc32": f"{reader.crc:08x}" if sparse and verify else None,
+    }
+
+
+def convert_image(source, output_path, output_format="raw", cluster_size=None, verify=True):
+    """Convert an Android sparse image (or a plain raw image) in one sequential pass.
+
+    The source may also be an ExtentFile, such as a logical partition of a super image, whose
+    unmapped ranges are not read at all; neither are the holes of a raw image. The output is a raw file with holes where the image has
+    none of its data, or a qcow2 image whose clusters are only allocated for non-zero data.
+    Returns a summary of the conversion.
+    """
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f"Unsupported output format: {output_format}")
+    if isinstance(source, (str, os.PathLike)):
+        size = os.path.getsize(source)
+        if is_sparse_image(source) or not size:
+            with open(source, "rb") as f:
+                return convert_stream(f, output_path, output_format, size, cluster_size, verify, os.fspath(source))
+        # Raw images are read through a map of the file, so that the holes of a sparse file are skipped
+        from fs_image import ExtentFile, MmapSource
+        with ExtentFile(MmapSource(os.fspath(source)), [(0, 0, size)], size, owns_source=True) as view:
+            return convert_image(view, output_path, output_format, cluster_size, verify)
+
+    name = f"{source.path}:{source.partition}" if getattr(source, "partition", None) else source.path
+    try:
+        size, allocated = _write(_extent_pieces(source), source.size, output_path, output_format, cluster_size)
+    except BaseException:
+        _remove_output(output_path)
+        raise
+    logging.info(f"Converted {name} to {output_format} image {output_path}")
+    return {
+        "source": name,
+        "output": output_path,
+        "format": output_format,
+        "sparse": False,
+        "size": size,
+        "allocated": allocated,
+        "crc32": None,
+    }
+
+
+def open_sparse_image(path):
+    """Read-only ExtentFile of the expanded image, mapping RAW chunks onto the sparse file itself.
+
+    Only the chunk headers are read.
+    """
+    from fs_image import ExtentFile, MmapSource
+
+    source = MmapSource(path)
+    try:
+        (magic, major, _, header_size, chunk_header_size, block_size, total_blocks, total_chunks,
+         _) = _HEADER.unpack(source.read_at(0, _HEADER.size))
+        if magic != SPARSE_MAGIC or major != SPARSE_MAJOR_VERSION:
+            raise SparseImageError(f"Not an Android sparse image: {path}")
+        extents, offset, position = [], 0, header_size
+        for _ in range(total_chunks):
+            chunk_type, _, blocks, total_size = _CHUNK_HEADER.unpack(source.read_at(position, _CHUNK_HEADER.size))
+            length = blocks * block_size
+            if chunk_type == CHUNK_TYPE_RAW:
+                extents.append((offset, position + chunk_header_size, length))
+            elif chunk_type == CHUNK_TYPE_FILL:
+                pattern = source.read_at(position + chunk_header_size, 4)
+                if pattern != bytes(4):
+                    extents.append((offset, pattern, length))
+            elif chunk_type not in (CHUNK_TYPE_DONT_CARE, CHUNK_TYPE_CRC32):
+                raise SparseImageError(f"Unknown sparse chunk type {chunk_type:#x} in {path}")
+            if chunk_type != CHUNK_TYPE_CRC32:
+                offset += length
+            position += total_size
+    except (struct.error, SparseImageError):
+        source.close()
+        raise
+    return ExtentFile(source, extents, total_blocks * block_size, owns_source=True)
@@ -0,0 +1,111 @@
+import sys
+import time
+import threading
+import importlib.abc
+from contextlib import contextmanager
+
+
+class _TimedLoader(importlib.abc.Loader):
+    """Wraps a module loader to time the execution of the module body"""
+
+    def __init__(self, loader, profiler):
+        self._loader = loader
+        self._profiler = profiler
+
+    def __getattr__(self, name):
+        return getattr(self._loader, name)
+
+    def create_module(self, spec):
+        return self._loader.create_module(spec)
+
+    def exec_module(self, module):
+        self._profiler._time_import(module.__name__, lambda: self._loader.exec_module(module))
+
+
+class _ImportTimer(importlib.abc.MetaPathFinder):
+    """Finds modules through the other finders and hands back specs with timed loaders"""
+
+    def __init__(self, profiler):
+        self._profiler = profiler
+
+    def find_spec(self, name, path, target=None):
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, "find_spec"):
+                continue
+            spec = finder.find_spec(name, path, target)
+            if spec is not None:
+                if spec.loader is not None and hasattr(spec.loader, "exec_module"):
+                    spec.loader = _TimedLoader(spec.loader, self._profiler)
+                return spec
+        return None
+
+
+class StartupProfiler:
+    """Collects startup phase timings and per-module import times while enabled"""
+
+    def __init__(self):
+        self.enabled = False
+        self.phases = []
+        # module -> (cumulative seconds, seconds spent in the module body itself)
+        self.imports = {}
+        self._started = None
+        self._finder = None
+        self._local = threading.local()
+
+    def enable(self):
+        if self.enabled:
+            return
+        self.enabled = True
+        self._started = time.perf_counter()
+        self._finder = _ImportTimer(self)
+        sys.meta_path.insert(0, self._finder)
+
+    def disable(self):
+        if self._finder in sys.meta_path:
+            sys.meta_path.remove(self._finder)
+        self.enabled = False
+
+    @contextmanager
+    def phase(self, name):
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases.append((name, time.perf_counter() - start))
+
+    def record(self, name, seconds):
+        if self.enabled:
+            self.phases.append((name, seconds))
+
+    def _time_import(self, name, execute):
+        stack = self._local.__dict__.setdefault("stack", [])
+        start = time.perf_counter()
+        stack.append(0.0)
+        try:
+            execute()
+        finally:
+            elapsed = time.perf_counter() - start
+            children = stack.pop()
+            if stack:
+                stack[-1] += elapsed
+            self.imports[name] = (elapsed, elapsed - children)
+
+    def report(self, top=15):
+        lines = ["Startup profile (ms):"]
+        for name, seconds in self.phases:
+            lines.append(f"  {name:<40}{seconds * 1000:10.1f}")
+        if self._started is not None:
+            lines.append(f"  {'total since profiling started':<40}{(time.perf_counter() - self._started) * 1000:10.1f}")
+        lines.append(f"Slowest imports of {len(self.imports)} (self / cumulative ms):")
+        for name, (cumulative, own) in sorted(self.imports.items(), key=lambda item: -item[1][1])[:top]:
+            lines.append(f"  {name:<40}{own * 1000:10.1f}{cumulative * 1000:10.1f}")
+        return "\n".join(lines)
+
+    def print_report(self, top=15):
+        print(self.report(top), file=sys.stderr)
+
+
+PROFILER = StartupProfiler()
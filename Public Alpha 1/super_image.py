@@ -0,0 +1,213 @@
+import os
+import struct
+import hashlib
+import logging
+from fs_image import ExtentFile, MmapSource, FilesystemImageError
+from sparse_image import is_sparse_image, open_sparse_image, SparseImageError
+
+# Layouts from AOSP system/core/fs_mgr/liblp/include/liblp/metadata_format.h
+LP_PARTITION_RESERVED_BYTES = 4096
+LP_METADATA_GEOMETRY_MAGIC = 0x616C4467
+LP_METADATA_GEOMETRY_SIZE = 4096
+LP_METADATA_HEADER_MAGIC = 0x414C5030
+LP_METADATA_MAJOR_VERSION = 10
+LP_SECTOR_SIZE = 512
+LP_TARGET_TYPE_LINEAR = 0
+LP_TARGET_TYPE_ZERO = 1
+LP_PARTITION_ATTR_READONLY = 0x1
+LP_PARTITION_ATTR_SLOT_SUFFIXED = 0x2
+LP_PARTITION_ATTR_UPDATED = 0x4
+LP_PARTITION_ATTR_DISABLED = 0x8
+# Slot suffixes tried, in order, when a partition is looked up without one
+SLOT_SUFFIXES = ["_a", "_b"]
+
+_GEOMETRY = struct.Struct("<II32sIII")
+_HEADER = struct.Struct("<IHHI32sI32sIIIIIIIIIIII")
+_PARTITION = struct.Struct("<36sIIII")
+_EXTENT = struct.Struct("<QIQI")
+_GROUP = struct.Struct("<36sIQ")
+_BLOCK_DEVICE = struct.Struct("<QIIQ36sI")
+
+
+class SuperImageError(ValueError):
+    pass
+
+
+def _name(raw):
+    return raw.split(b"\x00", 1)[0].decode("ascii", "replace")
+
+
+def _checksum(data, offset):
+    """sha256 of a metadata structure with its own 32 byte checksum at offset zeroed"""
+    return hashlib.sha256(data[:offset] + bytes(32) + data[offset + 32:]).digest()
+
+
+class LogicalPartition:
+    def __init__(self, name, attributes, group, extents):
+        self.name = name
+        self.attributes = attributes
+        self.group = group
+        # (partition offset, super image offset or None for zeros, length)
+        self.extents = extents
+        self.size = sum(length for _, _, length in extents)
+
+    @property
+    def readonly(self):
+        return bool(self.attributes & LP_PARTITION_ATTR_READONLY)
+
+    def __repr__(self):
+        return f"LogicalPartition({self.name!r}, size={self.size})"
+
+
+class SuperImage:
+    """Logical partitions of a dynamic-partition super image, read from its LP metadata.
+
+    Each partition opens as an ExtentFile over the super image itself, so nothing is copied out.
+    The source is a path to a raw or Android sparse super image, or an object with read_at().
+    """
+
+    def __init__(self, source, metadata_slot=0, owns_source=False):
+        if isinstance(source, (str, os.PathLike)):
+            path = os.fspath(source)
+            try:
+                self._source = open_sparse_image(path) if is_sparse_image(path) else MmapSource(path)
+            except (SparseImageError, FilesystemImageError) as e:
+                raise SuperImageError(str(e))
+            self._owns_source = True
+        else:
+            self._source = source
+            self._owns_source = owns_source
+        self.path = getattr(self._source, "path", None)
+        self.partitions = {}
+        self.groups = []
+        self.block_devices = []
+        try:
+            self._parse(metadata_slot)
+        except (struct.error, SuperImageError):
+            self.close()
+            raise
+
+    def _read(self, offset, length):
+        data = self._source.read_at(offset, length)
+        if len(data) < length:
+            raise SuperImageError(f"Super image is truncated at offset {offset}")
+        return data
+
+    def _geometry(self):
+        # The primary copy is followed by a backup
+        for offset in (LP_PARTITION_RESERVED_BYTES, LP_PARTITION_RESERVED_BYTES + LP_METADATA_GEOMETRY_SIZE):
+            data = self._read(offset, _GEOMETRY.size)
+            magic, struct_size, checksum, max_size, slot_count, block_size = _GEOMETRY.unpack(data)
+            if magic != LP_METADATA_GEOMETRY_MAGIC or struct_size != _GEOMETRY.size:
+                continue
+            if _checksum(data, 8) != checksum:
+                logging.warning(f"Super image geometry at {offset} has a bad checksum")
+                continue
+            return max_size, slot_count, block_size
+        raise SuperImageError("No valid LP metadata geometry, not a super image")
+
+    def _parse(self, metadata_slot):
+        max_size, slot_count, self.block_size = self._geometry()
+        if not 0 <= metadata_slot < slot_count:
+            raise SuperImageError(f"Metadata slot {metadata_slot} out of range (super image has {slot_count})")
+        metadata_start = LP_PARTITION_RESERVED_BYTES + 2 * LP_METADATA_GEOMETRY_SIZE
+        errors = []
+        # Primary metadata slots come first, then their backups
+        for offset in (metadata_start + metadata_slot * max_size,
+                       metadata_start + (slot_count + metadata_slot) * max_size):
+            try:
+                self._parse_metadata(offset, max_size)
+                return
+            except SuperImageError as e:
+                errors.append(str(e))
+                logging.warning(f"Super image metadata at {offset}: {str(e)}")
+        raise SuperImageError(f"No valid LP metadata: {'; '.join(errors)}")
+
+    def _parse_metadata(self, offset, max_size):
+        header = self._read(offset, _HEADER.size)
+        (magic, major, minor, header_size, header_checksum, tables_size, tables_checksum,
+         *descriptors) = _HEADER.unpack(header)
+        if magic != LP_METADATA_HEADER_MAGIC:
+            raise SuperImageError("bad header magic")
+        if major != LP_METADATA_MAJOR_VERSION:
+            raise SuperImageError(f"unsupported metadata version {major}.{minor}")
+        if header_size < _HEADER.size or header_size + tables_size > max_size:
+            raise SuperImageError("invalid header or table size")
+        header = self._read(offset, header_size)
+        if _checksum(header, 12) != header_checksum:
+            raise SuperImageError("header checksum mismatch")
+        tables = self._read(offset + header_size, tables_size)
+        if hashlib.sha256(tables).digest() != tables_checksum:
+            raise SuperImageError("tables checksum mismatch")
+
+        def table(index, layout):
+            table_offset, count, entry_size = descriptors[3 * index:3 * index + 3]
+            if entry_size < layout.size or table_offset + count * entry_size > tables_size:
+                raise SuperImageError("table runs past the metadata")
+            return [layout.unpack_from(tables, table_offset + number * entry_size) for number in range(count)]
+
+        partitions, extents, groups, block_devices = (table(0, _PARTITION), table(1, _EXTENT), table(2, _GROUP),
+                                                      table(3, _BLOCK_DEVICE))
+        self.groups = [_name(name) for name, _, _ in groups]
+        self.block_devices = [{"name": _name(name), "size": size, "first_logical_sector": first_sector}
+                              for first_sector, _, _, size, name, _ in block_devices]
+        self.partitions = {}
+        for name, attributes, first_extent, extent_count, group_index in partitions:
+            name = _name(name)
+            mapped, position = [], 0
+            for sectors, target_type, target_data, target_source in extents[first_extent:first_extent + extent_count]:
+                length = sectors * LP_SECTOR_SIZE
+                if target_type == LP_TARGET_TYPE_LINEAR:
+                    if target_source != 0:
+                        # Retrofit devices spread partitions over several block devices
+                        raise SuperImageError(f"{name} has extents on block device {target_source}, "
+                                              f"outside the super image")
+                    mapped.append((position, target_data * LP_SECTOR_SIZE, length))
+                elif target_type == LP_TARGET_TYPE_ZERO:
+                    mapped.append((position, None, length))
+                else:
+                    raise SuperImageError(f"{name} has an extent of unknown type {target_type}")
+                position += length
+            group = self.groups[group_index] if group_index < len(self.groups) else None
+            self.partitions[name] = LogicalPartition(name, attributes, group, mapped)
+
+    def partition(self, name):
+        """Logical partition by name, also found without its slot suffix; None if there is none"""
+        if name in self.partitions:
+            return self.partitions[name]
+        # An A/B super image has system_a and system_b, of which only the active one has extents
+        candidates = [self.partitions[name + suffix] for suffix in SLOT_SUFFIXES if name + suffix in self.partitions]
+        return next((candidate for candidate in candidates if candidate.size), None)
+
+    def __contains__(self, name):
+        return self.partition(name) is not None
+
+    def open(self, name):
+        """Read-only file of a logical partition, mapped onto the super image"""
+        partition = self.partition(name)
+        if partition is None:
+            raise FileNotFoundError(f"No logical partition {name} in {self.path}")
+        view = ExtentFile(self._source, [extent for extent in partition.extents if extent[1] is not None],
+                          partition.size)
+        view.partition = partition.name
+        return view
+
+    def close(self):
+        if self._owns_source and self._source is not None:
+            self._source.close()
+        self._source = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def is_super_image(path):
+    """True for a raw or sparse image carrying LP metadata"""
+    try:
+        with SuperImage(path):
+            return True
+    except (OSError, ValueError):
+        return False
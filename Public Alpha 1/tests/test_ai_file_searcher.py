@@ -0,0 +1,74 @@
+import os
+import gzip
+import struct
+import tempfile
+import unittest
+from unittest.mock import patch
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+ARM64_HEADER = struct.pack("<IIQQQQQQ", 0, 0, 0x80000, 0x1000000, 0xA, 0, 0, 0) + b"ARMd" + b"\x00" * 4
+
+
+@unittest.skipIf(np is None, "numpy not installed")
+class TestAIFileSearcher(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.write('system/build.prop', b"ro.product.model=SM-G973F\n" * 2000)
+        self.write('system/lib/libfoo.so', b"\x7fELF" + os.urandom(200000))
+        self.write('empty', b"")
+        self.kernel = self.write('boot/Image', ARM64_HEADER + os.urandom(1500000) + b"Linux version 4.14.113\n")
+        self.compressed = self.write('boot/Image.gz', gzip.compress(ARM64_HEADER + os.urandom(1500000)))
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def write(self, relative_path, data):
+        path = os.path.join(self.tmpdir.name, relative_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(data)
+        return path
+
+    def test_features_are_batched(self):
+        from ai_file_searcher import FEATURE_NAMES, extract_features
+
+        features = extract_features([self.kernel, os.path.join(self.tmpdir.name, 'empty')])
+
+        self.assertEqual(features.shape, (2, len(FEATURE_NAMES)))
+        row = dict(zip(FEATURE_NAMES, features[0]))
+        self.assertEqual(row['magic_arm64-image'], 1)
+        self.assertEqual(row['kernel_size_range'], 1)
+        self.assertGreater(row['entropy_mean'], 0.9)
+        self.assertFalse(features[1].any())
+
+    def test_search_ranks_kernels_first(self):
+        from ai_file_searcher import AIFileSearcher
+
+        searcher = AIFileSearcher(self.tmpdir.name, batch_size=2)
+        walked = [os.path.join(root, file) for root, _, files in os.walk(self.tmpdir.name) for file in files]
+        ranked = [path for path, _ in searcher.rank_files(walked)]
+
+        self.assertEqual(ranked, [self.kernel, self.compressed])
+        self.assertEqual(searcher.search_kernel_file(), self.kernel)
+
+    def test_model_is_loaded_lazily_and_results_stream(self):
+        from ai_file_searcher import AIFileSearcher, KernelClassifier
+
+        with patch.object(KernelClassifier, 'load', wraps=KernelClassifier.load) as mock_load:
+            searcher = AIFileSearcher(self.tmpdir.name, batch_size=1, max_workers=2)
+            mock_load.assert_not_called()
+
+            candidates = searcher.iter_candidates(paths=[self.kernel, self.compressed, self.kernel])
+            self.assertEqual(next(candidates)[0], self.kernel)
+            candidates.close()
+            searcher.search_kernel_file()
+
+        mock_load.assert_called_once()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+from analysis_cache import AnalysisCache
+from dump_analyzer import DumpAnalyzer
+
+
+class TestAnalysisCache(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.cache = AnalysisCache(':memory:', max_entries=3)
+        self.path = self.write_file('build.prop', "ro.product.model=SM-G973F\n")
+
+    def tearDown(self):
+        self.cache.close()
+        self.tmpdir.cleanup()
+
+    def write_file(self, name, content):
+        path = os.path.join(self.tmpdir.name, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as f:
+            f.write(content)
+        return path
+
+    def test_hit_until_file_or_version_changes(self):
+        self.cache.put(self.path, 'model', 1, {'model': 'SM-G973F'})
+
+        self.assertEqual(self.cache.get(self.path, 'model', 1), (True, {'model': 'SM-G973F'}))
+        self.assertFalse(self.cache.get(self.path, 'model', 2)[0])
+
+        with open(self.path, 'a') as f:
+            f.write("ro.product.brand=samsung\n")
+        self.assertFalse(self.cache.get(self.path, 'model', 1)[0])
+
+    def test_invalidate_directory_tree(self):
+        other = self.write_file(os.path.join('vendor', 'build.prop'), "ro.x=1\n")
+        self.cache.put(self.path, 'model', 1, 'a')
+        self.cache.put(other, 'model', 1, 'b')
+
+        self.assertEqual(self.cache.invalidate(os.path.join(self.tmpdir.name, 'vendor')), 1)
+        self.assertTrue(self.cache.get(self.path, 'model', 1)[0])
+        self.assertFalse(self.cache.get(other, 'model', 1)[0])
+
+    def test_evicts_least_recently_used(self):
+        paths = [self.write_file(f"file{i}", str(i)) for i in range(4)]
+        for path in paths[:3]:
+            self.cache.put(path, 'detector', 1, path)
+        self.cache.get(paths[0], 'detector', 1)
+
+        self.cache.put(paths[3], 'detector', 1, paths[3])
+
+        self.assertEqual(len(self.cache), 3)
+        self.assertTrue(self.cache.get(paths[0], 'detector', 1)[0])
+        self.assertFalse(self.cache.get(paths[1], 'detector', 1)[0])
+
+    def test_unchanged_dump_is_not_parsed_again(self):
+        self.write_file(os.path.join('system', 'build.prop'), "ro.product.model=SM-G973F\n"
+                                                             "ro.product.manufacturer=samsung\n")
+        DumpAnalyzer(self.tmpdir.name, cache=self.cache)._detect_device_model()
+
+        with patch('build_prop.parse_prop_file') as mock_parse:
+            device_model = DumpAnalyzer(self.tmpdir.name, cache=self.cache)._detect_device_model()
+
+        mock_parse.assert_not_called()
+        self.assertEqual(device_model.model, 'SM-G973F')
+
+
+if __name__ == '__main__':
+    unittest.main()
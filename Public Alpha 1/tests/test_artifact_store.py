@@ -0,0 +1,93 @@
+import os
+import hashlib
+import tempfile
+import unittest
+from unittest.mock import patch
+from artifact_store import ArtifactStore, link_or_copy
+from qemu_controller import QEMUController
+
+ARM64_IMAGE = b"\x00" * 56 + b"ARMd" + b"K" * 4000
+
+
+class TestArtifactStore(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.store = ArtifactStore(os.path.join(self.tmpdir.name, 'artifacts'))
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def write_file(self, name, data):
+        path = os.path.join(self.tmpdir.name, name)
+        with open(path, 'wb') as f:
+            f.write(data)
+        return path
+
+    def test_same_content_is_stored_once(self):
+        first = self.store.add(self.write_file('Image', ARM64_IMAGE), 'kernel')
+        second = self.store.add(self.write_file('Image-copy', ARM64_IMAGE), 'kernel')
+
+        self.assertEqual(first, second)
+        self.assertEqual(self.store.get(first)['names'], ['Image', 'Image-copy'])
+        self.assertEqual(len(os.listdir(os.path.dirname(self.store.path(first)))), 1)
+
+    def test_same_name_does_not_overwrite(self):
+        os.makedirs(os.path.join(self.tmpdir.name, 'a'))
+        os.makedirs(os.path.join(self.tmpdir.name, 'b'))
+        first = self.store.add(self.write_file(os.path.join('a', 'recovery.img'), b"twrp 3.6"), 'recovery')
+        second = self.store.add(self.write_file(os.path.join('b', 'recovery.img'), b"twrp 3.7"), 'recovery')
+
+        self.assertNotEqual(first, second)
+        with open(self.store.path(first), 'rb') as f:
+            self.assertEqual(f.read(), b"twrp 3.6")
+
+    def test_index_metadata_survives_reload(self):
+        digest = self.store.add(self.write_file('Image', ARM64_IMAGE), 'kernel')
+
+        entry = ArtifactStore(self.store.root).get(digest)
+        self.assertEqual(entry['format'], 'arm64-image')
+        self.assertEqual(entry['arch'], 'arm64')
+        self.assertEqual(entry['size'], len(ARM64_IMAGE))
+        self.assertIn(entry['storage'], ('reflink', 'hardlink', 'copy'))
+
+    @patch('os.link', side_effect=OSError("cross-device link"))
+    def test_falls_back_to_copy(self, mock_link):
+        src = self.write_file('src', b"data")
+        dst = os.path.join(self.tmpdir.name, 'dst')
+
+        self.assertIn(link_or_copy(src, dst), ('reflink', 'copy'))
+        with open(dst, 'rb') as f:
+            self.assertEqual(f.read(), b"data")
+
+    def test_controller_lists_kernels_from_index(self):
+        controller = QEMUController({'qemu_path': '/path/to/qemu', 'samsung_models': {}})
+        controller.artifacts = self.store
+
+        controller.add_kernel(self.write_file('stock.zip', b"PK\x03\x04stock"))
+        controller.add_twrp_recovery(self.write_file('twrp.img', b"twrp"))
+
+        self.assertEqual(controller.get_available_kernels(), ['stock.zip'])
+        self.assertEqual(controller.get_available_recoveries(), ['twrp.img'])
+
+    def test_recovery_is_patched_in_a_copy(self):
+        controller = QEMUController({'qemu_path': '/path/to/qemu', 'samsung_models': {}})
+        controller.artifacts = self.store
+        original = self.write_file('twrp.img', b"twrp")
+
+        def patch_image(path):
+            with open(path, 'ab') as f:
+                f.write(b" for samsung")
+
+        with patch.object(controller, '_modify_twrp_for_samsung', side_effect=patch_image):
+            dest_path = controller.add_twrp_recovery(original)
+
+        with open(original, 'rb') as f:
+            self.assertEqual(f.read(), b"twrp")
+        with open(dest_path, 'rb') as f:
+            self.assertEqual(f.read(), b"twrp for samsung")
+        self.assertEqual(os.path.basename(dest_path), hashlib.sha256(b"twrp for samsung").hexdigest())
+        self.assertEqual(sorted(os.listdir(self.store.root)), ['index.json', 'objects'])
+
+
+if __name__ == '__main__':
+    unittest.main()
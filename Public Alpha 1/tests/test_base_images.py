@@ -0,0 +1,52 @@
+import os
+import stat
+import tempfile
+import unittest
+from unittest.mock import patch
+from base_images import BaseImageCatalog
+
+class TestBaseImageCatalog(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.catalog = BaseImageCatalog(os.path.join(self.tmpdir.name, 'catalog.json'))
+        self.image_path = os.path.join(self.tmpdir.name, 'golden.qcow2')
+        with open(self.image_path, 'wb') as f:
+            f.write(b'QFI\xfb')
+
+    def tearDown(self):
+        os.chmod(self.image_path, stat.S_IRUSR | stat.S_IWUSR)
+        self.tmpdir.cleanup()
+
+    def test_register_makes_image_read_only(self):
+        key = self.catalog.register(self.image_path, 'Galaxy S10', 'G973FXXU9FUCD')
+
+        self.assertEqual(key, 'Galaxy S10/G973FXXU9FUCD')
+        self.assertFalse(os.stat(self.image_path).st_mode & stat.S_IWUSR)
+        reloaded = BaseImageCatalog(self.catalog.catalog_path)
+        self.assertEqual(reloaded.get(key)['path'], os.path.abspath(self.image_path))
+
+    @patch('base_images.list_vm_configs')
+    def test_base_image_in_use_by_clone(self, mock_configs):
+        mock_configs.return_value = [
+            {'name': 'vm1', 'backing_file': self.image_path},
+            {'name': 'vm2'}
+        ]
+
+        self.assertEqual(self.catalog.get_clones(self.image_path), ['vm1'])
+        self.assertTrue(self.catalog.is_in_use(self.image_path))
+        self.assertFalse(self.catalog.is_in_use(os.path.join(self.tmpdir.name, 'vm2.qcow2')))
+
+    @patch('base_images.list_vm_configs')
+    def test_unregister_refuses_while_cloned(self, mock_configs):
+        key = self.catalog.register(self.image_path, 'Galaxy S10')
+        mock_configs.return_value = [{'name': 'vm1', 'backing_file': self.image_path}]
+
+        with self.assertRaises(RuntimeError):
+            self.catalog.unregister(key)
+
+        mock_configs.return_value = []
+        self.catalog.unregister(key)
+        self.assertIsNone(self.catalog.get(key))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,108 @@
+import os
+import struct
+import tempfile
+import unittest
+from bootimg import BootImage, BootImageError, decode_os_version, unpack_boot_image
+from qemu_controller import QEMUController
+
+KERNEL = b"\x00" * 56 + b"ARMd" + b"K" * 3000
+RAMDISK = b"\x1f\x8b" + b"R" * 5000
+DTB = b"\xd0\x0d\xfe\xed" + b"D" * 100
+
+
+def pad(data, page_size):
+    return data + b"\x00" * (-len(data) % page_size)
+
+
+def make_boot_v2(page_size=2048):
+    os_version = (((11 << 14) | (0 << 7) | 0) << 11) | ((21 << 4) | 3)
+    header = struct.pack("<8s10I16s512s32s1024s", b"ANDROID!", len(KERNEL), 0x8000, len(RAMDISK), 0x1000000,
+                         0, 0, 0x100, page_size, 2, os_version, b"SM-G973F", b"console=ttyS0", b"\x00" * 32,
+                         b" androidboot.hardware=exynos9820")
+    header += struct.pack("<IQI", 0, 0, 1660) + struct.pack("<IQ", len(DTB), 0x1f00000)
+    return pad(header, page_size) + pad(KERNEL, page_size) + pad(RAMDISK, page_size) + pad(DTB, page_size)
+
+
+def make_boot_v4():
+    header = struct.pack("<8s4I4II1536s", b"ANDROID!", len(KERNEL), len(RAMDISK), 0, 1580, 0, 0, 0, 0, 4,
+                         b"androidboot.selinux=permissive") + struct.pack("<I", 0)
+    return pad(header, 4096) + pad(KERNEL, 4096) + pad(RAMDISK, 4096)
+
+
+def make_vendor_boot_v3(page_size=4096):
+    header = struct.pack("<8s5I2048sI16s2IQ", b"VNDRBOOT", 3, page_size, 0x8000, 0x1000000, len(RAMDISK),
+                         b"console=ttyAMA0", 0x100, b"exynos", 2112, len(DTB), 0x1f00000)
+    return pad(header, page_size) + pad(RAMDISK, page_size) + pad(DTB, page_size)
+
+
+class TestBootImage(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def write_image(self, data, name='boot.img'):
+        path = os.path.join(self.tmpdir.name, name)
+        with open(path, 'wb') as f:
+            f.write(data)
+        return path
+
+    def test_parse_v2_sections(self):
+        with BootImage(self.write_image(make_boot_v2())) as image:
+            self.assertEqual(image.kind, 'boot')
+            self.assertEqual(image.header_version, 2)
+            self.assertEqual(image.cmdline, 'console=ttyS0 androidboot.hardware=exynos9820')
+            self.assertEqual(image.os_patch_level, '2021-03')
+            self.assertEqual(bytes(image.section('kernel')), KERNEL)
+            self.assertEqual(bytes(image.section('ramdisk')), RAMDISK)
+            self.assertEqual(bytes(image.section('dtb')), DTB)
+            self.assertEqual(len(image.section('second')), 0)
+
+    def test_parse_v4_and_vendor_boot(self):
+        with BootImage(self.write_image(make_boot_v4())) as image:
+            self.assertEqual(image.header_version, 4)
+            self.assertEqual(image.cmdline, 'androidboot.selinux=permissive')
+            self.assertEqual(bytes(image.section('ramdisk')), RAMDISK)
+
+        with BootImage(self.write_image(make_vendor_boot_v3(), 'vendor_boot.img')) as image:
+            self.assertEqual(image.kind, 'vendor_boot')
+            self.assertEqual(bytes(image.section('dtb')), DTB)
+            self.assertNotIn('kernel', image.sections)
+
+    def test_rejects_truncated_and_foreign_files(self):
+        with self.assertRaises(BootImageError):
+            BootImage(self.write_image(make_boot_v2()[:6000]))
+        with self.assertRaises(BootImageError):
+            BootImage(self.write_image(b"not a boot image" * 200))
+
+    def test_decode_os_version(self):
+        self.assertEqual(decode_os_version(((12 << 14) << 11) | ((22 << 4) | 11)), ('12.0.0', '2022-11'))
+        self.assertEqual(decode_os_version(0), (None, None))
+
+    def test_unpack_is_cached_by_content(self):
+        cache_dir = os.path.join(self.tmpdir.name, 'unpacked')
+        first = unpack_boot_image(self.write_image(make_boot_v2()), cache_dir)
+        second = unpack_boot_image(self.write_image(make_boot_v2(), 'copy.img'), cache_dir)
+
+        self.assertEqual(first, second)
+        self.assertEqual(set(first['files']), {'kernel', 'ramdisk', 'dtb'})
+        with open(first['files']['kernel'], 'rb') as f:
+            self.assertEqual(f.read(), KERNEL)
+
+    def test_controller_boots_unpacked_kernel(self):
+        controller = QEMUController({'qemu_path': '/path/to/qemu', 'samsung_models': {}})
+        controller.unpacked_dir = os.path.join(self.tmpdir.name, 'unpacked')
+        recovery = self.write_image(make_boot_v4(), 'recovery.img')
+
+        kernel, initrd, cmdline = controller.resolve_boot_artifacts(self.write_image(make_boot_v2()), recovery)
+
+        with open(kernel, 'rb') as f:
+            self.assertEqual(f.read(), KERNEL)
+        self.assertNotEqual(initrd, recovery)
+        self.assertTrue(initrd.startswith(controller.unpacked_dir))
+        self.assertEqual(cmdline, 'console=ttyS0 androidboot.hardware=exynos9820')
+
+
+if __name__ == '__main__':
+    unittest.main()
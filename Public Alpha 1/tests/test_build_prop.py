@@ -0,0 +1,59 @@
+import os
+import tempfile
+import unittest
+from build_prop import PropertyIndex
+from dump_analyzer import DumpAnalyzer
+
+
+class TestPropertyIndex(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.dump = self.tmpdir.name
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def write_prop(self, relative_path, content):
+        path = os.path.join(self.dump, relative_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as f:
+            f.write(content)
+
+    def test_later_partitions_override_earlier_ones(self):
+        self.write_prop('system/build.prop', "ro.build.id=SYSTEM\nro.system.only=1\n")
+        self.write_prop('vendor/build.prop', "ro.build.id=VENDOR\n")
+        self.write_prop('product/etc/build.prop', "# product wins\nro.build.id=PRODUCT\n")
+
+        index = PropertyIndex.from_dump(self.dump)
+
+        self.assertEqual(index['ro.build.id'], 'PRODUCT')
+        self.assertEqual(index.source('ro.build.id')[1], 'product')
+        self.assertEqual(index.get('ro.system.only'), '1')
+        self.assertIsNone(index.get('ro.missing'))
+
+    def test_import_lines_and_values_with_equals(self):
+        self.write_prop('vendor/build.prop', "ro.board.platform=exynos9820\n"
+                                             "import /vendor/etc/${ro.board.platform}.prop ro.sf.*\n")
+        self.write_prop('vendor/etc/exynos9820.prop', "ro.sf.lcd_density=560\npersist.skipped=1\n"
+                                                      "ro.sf.opts=a=b\n")
+
+        index = PropertyIndex.from_dump(self.dump)
+
+        self.assertEqual(index['ro.sf.lcd_density'], '560')
+        self.assertEqual(index['ro.sf.opts'], 'a=b')
+        self.assertNotIn('persist.skipped', index)
+
+    def test_product_property_falls_back_to_partition_values(self):
+        self.write_prop('system/build.prop', "ro.product.system.model=GSI\n")
+        self.write_prop('vendor/build.prop', "ro.product.vendor.model=SM-G973F\n"
+                                             "ro.product.vendor.manufacturer=samsung\n")
+
+        analyzer = DumpAnalyzer(self.dump)
+        device_model = analyzer._detect_device_model()
+
+        self.assertEqual(device_model.model, 'SM-G973F')
+        self.assertEqual(device_model.manufacturer, 'samsung')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,120 @@
+import io
+import os
+import sys
+import json
+import tempfile
+import unittest
+import subprocess
+from contextlib import redirect_stdout
+from unittest.mock import patch, MagicMock
+import cli
+from qemu_controller import QEMUController
+
+CONFIG = {
+    'qemu_path': '/path/to/qemu',
+    'samsung_models': {'Galaxy S10': 'arm64'},
+    'virtual_disk_size': 4096,
+}
+
+
+class TestCLI(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        vms_dir = os.path.join(self.tmpdir.name, 'vms')
+        for patcher in (patch('vm_store.VMS_DIR', vms_dir), patch('vm_store.RUN_DIR', os.path.join(vms_dir, 'run')),
+                        patch('cli.CONFIG', CONFIG)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def run_cli(self, *argv):
+        output = io.StringIO()
+        with redirect_stdout(output):
+            returncode = cli.main(list(argv))
+        return returncode, json.loads(output.getvalue())
+
+    def write_manifest(self, manifest):
+        path = os.path.join(self.tmpdir.name, 'manifest.json')
+        with open(path, 'w') as f:
+            json.dump(manifest, f)
+        return path
+
+    @patch.object(QEMUController, 'create_virtual_disk', side_effect=lambda size, name, cluster_size=None:
+                  f"/disks/{name}.qcow2")
+    def test_create_and_status_from_manifest(self, mock_create_disk):
+        manifest = self.write_manifest({"vms": ["vm1", {"name": "vm2", "memory": 4096, "model": "Unknown"},
+                                                {"name": "vm3", "cpus": 2}]})
+
+        returncode, output = self.run_cli("create", "--manifest", manifest, "--model", "Galaxy S10", "--memory", "2048")
+
+        self.assertEqual(returncode, 1)
+        results = {result["target"]: result for result in output["results"]}
+        self.assertEqual(results["vm1"]["result"]["qcow2_path"], "/disks/vm1.qcow2")
+        self.assertEqual((results["vm3"]["result"]["memory"], results["vm3"]["result"]["cpus"]), (2048, 2))
+        self.assertEqual(results["vm2"], {"target": "vm2", "ok": False, "error": "Unknown model: Unknown"})
+        self.assertEqual(mock_create_disk.call_count, 2)
+
+        returncode, output = self.run_cli("status")
+
+        self.assertEqual(returncode, 0)
+        self.assertEqual([(result["target"], result["result"]["state"]) for result in output["results"]],
+                         [("vm1", "stopped"), ("vm3", "stopped")])
+
+    @patch.object(QEMUController, 'get_vm_status', return_value={"name": "vm1", "state": "stopped"})
+    @patch.object(QEMUController, 'stop_emulator')
+    @patch('cli._attach')
+    def test_stop_running_vm_forgets_runtime_record(self, mock_attach, mock_stop, mock_status):
+        cli.save_vm_runtime("vm1", {"pid": 1234, "ports": {"qmp": 5556}})
+        mock_attach.side_effect = lambda controller, name: MagicMock() if name == "vm1" else None
+
+        returncode, output = self.run_cli("stop", "vm1", "vm2", "--timeout", "10")
+
+        self.assertEqual(returncode, 0)
+        mock_stop.assert_called_once_with("vm1", timeout=10)
+        self.assertIsNone(cli.load_vm_runtime("vm1"))
+        self.assertEqual([result["result"]["state"] for result in output["results"]], ["stopped", "stopped"])
+
+    def test_manifest_entry_without_name_is_rejected(self):
+        manifest = self.write_manifest([{"memory": 2048}])
+
+        returncode, output = self.run_cli("start", "--manifest", manifest)
+
+        self.assertEqual(returncode, 2)
+        self.assertFalse(output["ok"])
+
+    @patch.object(QEMUController, 'create_virtual_disk')
+    @patch.object(QEMUController, 'import_firmware')
+    def test_create_adopts_disk_of_imported_firmware(self, mock_import, mock_create_disk):
+        disk_dir = os.path.join(self.tmpdir.name, 'disks')
+
+        def import_firmware(package, dump_folder=None, vm_name=None, cluster_size=None):
+            os.makedirs(disk_dir)
+            with open(os.path.join(disk_dir, f"{vm_name}.qcow2"), 'wb') as f:
+                f.write(b"QFI\xfb")
+            return {"package": package, "disk": os.path.join(disk_dir, f"{vm_name}.qcow2")}
+        mock_import.side_effect = import_firmware
+
+        with patch('qemu_controller.VMS_DIR', self.tmpdir.name):
+            returncode, output = self.run_cli("import-firmware", "AP_G973FXXU9FUCD.tar.md5", "--vm", "vm1")
+            self.assertEqual(returncode, 0)
+            mock_import.assert_called_once_with("AP_G973FXXU9FUCD.tar.md5", dump_folder=None, vm_name="vm1",
+                                                cluster_size=None)
+
+            returncode, output = self.run_cli("create", "vm1", "--model", "Galaxy S10")
+
+        self.assertEqual(returncode, 0)
+        self.assertEqual(output["results"][0]["result"]["qcow2_path"], os.path.join(disk_dir, 'vm1.qcow2'))
+        mock_create_disk.assert_not_called()
+        self.assertEqual(cli.load_vm_config("vm1")["virtual_disk_path"], os.path.join(disk_dir, 'vm1.qcow2'))
+
+    def test_does_not_import_qt(self):
+        code = "import sys, cli; cli.build_parser(); print(sorted(m for m in sys.modules if m.startswith('PyQt')))"
+        result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True,
+                                cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        self.assertEqual(result.stdout.strip(), "[]")
+
+
+if __name__ == '__main__':
+    unittest.main()
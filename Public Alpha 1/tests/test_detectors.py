@@ -0,0 +1,84 @@
+import os
+import time
+import tempfile
+import unittest
+from types import SimpleNamespace
+from unittest.mock import patch
+from detectors import DetectorError, register_detector, run_detectors, topological_order
+from dump_analyzer import DumpAnalyzer
+
+
+def sleeper(seconds, value):
+    def detect(analyzer):
+        time.sleep(seconds)
+        return value
+    return detect
+
+
+def failing(analyzer):
+    raise ValueError("unreadable partition")
+
+
+@patch.dict('detectors.DETECTORS', clear=True)
+class TestDetectorRegistry(unittest.TestCase):
+    def setUp(self):
+        self.analyzer = SimpleNamespace(results={}, errors={})
+
+    def test_independent_detectors_run_in_parallel(self):
+        register_detector("a", sleeper(0.3, 1))
+        register_detector("b", sleeper(0.3, 2))
+        register_detector("c", lambda analyzer: analyzer.results["a"] + analyzer.results["b"], depends=["a", "b"])
+
+        start = time.monotonic()
+        run_detectors(self.analyzer, ["a", "b", "c"])
+
+        self.assertLess(time.monotonic() - start, 0.55)
+        self.assertEqual(self.analyzer.results["c"], 3)
+
+    def test_failures_and_timeouts_are_isolated(self):
+        register_detector("broken", failing)
+        register_detector("slow", sleeper(2, "late"), timeout=0.1)
+        register_detector("after_broken", lambda analyzer: "ran", depends=["broken"])
+        register_detector("fine", lambda analyzer: "ok")
+
+        run_detectors(self.analyzer, ["broken", "slow", "after_broken", "fine"])
+
+        self.assertEqual(self.analyzer.results["fine"], "ok")
+        self.assertIsNone(self.analyzer.results["slow"])
+        self.assertIn("timed out", self.analyzer.errors["slow"])
+        self.assertEqual(self.analyzer.errors["broken"], "unreadable partition")
+        self.assertIsNone(self.analyzer.results["after_broken"])
+
+    def test_dependencies_must_exist_and_be_acyclic(self):
+        with self.assertRaises(DetectorError):
+            register_detector("orphan", failing, depends=["missing"])
+
+        register_detector("x", failing)
+        register_detector("y", failing, depends=["x"])
+        self.assertEqual(topological_order(["y", "x"]), ["x", "y"])
+
+
+class TestDumpDetectors(unittest.TestCase):
+    def test_full_analysis_of_a_dump(self):
+        with tempfile.TemporaryDirectory() as dump:
+            os.makedirs(os.path.join(dump, 'system'))
+            with open(os.path.join(dump, 'system', 'build.prop'), 'w') as f:
+                f.write("ro.product.system.model=SM-G973F\nro.product.system.manufacturer=samsung\n"
+                        "ro.build.version.oneui=40100\nro.build.version.security_patch=2022-03-01\n"
+                        "ro.bootloader=G973FXXSGHVC1\nro.csc.sales_code=XEU\nro.board.platform=exynos9820\n")
+
+            result = DumpAnalyzer(dump).analyze()
+
+        self.assertEqual(result['device_model'], {'model': 'SM-G973F', 'manufacturer': 'samsung'})
+        self.assertEqual(result['model'], 'SM-G973F')
+        self.assertEqual(result['touchwiz_version'], 'One UI 4.1')
+        self.assertEqual(result['security_patch'], '2022-03-01')
+        self.assertEqual(result['bootloader'], 'G973FXXSGHVC1')
+        self.assertEqual(result['csc'], 'XEU')
+        self.assertEqual(result['soc'], 'exynos9820')
+        self.assertEqual(result['kernel_version'], 'Not found')
+        self.assertNotIn('build_props', result)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,3 +1,6 @@
+import os
+import gzip
+import tempfile
 import unittest
 from unittest.mock import patch, mock_open
 from dump_analyzer import DumpAnalyzer
@@ -21,11 +24,15 @@ class TestDumpAnalyzer(unittest.TestCase):
         version = self.analyzer._detect_touchwiz_version()
         self.assertEqual(version, 'Unknown')
 
-    @patch('os.path.exists')
-    def test_detect_kernel_version(self, mock_exists):
-        mock_exists.return_value = True
-        version = self.analyzer._detect_kernel_version()
-        self.assertEqual(version, 'Found (version detection not implemented)')
+    def test_detect_kernel_version(self):
+        with tempfile.TemporaryDirectory() as dump:
+            os.makedirs(os.path.join(dump, 'boot'))
+            with gzip.open(os.path.join(dump, 'boot', 'kernel'), 'wb') as f:
+                f.write(b"\0" * 4096 + b"Linux version 4.14.113-25145160 (dpi@21DJB417) #1 SMP PREEMPT\n\0")
+            analyzer = DumpAnalyzer(dump)
+
+            self.assertEqual(analyzer._detect_kernel_version(), '4.14.113-25145160')
+            self.assertEqual(analyzer._detect_kernel_details()['compression'], 'gzip')
 
     @patch.object(DumpAnalyzer, '_detect_device_model')
     @patch.object(DumpAnalyzer, '_detect_touchwiz_version')
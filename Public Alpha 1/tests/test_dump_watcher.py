@@ -0,0 +1,75 @@
+import os
+import queue
+import tempfile
+import unittest
+from unittest.mock import patch
+from dump_analyzer import DumpAnalyzer
+from dump_watcher import DumpWatcher, _PollingBackend
+
+
+class TestDumpWatcher(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.dump = self.tmpdir.name
+        self.write_file(os.path.join('system', 'build.prop'), "ro.product.model=SM-G973F\n")
+        self.analyzer = DumpAnalyzer(self.dump)
+        self.updates = queue.Queue()
+        self.watcher = DumpWatcher(self.analyzer, lambda results, detectors: self.updates.put((results, detectors)),
+                                   debounce=0.1, poll_interval=0.05)
+
+    def tearDown(self):
+        self.watcher.stop()
+        self.tmpdir.cleanup()
+
+    def write_file(self, relative_path, content):
+        path = os.path.join(self.dump, relative_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as f:
+            f.write(content)
+
+    def test_detectors_for_paths(self):
+        self.analyzer.analyze()
+
+        self.assertEqual(self.analyzer.detectors_for_paths({os.path.join(self.dump, 'vendor')}), {'build_props'})
+        self.assertEqual(self.analyzer.detectors_for_paths({os.path.join(self.dump, 'boot', 'kernel')}),
+                         {'kernel_version'})
+        self.assertEqual(self.analyzer.detectors_for_paths({os.path.join(self.dump, 'data')}), set())
+
+    def test_imported_prop_files_are_inputs(self):
+        self.write_file(os.path.join('vendor', 'build.prop'), "import /vendor/etc/extra.prop\n")
+        self.write_file(os.path.join('vendor', 'etc', 'extra.prop'), "ro.csc.sales_code=XEF\n")
+        self.assertEqual(self.analyzer.analyze()['csc'], 'XEF')
+        extra = os.path.join(self.dump, 'vendor', 'etc', 'extra.prop')
+
+        self.assertEqual(self.analyzer.detectors_for_paths({extra}), {'build_props'})
+
+        self.write_file(os.path.join('vendor', 'etc', 'extra.prop'), "ro.csc.sales_code=BTU\n")
+        self.analyzer.refresh(self.analyzer.detectors_for_paths({extra}))
+        self.assertEqual(self.analyzer.results['csc'], 'BTU')
+
+    def check_new_vendor_partition_is_picked_up(self):
+        self.watcher.start()
+        results, detectors = self.updates.get(timeout=5)
+        self.assertEqual(results['device_model']['model'], 'SM-G973F')
+        self.assertIn('kernel_version', detectors)
+
+        with patch.object(DumpAnalyzer, '_detect_kernel_version') as mock_kernel:
+            self.write_file(os.path.join('product', 'build.prop'), "ro.product.model=SM-G975F\n")
+            results, detectors = self.updates.get(timeout=5)
+
+        self.assertIn('device_model', detectors)
+        self.assertIn('touchwiz_version', detectors)
+        self.assertNotIn('kernel_version', detectors)
+        self.assertEqual(results['device_model']['model'], 'SM-G975F')
+        mock_kernel.assert_not_called()
+
+    def test_watcher_reruns_affected_detectors(self):
+        self.check_new_vendor_partition_is_picked_up()
+
+    def test_polling_fallback(self):
+        with patch.object(DumpWatcher, '_create_backend', lambda watcher: _PollingBackend(0.05)):
+            self.check_new_vendor_partition_is_picked_up()
+
+
+if __name__ == '__main__':
+    unittest.main()
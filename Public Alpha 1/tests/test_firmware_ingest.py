@@ -0,0 +1,168 @@
+import io
+import os
+import shutil
+import struct
+import hashlib
+import tarfile
+import tempfile
+import unittest
+import subprocess
+from firmware_ingest import ingest_firmware, package_label, member_image_name, FirmwareIngestError
+from kernel_formats import lz4_frame
+from artifact_store import ArtifactStore
+
+BLOCK_SIZE = 4096
+BOOT_IMAGE = b"ANDROID!" + bytes(2040) + os.urandom(6000)
+
+
+def sparse_image(blocks):
+    """A sparse image of RAW blocks (bytes) and DONT_CARE runs (ints), and its expanded content"""
+    body, expanded, total = b"", b"", 0
+    for block in blocks:
+        if isinstance(block, int):
+            body += struct.pack("<HHII", 0xCAC3, 0, block, 12)
+            expanded += bytes(block * BLOCK_SIZE)
+            total += block
+        else:
+            body += struct.pack("<HHII", 0xCAC1, 0, len(block) // BLOCK_SIZE, 12 + len(block)) + block
+            expanded += block
+            total += len(block) // BLOCK_SIZE
+    header = struct.pack("<IHHHHIIII", 0xED26FF3A, 1, 0, 28, 12, BLOCK_SIZE, total, len(blocks), 0)
+    return header + body, expanded
+
+
+def write_package(path, members, md5=True):
+    """Write an Odin package: a tar of the members followed by its md5sum line"""
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w", format=tarfile.USTAR_FORMAT) as tar:
+        for name, data in members.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+    data = buffer.getvalue()
+    with open(path, "wb") as f:
+        f.write(data)
+        if md5:
+            f.write(f"{hashlib.md5(data).hexdigest()}  {os.path.basename(path)[:-4]}\n".encode())
+
+
+def lz4_compress(data, tmpdir):
+    if lz4_frame:
+        return lz4_frame.compress(data)
+    raw_path = os.path.join(tmpdir, 'member.raw')
+    with open(raw_path, 'wb') as f:
+        f.write(data)
+    return subprocess.run(['lz4', '-c', raw_path], capture_output=True, check=True).stdout
+
+
+class TestFirmwareIngest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.store = ArtifactStore(os.path.join(self.tmpdir.name, 'artifacts'))
+        self.dump = os.path.join(self.tmpdir.name, 'dump')
+        self.package = os.path.join(self.tmpdir.name, 'AP_G973FXXU9FUCD_CL21000_QB40000_REV01.tar.md5')
+        self.system, self.system_expanded = sparse_image([os.urandom(2 * BLOCK_SIZE), 30, os.urandom(BLOCK_SIZE)])
+        self.members = {
+            "boot.img": BOOT_IMAGE,
+            "recovery.img": b"ANDROID!" + os.urandom(4000),
+            "system.img": self.system,
+            "vbmeta.img": b"AVB0" + bytes(60),
+            "modem.bin": os.urandom(5000),
+        }
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_routes_members_and_verifies_md5(self):
+        write_package(self.package, self.members)
+        disk_path = os.path.join(self.tmpdir.name, 'vm1.qcow2')
+        progress = []
+
+        result = ingest_firmware(self.package, self.dump, self.store, disk_path,
+                                 progress=lambda percent, message: progress.append(percent))
+
+        self.assertTrue(result["verified"])
+        self.assertEqual(sorted(result["artifacts"]), ["G973FXXU9FUCD_boot.img", "G973FXXU9FUCD_recovery.img"])
+        digest = result["artifacts"]["G973FXXU9FUCD_boot.img"]
+        self.assertEqual(self.store.get(digest)['kind'], 'kernel')
+        with open(self.store.path(digest), 'rb') as f:
+            self.assertEqual(f.read(), BOOT_IMAGE)
+        # Partition images stay sparse in the dump
+        for name in ("system.img", "vbmeta.img"):
+            with open(os.path.join(self.dump, name), 'rb') as f:
+                self.assertEqual(f.read(), self.members[name])
+        with open(disk_path, 'rb') as f:
+            header = f.read(32)
+        self.assertEqual(header[:4], b"QFI\xfb")
+        self.assertEqual(struct.unpack_from(">Q", header, 24)[0], len(self.system_expanded))
+        self.assertEqual(result["skipped"], ["modem.bin"])
+        self.assertEqual(progress[-1], 100)
+        # The staging directory is gone
+        self.assertEqual(sorted(os.listdir(self.store.root)), ['index.json', 'objects'])
+
+    def test_md5_mismatch_keeps_nothing(self):
+        write_package(self.package, self.members)
+        with open(self.package, 'r+b') as f:
+            data = f.read()
+            f.seek(data.index(self.members["modem.bin"]) + 10)
+            f.write(b"corrupted")
+
+        with self.assertRaises(FirmwareIngestError):
+            ingest_firmware(self.package, self.dump, self.store)
+
+        self.assertEqual(os.listdir(self.dump), [])
+        self.assertEqual(self.store.list_artifacts(), [])
+
+    def test_plain_tar_without_trailer(self):
+        package = os.path.join(self.tmpdir.name, 'CSC_OXM_G973FOXM9FUCD.tar')
+        write_package(package, {"vbmeta.img": self.members["vbmeta.img"]}, md5=False)
+
+        result = ingest_firmware(package, self.dump)
+
+        self.assertFalse(result["verified"])
+        self.assertEqual(result["dump"], [os.path.join(self.dump, 'vbmeta.img')])
+        with self.assertRaises(FirmwareIngestError):
+            shutil.copy(package, package + '.md5')
+            ingest_firmware(package + '.md5', self.dump)
+
+    @unittest.skipUnless(lz4_frame or shutil.which('lz4'), "lz4 is not available")
+    def test_decompresses_lz4_members(self):
+        write_package(self.package, {name + ".lz4": lz4_compress(data, self.tmpdir.name)
+                                     for name, data in self.members.items()})
+
+        result = ingest_firmware(self.package, self.dump, self.store)
+
+        self.assertTrue(result["verified"])
+        with open(os.path.join(self.dump, 'system.img'), 'rb') as f:
+            self.assertEqual(f.read(), self.system)
+        with open(self.store.path(result["artifacts"]["G973FXXU9FUCD_boot.img"]), 'rb') as f:
+            self.assertEqual(f.read(), BOOT_IMAGE)
+
+    def test_ext4_images_of_devices_without_super(self):
+        vendor, _ = sparse_image([os.urandom(BLOCK_SIZE), 3])
+        write_package(self.package, {"system.img.ext4": self.system, "vendor.img.ext4": vendor,
+                                     "userdata.img.ext4": vendor})
+        disk_path = os.path.join(self.tmpdir.name, 'vm1.qcow2')
+
+        result = ingest_firmware(self.package, self.dump, disk_path=disk_path)
+
+        self.assertEqual(result["skipped"], [])
+        self.assertEqual(result["dump"], [os.path.join(self.dump, name)
+                                          for name in ("system.img", "vendor.img", "userdata.img")])
+        self.assertEqual(result["disk"], disk_path)
+        with open(os.path.join(self.dump, 'system.img'), 'rb') as f:
+            self.assertEqual(f.read(), self.system)
+
+    def test_member_image_name(self):
+        self.assertEqual(member_image_name("system.img.ext4.lz4"), ("system.img", "lz4"))
+        self.assertEqual(member_image_name("vendor.img.ext4"), ("vendor.img", None))
+        self.assertEqual(member_image_name("super.img.lz4"), ("super.img", "lz4"))
+
+    def test_package_label(self):
+        self.assertEqual(package_label("HOME_CSC_OXM_G973FOXM9FUCD_CL1.tar.md5"), "G973FOXM9FUCD")
+        self.assertEqual(package_label("/fw/BL_G973FXXU9FUCD_CL1.tar.md5"), "G973FXXU9FUCD")
+        self.assertEqual(package_label("firmware.tar"), "firmware")
+
+
+if __name__ == '__main__':
+    unittest.main()
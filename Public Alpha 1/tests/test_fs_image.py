@@ -0,0 +1,210 @@
+import os
+import stat
+import shutil
+import struct
+import tempfile
+import unittest
+import subprocess
+from fs_image import (open_filesystem_image, detect_filesystem, ExtentFile, ErofsImage, FilesystemImageError,
+                      EROFS_MAGIC)
+from build_prop import PropertyIndex
+
+MKFS_EXT4 = shutil.which("mkfs.ext4") or shutil.which("mke2fs")
+EROFS_BLOCK_SIZE = 4096
+EROFS_FILE_TYPES = {stat.S_IFREG: 1, stat.S_IFDIR: 2, stat.S_IFLNK: 7}
+
+
+def build_erofs(path, files, compressed=()):
+    """Write a small uncompressed EROFS image: files maps paths to bytes, or to ('symlink', target).
+
+    Files over one block use the inline-tail layout, the paths in compressed are only marked
+    as compressed.
+    """
+    tree = {"/": {}}
+    for file_path, content in files.items():
+        parent = "/"
+        for part in file_path.strip("/").split("/")[:-1]:
+            directory = parent.rstrip("/") + "/" + part
+            tree.setdefault(directory, {})
+            tree[parent][part] = directory
+            parent = directory
+        tree[parent][file_path.rsplit("/", 1)[1]] = file_path
+
+    nodes = sorted(set(tree) | set(files), key=lambda node: (node.count("/"), node))
+    data_blocks, layouts, tails, offset = [], {}, {}, 0
+    nids = {}
+    for node in nodes:
+        content = files.get(node)
+        if isinstance(content, tuple):
+            tails[node] = content[1].encode()
+        elif isinstance(content, bytes) and len(content) > EROFS_BLOCK_SIZE:
+            tails[node] = content[len(content) // EROFS_BLOCK_SIZE * EROFS_BLOCK_SIZE:]
+        nids[node] = offset // 32
+        offset = (offset + 32 + len(tails.get(node, b"")) + 31) // 32 * 32
+
+    def add_data(data):
+        data_blocks.append(data)
+        return 1 + len(data_blocks)
+
+    meta = bytearray(EROFS_BLOCK_SIZE)
+    for node in nodes:
+        content = files.get(node)
+        if node in tree:
+            mode = stat.S_IFDIR | 0o755
+            names = dict(tree[node], **{".": node, "..": node.rsplit("/", 1)[0] or "/"})
+            names = sorted(names.items())
+            dirents, blob = b"", b""
+            for name, child in names:
+                child_type = stat.S_IFDIR if child in tree else (stat.S_IFLNK if isinstance(files[child], tuple)
+                                                                 else stat.S_IFREG)
+                dirents += struct.pack("<QHBB", nids[child], 12 * len(names) + len(blob), EROFS_FILE_TYPES[child_type],
+                                       0)
+                blob += name.encode()
+            data = dirents + blob
+            layout, address = 0, add_data(data)
+        elif isinstance(content, tuple):
+            mode, data = stat.S_IFLNK | 0o777, tails[node]
+            layout, address = 2, 0
+        else:
+            mode, data = stat.S_IFREG | 0o644, content
+            full = len(data) // EROFS_BLOCK_SIZE * EROFS_BLOCK_SIZE if node in tails else len(data)
+            layout = 2 if node in tails else (3 if node in compressed else 0)
+            address = add_data(data[:full]) if full else 0
+        inode = struct.pack("<HHHHIIIIHHI", layout << 1, 0, mode, 1, len(data), 0, address, nids[node], 0, 0, 0)
+        position = nids[node] * 32
+        meta[position:position + 32] = inode
+        meta[position + 32:position + 32 + len(tails.get(node, b""))] = tails.get(node, b"")
+
+    superblock = struct.pack("<IIIBBHQQIIII16s16sI", EROFS_MAGIC, 0, 0, 12, 0, nids["/"], len(nodes), 0, 0,
+                             2 + len(data_blocks), 1, 0, bytes(16), b"test", 0)
+    with open(path, "wb") as f:
+        f.write(bytes(1024) + superblock.ljust(EROFS_BLOCK_SIZE - 1024, b"\x00"))
+        f.write(meta)
+        for data in data_blocks:
+            f.write(data.ljust(-(-len(data) // EROFS_BLOCK_SIZE) * EROFS_BLOCK_SIZE, b"\x00"))
+
+
+class TestExtentFile(unittest.TestCase):
+    def test_extents_holes_and_seeking(self):
+        class Source:
+            def read_at(self, offset, length):
+                return bytes(range(256))[offset:offset + length]
+
+        f = ExtentFile(Source(), [(10, 100, 5), (0, 0, 4), (20, None, 5)], 30)
+
+        self.assertEqual(f.read(), bytes(range(4)) + bytes(6) + bytes(range(100, 105)) + bytes(15))
+        f.seek(-21, os.SEEK_END)
+        self.assertEqual(f.read(3), bytes([0, 100, 101]))
+        self.assertEqual(f.read_at(28, 10), bytes(2))
+
+
+@unittest.skipUnless(MKFS_EXT4, "mkfs.ext4 not available")
+class TestExt4Image(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.root = os.path.join(self.tmpdir.name, 'root')
+        os.makedirs(os.path.join(self.root, 'system', 'etc'))
+        os.makedirs(os.path.join(self.root, 'vendor'))
+        with open(os.path.join(self.root, 'system', 'build.prop'), 'w') as f:
+            f.write("ro.product.system.model=SM-G973F\nro.build.version.oneui=30000\n")
+        self.blob = os.urandom(3 * 1024 * 1024 + 123)
+        with open(os.path.join(self.root, 'system', 'blob.bin'), 'wb') as f:
+            f.write(self.blob)
+        with open(os.path.join(self.root, 'system', 'etc', 'hosts'), 'w') as f:
+            f.write("127.0.0.1 localhost\n")
+        for number in range(200):
+            with open(os.path.join(self.root, 'vendor', f"file{number}"), 'w') as f:
+                f.write(str(number))
+        os.symlink('/system/etc', os.path.join(self.root, 'etc'))
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def make_image(self, *options):
+        image_path = os.path.join(self.tmpdir.name, 'system.img')
+        if os.path.exists(image_path):
+            os.remove(image_path)
+        result = subprocess.run([MKFS_EXT4, "-q", "-F", *options, "-d", self.root, image_path, "32M"],
+                                capture_output=True, text=True)
+        if result.returncode != 0:
+            self.skipTest(f"mkfs.ext4 cannot build the image: {result.stderr.strip()}")
+        return image_path
+
+    def test_reads_files_for_every_layout(self):
+        # Extents, inline data, and ext3-style block maps
+        for options in ([], ["-O", "inline_data"], ["-t", "ext3", "-O", "^extent,^64bit"]):
+            with self.subTest(options=options), open_filesystem_image(self.make_image(*options)) as image:
+                self.assertEqual(image.kind, "ext4")
+                self.assertIn("ro.product.system.model=SM-G973F", image.read_text("/system/build.prop"))
+                self.assertEqual(image.read_bytes("/system/blob.bin"), self.blob)
+                self.assertEqual(image.read_text("/etc/hosts"), "127.0.0.1 localhost\n")
+                self.assertEqual(image.readlink("/etc"), "/system/etc")
+                self.assertEqual(len(image.listdir("/vendor")), 200)
+                self.assertEqual(image.read_text("/vendor/file123"), "123")
+                self.assertFalse(image.exists("/system/missing"))
+                with self.assertRaises(FileNotFoundError):
+                    image.open("/vendor/missing")
+
+    def test_property_index_reads_unextracted_image(self):
+        dump = os.path.join(self.tmpdir.name, 'dump')
+        os.makedirs(dump)
+        image_path = self.make_image()
+        shutil.move(image_path, os.path.join(dump, 'system.img'))
+
+        index = PropertyIndex.from_dump(dump)
+
+        self.assertEqual(index.product_property("model"), "SM-G973F")
+        self.assertEqual(index.files, [os.path.join(dump, 'system.img')])
+
+
+class TestErofsImage(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.image_path = os.path.join(self.tmpdir.name, 'vendor.img')
+        self.blob = os.urandom(2 * EROFS_BLOCK_SIZE + 100)
+        build_erofs(self.image_path, {
+            "/build.prop": b"ro.product.vendor.model=SM-G973F\n",
+            "/etc/blob.bin": self.blob,
+            "/etc/packed.bin": b"compressed",
+            "/lib": ("symlink", "/etc"),
+        }, compressed={"/etc/packed.bin"})
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_reads_plain_inline_and_symlinked_files(self):
+        self.assertEqual(detect_filesystem(self.image_path), "erofs")
+        with open_filesystem_image(self.image_path) as image:
+            self.assertIsInstance(image, ErofsImage)
+            self.assertEqual(image.listdir("/"), ["build.prop", "etc", "lib"])
+            self.assertEqual(image.read_text("/build.prop"), "ro.product.vendor.model=SM-G973F\n")
+            self.assertEqual(image.read_bytes("/lib/blob.bin"), self.blob)
+            self.assertEqual(image.stat("/etc/blob.bin")["size"], len(self.blob))
+            self.assertEqual(image.readlink("/lib"), "/etc")
+
+    def test_compressed_files_are_listed_but_not_read(self):
+        with open_filesystem_image(self.image_path) as image:
+            self.assertTrue(image.isfile("/etc/packed.bin"))
+            with self.assertRaises(FilesystemImageError):
+                image.read_bytes("/etc/packed.bin")
+
+    def test_sparse_image_is_read_in_place(self):
+        with open(self.image_path, 'rb') as f:
+            data = f.read()
+        blocks = [data[offset:offset + EROFS_BLOCK_SIZE] for offset in range(0, len(data), EROFS_BLOCK_SIZE)]
+        sparse_path = os.path.join(self.tmpdir.name, 'vendor_sparse.img')
+        with open(sparse_path, 'wb') as f:
+            f.write(struct.pack("<IHHHHIIII", 0xED26FF3A, 1, 0, 28, 12, EROFS_BLOCK_SIZE, len(blocks), len(blocks), 0))
+            for block in blocks:
+                if any(block):
+                    f.write(struct.pack("<HHII", 0xCAC1, 0, 1, 12 + len(block)) + block)
+                else:
+                    f.write(struct.pack("<HHII", 0xCAC3, 0, 1, 12))
+
+        self.assertEqual(detect_filesystem(sparse_path), "sparse")
+        with open_filesystem_image(sparse_path) as image:
+            self.assertEqual(image.read_bytes("/etc/blob.bin"), self.blob)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+import os
+import time
+import unittest
+
+try:
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    from PyQt6.QtCore import QEventLoop, QTimer
+    from PyQt6.QtWidgets import QApplication
+except ImportError:
+    QApplication = None
+
+
+def counting(steps, job):
+    for step in range(steps):
+        job.check_cancelled()
+        job.set_progress(step * 100 / steps, f"step {step}")
+        time.sleep(0.02)
+    return steps
+
+
+@unittest.skipIf(QApplication is None, "PyQt6 not installed")
+class TestJobManager(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.app = QApplication.instance() or QApplication([])
+
+    def run_until_done(self, manager, timeout_ms=5000):
+        loop = QEventLoop()
+        manager.job_finished.connect(lambda _: None if manager.active_jobs() else loop.quit())
+        QTimer.singleShot(timeout_ms, loop.quit)
+        if manager.active_jobs():
+            loop.exec()
+
+    def test_results_errors_and_cancellation(self):
+        from ui.job_manager import JobManager, FINISHED, FAILED, CANCELLED
+
+        manager = JobManager(max_threads=1)
+        results, errors = [], []
+        done = manager.submit("count", counting, 5, pass_job=True, on_success=results.append)
+        failed = manager.submit("fail", lambda: 1 / 0, on_error=errors.append)
+        queued = manager.submit("queued", counting, 5, pass_job=True, on_success=results.append)
+        queued.cancel()
+
+        self.run_until_done(manager)
+
+        self.assertEqual((done.state, done.progress, results), (FINISHED, 100, [5]))
+        self.assertEqual((failed.state, errors), (FAILED, ["division by zero"]))
+        self.assertEqual(queued.state, CANCELLED)
+
+        manager.clear_finished()
+        self.assertEqual(manager.jobs, {})
+
+    def test_cancelled_after_dequeue_still_finishes(self):
+        from unittest.mock import patch
+        from ui.job_manager import JobManager, CANCELLED
+
+        manager = JobManager(max_threads=1)
+        results = []
+        # The pool already took the job off its queue, so tryTake() cannot drop it anymore
+        with patch.object(manager.pool, 'start'), patch.object(manager.pool, 'tryTake', return_value=False):
+            job = manager.submit("late", counting, 5, pass_job=True, on_success=results.append)
+            job.cancel()
+        job.run()
+
+        self.run_until_done(manager)
+
+        self.assertEqual((job.state, results), (CANCELLED, []))
+        self.assertIsNotNone(job.finished)
+        self.assertEqual(manager.active_jobs(), [])
+        self.assertNotIn(job.id, manager._callbacks)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+import io
+import os
+import shutil
+import subprocess
+import tarfile
+import tempfile
+import unittest
+import zipfile
+from kernel_formats import extract_kernel_from_zip, identify_header, kernel_score, lz4_frame
+
+ARM64_IMAGE = b"\x00" * 56 + b"ARMd" + b"\x00" * 1000
+BOOT_IMAGE = b"ANDROID!" + b"\x00" * 2040
+
+
+class TestKernelFormats(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.zip_path = os.path.join(self.tmpdir.name, 'firmware.zip')
+        self.dest_path = os.path.join(self.tmpdir.name, 'kernel.img')
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_identify_header(self):
+        self.assertEqual(identify_header(ARM64_IMAGE), 'arm64-image')
+        self.assertEqual(identify_header(BOOT_IMAGE), 'android-boot')
+        self.assertEqual(identify_header(b"\x1f\x8b\x08\x00"), 'gzip')
+        self.assertIsNone(identify_header(b"plain text"))
+
+    def test_kernel_score_prefers_recognised_headers(self):
+        self.assertGreater(kernel_score('boot.img', BOOT_IMAGE), kernel_score('kernel', b"garbage"))
+        self.assertIsNone(kernel_score('system.img', BOOT_IMAGE))
+        self.assertIsNone(kernel_score('kernel', b"PK\x03\x04"))
+
+    def test_extracts_best_direct_member(self):
+        with zipfile.ZipFile(self.zip_path, 'w') as zf:
+            zf.writestr('META-INF/kernel', b"not really a kernel")
+            zf.writestr('system.img', b"\x00" * 4096)
+            zf.writestr('boot/Image', ARM64_IMAGE)
+
+        with zipfile.ZipFile(self.zip_path) as zf:
+            source = extract_kernel_from_zip(zf, self.dest_path)
+
+        self.assertEqual(source, 'boot/Image')
+        with open(self.dest_path, 'rb') as f:
+            self.assertEqual(f.read(), ARM64_IMAGE)
+        self.assertFalse(os.path.exists(self.dest_path + '.part'))
+
+    def test_returns_none_without_candidates(self):
+        with zipfile.ZipFile(self.zip_path, 'w') as zf:
+            zf.writestr('readme.txt', b"hello")
+
+        with zipfile.ZipFile(self.zip_path) as zf:
+            self.assertIsNone(extract_kernel_from_zip(zf, self.dest_path))
+        self.assertFalse(os.path.exists(self.dest_path))
+
+    def test_scans_nested_tar_md5(self):
+        tar_data = io.BytesIO()
+        with tarfile.open(fileobj=tar_data, mode='w') as tar:
+            for name, data in (('system.img', b"\x00" * 4096), ('boot.img', BOOT_IMAGE)):
+                info = tarfile.TarInfo(name)
+                info.size = len(data)
+                tar.addfile(info, io.BytesIO(data))
+        with zipfile.ZipFile(self.zip_path, 'w') as zf:
+            zf.writestr('AP_G973F.tar.md5', tar_data.getvalue() + b"0123456789abcdef  AP_G973F.tar\n")
+
+        with zipfile.ZipFile(self.zip_path) as zf:
+            source = extract_kernel_from_zip(zf, self.dest_path)
+
+        self.assertEqual(source, 'AP_G973F.tar.md5/boot.img')
+        with open(self.dest_path, 'rb') as f:
+            self.assertEqual(f.read(), BOOT_IMAGE)
+
+    @unittest.skipUnless(lz4_frame or shutil.which('lz4'), "lz4 is not available")
+    def test_decompresses_lz4_member(self):
+        raw_path = os.path.join(self.tmpdir.name, 'boot.img')
+        with open(raw_path, 'wb') as f:
+            f.write(BOOT_IMAGE)
+        if lz4_frame:
+            compressed = lz4_frame.compress(BOOT_IMAGE)
+        else:
+            compressed = subprocess.run(['lz4', '-c', raw_path], capture_output=True, check=True).stdout
+        with zipfile.ZipFile(self.zip_path, 'w') as zf:
+            zf.writestr('boot.img.lz4', compressed)
+
+        with zipfile.ZipFile(self.zip_path) as zf:
+            source = extract_kernel_from_zip(zf, self.dest_path)
+
+        self.assertEqual(source, 'boot.img.lz4')
+        with open(self.dest_path, 'rb') as f:
+            self.assertEqual(f.read(), BOOT_IMAGE)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,117 @@
+import os
+import gzip
+import lzma
+import shutil
+import struct
+import tempfile
+import unittest
+import subprocess
+from unittest.mock import patch
+from kernel_version import find_banner, detect_kernel_version
+
+BANNER = b"Linux version 5.10.43-android12-9-00001-g2a8aeb0f2a1b (build-user@build-host) #1 SMP PREEMPT"
+KERNEL = b"\x00" * 56 + b"ARMd" + os.urandom(300000) + b"Linux version %s\0" + BANNER + b"\n\0" + os.urandom(300000)
+
+
+class TestKernelVersion(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def write(self, name, data):
+        path = os.path.join(self.tmpdir.name, name)
+        with open(path, 'wb') as f:
+            f.write(data)
+        return path
+
+    def test_banner_split_across_chunks(self):
+        data = b"junk Linux version %s " + BANNER + b"\ntrailing"
+        for size in (1, 3, 7, 64):
+            chunks = [data[i:i + size] for i in range(0, len(data), size)]
+            self.assertEqual(find_banner(iter(chunks)), BANNER.decode())
+
+    def test_stops_reading_after_banner(self):
+        consumed = []
+
+        def chunks():
+            for chunk in (b"x" * 10, BANNER + b"\n", b"never read"):
+                consumed.append(chunk)
+                yield chunk
+
+        self.assertEqual(find_banner(chunks()), BANNER.decode())
+        self.assertEqual(len(consumed), 2)
+
+    def test_raw_gzip_and_xz(self):
+        raw = detect_kernel_version(self.write('Image', KERNEL))
+        self.assertEqual(raw['version'], '5.10.43-android12-9-00001-g2a8aeb0f2a1b')
+        self.assertEqual((raw['format'], raw['compression'], raw['decompressed_size']),
+                         ('arm64-image', None, len(KERNEL)))
+
+        packed = detect_kernel_version(self.write('Image.gz', gzip.compress(KERNEL)))
+        self.assertEqual((packed['format'], packed['compression'], packed['decompressed_size']),
+                         ('arm64-image', 'gzip', len(KERNEL)))
+        self.assertEqual(packed['banner'], BANNER.decode())
+
+        xz = detect_kernel_version(self.write('Image.xz', lzma.compress(KERNEL)))
+        self.assertEqual((xz['version'], xz['compression'], xz['decompressed_size']),
+                         (raw['version'], 'xz', len(KERNEL)))
+
+    def test_gzip_with_appended_dtb(self):
+        dtb = b"\xd0\x0d\xfe\xed" + struct.pack(">5I", 0x200, 0x38, 0x100, 0x28, 17) + os.urandom(0x200 - 24)
+
+        info = detect_kernel_version(self.write('Image.gz-dtb', gzip.compress(KERNEL) + dtb + dtb))
+
+        self.assertEqual((info['format'], info['compression'], info['decompressed_size']),
+                         ('arm64-image', 'gzip', len(KERNEL)))
+
+        # Only inflating the whole member tells that it is cut short
+        with patch('kernel_version._gzip_member_end') as mock_member_end:
+            detect_kernel_version(self.write('Image.gz', gzip.compress(KERNEL)[:-100]))
+        mock_member_end.assert_not_called()
+        truncated = detect_kernel_version(self.write('Image.gz', gzip.compress(KERNEL)[:-100]), exact_size=True)
+        self.assertIsNone(truncated['decompressed_size'])
+        exact = detect_kernel_version(self.write('Image.gz-dtb', gzip.compress(KERNEL) + dtb), exact_size=True)
+        self.assertEqual(exact['decompressed_size'], len(KERNEL))
+
+    def test_zimage_payload(self):
+        header = bytearray(64)
+        header[0x24:0x28] = b"\x18\x28\x6f\x01"
+        zimage = bytes(header) + b"\x1f\x8b\x08 decompressor stub" + gzip.compress(KERNEL) + b"\xd0\x0d\xfe\xed"
+
+        info = detect_kernel_version(self.write('zImage', zimage))
+
+        self.assertEqual((info['format'], info['compression']), ('zimage', 'gzip'))
+        self.assertEqual(info['version'], '5.10.43-android12-9-00001-g2a8aeb0f2a1b')
+
+    def test_boot_image_kernel(self):
+        kernel = gzip.compress(KERNEL)
+        header = struct.pack("<8s10I16s512s32s1024s", b"ANDROID!", len(kernel), 0x8000, 0, 0x1000000,
+                             0, 0, 0x100, 2048, 0, 0, b"", b"console=ttyS0", b"\x00" * 32, b"")
+        image = header + b"\x00" * (-len(header) % 2048) + kernel + b"\x00" * (-len(kernel) % 2048)
+
+        info = detect_kernel_version(self.write('boot.img', image))
+
+        self.assertEqual(info['container'], 'android-boot')
+        self.assertEqual((info['compression'], info['decompressed_size']), ('gzip', len(KERNEL)))
+        self.assertEqual(info['version'], '5.10.43-android12-9-00001-g2a8aeb0f2a1b')
+
+    @unittest.skipUnless(shutil.which('lz4'), "lz4 command not installed")
+    def test_lz4_legacy(self):
+        raw = self.write('Image', KERNEL)
+        subprocess.run(['lz4', '-q', '-l', '-f', raw, raw + '.lz4'], check=True)
+
+        info = detect_kernel_version(raw + '.lz4')
+
+        self.assertEqual((info['format'], info['compression']), ('arm64-image', 'lz4-legacy'))
+        self.assertEqual(info['version'], '5.10.43-android12-9-00001-g2a8aeb0f2a1b')
+
+    def test_no_banner(self):
+        info = detect_kernel_version(self.write('kernel', b"\x00" * 56 + b"ARMd" + b"\x00" * 1000))
+        self.assertIsNone(info['version'])
+        self.assertEqual(info['format'], 'arm64-image')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+import os
+import struct
+import tempfile
+import unittest
+from unittest.mock import patch
+from provisioning import find_partition_sources, provision_partitions
+
+BLOCK_SIZE = 4096
+CLUSTER_SIZE = 65536
+
+
+def allocated_clusters(qcow2_path):
+    """Number of data clusters a qcow2 image points to in its L2 tables"""
+    with open(qcow2_path, 'rb') as f:
+        header = f.read(72)
+        cluster_bits = struct.unpack_from(">I", header, 20)[0]
+        l1_size, l1_offset = struct.unpack_from(">IQ", header, 36)
+        f.seek(l1_offset)
+        l1 = struct.unpack(f">{l1_size}Q", f.read(8 * l1_size))
+        count = 0
+        for entry in l1:
+            l2_offset = entry & 0x00FFFFFFFFFFFE00
+            if not l2_offset:
+                continue
+            f.seek(l2_offset)
+            l2 = struct.unpack(f">{(1 << cluster_bits) // 8}Q", f.read(1 << cluster_bits))
+            count += sum(1 for l2_entry in l2 if l2_entry & 0x00FFFFFFFFFFFE00)
+        return count
+
+
+class TestProvisioning(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.dump = self.tmpdir.name
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def write_raw(self, name, size, blocks):
+        """A raw image of the given size with data only at the given offsets, the rest left as holes"""
+        path = os.path.join(self.dump, name)
+        with open(path, 'wb') as f:
+            f.truncate(size)
+            for offset in blocks:
+                f.seek(offset)
+                f.write(os.urandom(BLOCK_SIZE))
+        return path
+
+    def test_only_data_blocks_are_allocated(self):
+        size = 4 * 1024 * 1024 * 1024
+        self.write_raw('system.img', size, [0, 3 * 1024 * 1024 * 1024])
+        # A data block that is all zeros stays unallocated too
+        with open(self.write_raw('vendor.img', 8 * 1024 * 1024, [CLUSTER_SIZE]), 'r+b') as f:
+            f.write(bytes(BLOCK_SIZE))
+        sources = find_partition_sources(self.dump)
+        outputs = {name: os.path.join(self.dump, f"vm1-{name}.qcow2") for name in sources}
+        progress = []
+
+        drives = provision_partitions(sources, outputs, cluster_size=CLUSTER_SIZE,
+                                      progress=lambda percent, message: progress.append(percent))
+
+        self.assertEqual([drive['partition'] for drive in drives], ['system', 'vendor'])
+        self.assertEqual(drives[0]['size'], size)
+        self.assertEqual(drives[0]['allocated'], 2 * CLUSTER_SIZE)
+        self.assertEqual(allocated_clusters(outputs['system']), 2)
+        self.assertEqual(allocated_clusters(outputs['vendor']), 1)
+        self.assertEqual(progress[-1], 100)
+
+    def test_partition_images_are_preferred_over_super(self):
+        self.write_raw('system.img', 1024 * 1024, [0])
+        self.write_raw('super.img', 1024 * 1024, [0])
+
+        with patch('provisioning.SuperImage') as mock_super:
+            mock_super.return_value.__enter__.return_value.__contains__.side_effect = lambda name: name == 'system'
+            self.assertEqual(find_partition_sources(self.dump),
+                             {'system': (os.path.join(self.dump, 'system.img'), None)})
+            mock_super.return_value.__enter__.return_value.__contains__.side_effect = (
+                lambda name: name in ('system', 'vendor'))
+            self.assertEqual(find_partition_sources(self.dump)['vendor'],
+                             (os.path.join(self.dump, 'super.img'), 'vendor'))
+
+    def test_failure_removes_built_images(self):
+        self.write_raw('system.img', 1024 * 1024, [0])
+        self.write_raw('vendor.img', 1024 * 1024, [0])
+        sources = find_partition_sources(self.dump)
+        outputs = {name: os.path.join(self.dump, f"vm1-{name}.qcow2") for name in sources}
+
+        def stop(percent, message):
+            raise InterruptedError("cancelled")
+
+        with self.assertRaises(InterruptedError):
+            provision_partitions(sources, outputs, max_workers=1, progress=stop)
+
+        self.assertFalse(any(os.path.exists(path) for path in outputs.values()))
+
+
+if __name__ == '__main__':
+    unittest.main()
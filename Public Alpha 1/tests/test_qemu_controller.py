@@ -1,6 +1,18 @@
+import os
+import asyncio
+import json
+import tempfile
+import subprocess
 import unittest
-from unittest.mock import patch, MagicMock
-from qemu_controller import QEMUController
+from unittest.mock import patch, MagicMock, AsyncMock
+from qemu_controller import QEMUController, QMPClient, QMPError
+
+
+def running_process():
+    process = MagicMock()
+    process.poll.return_value = None
+    return process
+
 
 class TestQEMUController(unittest.TestCase):
     def setUp(self):
@@ -41,12 +53,261 @@ class TestQEMUController(unittest.TestCase):
         mock_process.terminate.assert_called_once()
         self.assertIsNone(self.controller.process)
 
+    @patch('os.path.exists', return_value=True)
+    @patch('subprocess.Popen')
+    def test_start_multiple_vms(self, mock_popen, mock_exists):
+        mock_popen.side_effect = [running_process(), running_process()]
+
+        self.controller.start_emulator('Galaxy S10', 'One UI 1.0', 2048, 'kernel.img', 'recovery.img',
+                                       vm_name='vm1', disk_path='/vms/vm1.qcow2')
+        self.controller.start_emulator('Galaxy S10', 'One UI 1.0', 2048, 'kernel.img', 'recovery.img',
+                                       vm_name='vm2', disk_path='/vms/vm2.qcow2')
+
+        self.assertTrue(self.controller.is_running('vm1'))
+        self.assertTrue(self.controller.is_running('vm2'))
+        self.assertEqual(self.controller.vms['vm1'].disk_path, '/vms/vm1.qcow2')
+        self.assertNotEqual(self.controller.vms['vm1'].ports['adb'], self.controller.vms['vm2'].ports['adb'])
+
+    @patch('os.path.exists', return_value=True)
+    @patch('subprocess.Popen')
+    def test_command_line_is_the_one_started(self, mock_popen, mock_exists):
+        mock_popen.return_value = running_process()
+        self.assertIsNone(self.controller.get_command_line('vm1'))
+
+        with patch.object(self.controller, '_build_command', wraps=self.controller._build_command) as mock_build:
+            cmd = self.controller.start_emulator('Galaxy S10', 'One UI 1.0', 2048, 'kernel.img', 'recovery.img',
+                                                 vm_name='vm1', disk_path='/vms/vm1.qcow2')
+
+            self.assertEqual(self.controller.get_command_line('vm1'), " ".join(cmd))
+            self.assertEqual(mock_build.call_count, 1)
+
+    @patch('os.path.exists', return_value=True)
+    @patch('subprocess.Popen')
+    def test_start_running_vm_raises(self, mock_popen, mock_exists):
+        mock_popen.return_value = running_process()
+        self.controller.start_emulator('Galaxy S10', 'One UI 1.0', 2048, 'kernel.img', 'recovery.img',
+                                       vm_name='vm1', disk_path='/vms/vm1.qcow2')
+
+        with self.assertRaises(RuntimeError):
+            self.controller.start_emulator('Galaxy S10', 'One UI 1.0', 2048, 'kernel.img', 'recovery.img',
+                                           vm_name='vm1', disk_path='/vms/vm1.qcow2')
+
+    def test_stop_named_vm(self):
+        first, second = running_process(), running_process()
+        self.controller._get_or_create_instance('vm1').process = first
+        self.controller._get_or_create_instance('vm2').process = second
+        states = []
+        self.controller.add_state_listener(lambda name, state: states.append((name, state)))
+
+        self.controller.stop_emulator_async('vm1').result()
+
+        first.terminate.assert_called_once()
+        second.terminate.assert_not_called()
+        self.assertEqual(self.controller.get_vm_status('vm1')['state'], 'stopped')
+        self.assertIn(('vm1', 'stopped'), states)
+        self.assertTrue(self.controller.is_running('vm2'))
+
+    def test_stop_emulator_powers_down_through_qmp(self):
+        process = running_process()
+        instance = self.controller._get_or_create_instance('vm1')
+        instance.process = process
+        instance.qmp = MagicMock()
+        instance.qmp.execute = AsyncMock(return_value={})
+
+        self.controller.stop_emulator('vm1')
+
+        instance.qmp.execute.assert_awaited_once_with('system_powerdown', timeout=5)
+        process.kill.assert_not_called()
+        self.assertFalse(self.controller.is_running('vm1'))
+
+    def test_stop_emulator_kills_when_powerdown_times_out(self):
+        process = running_process()
+        process.wait.side_effect = [subprocess.TimeoutExpired('qemu', 1), 0]
+        instance = self.controller._get_or_create_instance('vm1')
+        instance.process = process
+        instance.qmp = MagicMock()
+        instance.qmp.execute = AsyncMock(return_value={})
+
+        self.controller.stop_emulator('vm1', timeout=1)
+
+        process.kill.assert_called_once()
+        self.assertEqual(self.controller.get_vm_status('vm1')['state'], 'stopped')
+
+    def test_snapshot_tag_follows_boot_configuration(self):
+        tag = self.controller.get_snapshot_tag('Galaxy S10', 2048, 'kernel.img', 'recovery.img')
+
+        self.assertTrue(tag.startswith('samsemung-boot-'))
+        self.assertEqual(tag, self.controller.get_snapshot_tag('Galaxy S10', 2048, 'kernel.img', 'recovery.img'))
+        self.assertNotEqual(tag, self.controller.get_snapshot_tag('Galaxy S10', 4096, 'kernel.img', 'recovery.img'))
+        self.assertNotEqual(tag, self.controller.get_snapshot_tag('Galaxy S10', 2048, 'other.img', 'recovery.img'))
+
+    @patch('os.path.exists', return_value=True)
+    @patch('subprocess.Popen')
+    def test_fast_start_loads_matching_snapshot(self, mock_popen, mock_exists):
+        mock_popen.return_value = running_process()
+        tag = self.controller.get_snapshot_tag('Galaxy S10', 2048, 'kernel.img', 'recovery.img')
+        snapshots = [{'tag': tag}, {'tag': 'samsemung-boot-stale'}, {'tag': 'user-snapshot'}]
+
+        with patch.object(self.controller, 'list_snapshots', return_value=snapshots), \
+                patch.object(self.controller, 'delete_snapshot') as mock_delete:
+            cmd = self.controller.start_emulator('Galaxy S10', 'One UI 1.0', 2048, 'kernel.img', 'recovery.img',
+                                                 vm_name='vm1', disk_path='/vms/vm1.qcow2', fast_start=True)
+
+        mock_delete.assert_called_once_with('/vms/vm1.qcow2', 'samsemung-boot-stale')
+        self.assertEqual(cmd[cmd.index('-loadvm') + 1], tag)
+
+    @patch('os.path.exists', return_value=True)
+    @patch('subprocess.Popen')
+    def test_fast_start_without_snapshot_cold_boots(self, mock_popen, mock_exists):
+        mock_popen.return_value = running_process()
+
+        with patch.object(self.controller, 'list_snapshots', return_value=[]):
+            cmd = self.controller.start_emulator('Galaxy S10', 'One UI 1.0', 2048, 'kernel.img', 'recovery.img',
+                                                 vm_name='vm1', disk_path='/vms/vm1.qcow2', fast_start=True)
+
+        self.assertNotIn('-loadvm', cmd)
+
+    @patch('subprocess.run')
+    def test_create_linked_clone(self, mock_run):
+        with patch('os.path.exists', side_effect=lambda path: path == '/base/golden.qcow2'), \
+                patch('os.makedirs'):
+            clone_path = self.controller.create_linked_clone('/base/golden.qcow2', 'vm1', 8192)
+
+        self.assertEqual(clone_path, self.controller.get_vm_disk_path('vm1'))
+        args = mock_run.call_args[0][0]
+        self.assertEqual(args[1:4], ['create', '-f', 'qcow2'])
+        self.assertEqual(args[args.index('-b') + 1], '/base/golden.qcow2')
+        self.assertEqual(args[-2:], [clone_path, '8192M'])
+
+    @patch('os.access', return_value=True)
+    @patch('platform.machine', return_value='aarch64')
+    def test_select_accelerator_prefers_kvm_for_matching_host(self, mock_machine, mock_access):
+        with patch('sys.platform', 'linux'):
+            accelerator, args = self.controller.select_accelerator('arm64', 4)
+
+        self.assertEqual(accelerator, 'kvm')
+        self.assertEqual(args, ['-accel', 'kvm', '-cpu', 'host', '-smp', '4'])
+
+    @patch('os.access', return_value=True)
+    @patch('platform.machine', return_value='x86_64')
+    def test_select_accelerator_falls_back_to_multithreaded_tcg(self, mock_machine, mock_access):
+        self.config['tcg_tb_size'] = 256
+        with patch('sys.platform', 'linux'):
+            accelerator, args = self.controller.select_accelerator('arm64', 2)
+
+        self.assertEqual(accelerator, 'tcg')
+        self.assertEqual(args, ['-accel', 'tcg,thread=multi,tb-size=256', '-cpu', 'cortex-a57', '-smp', '2'])
+
+    @patch('os.access', return_value=False)
+    @patch('subprocess.Popen')
+    def test_test_emulator_uses_selected_accelerator_and_cpu(self, mock_popen, mock_access):
+        process = running_process()
+        process.wait.side_effect = subprocess.TimeoutExpired('qemu', 5)
+        mock_popen.return_value = process
+
+        cmd = self.controller.test_emulator('Galaxy S10', 2048)
+
+        self.assertEqual(cmd[1:7], ['-machine', 'type=virt', '-accel', 'tcg,thread=multi,tb-size=512',
+                                    '-cpu', 'cortex-a57'])
+        self.assertEqual(cmd[7:9], ['-smp', '1'])
+
+    def test_drive_args_virtio_blk_with_iothread(self):
+        with patch('sys.platform', 'linux'):
+            args = self.controller._build_drive_args('/tmp/disk.qcow2', {'aio': 'io_uring', 'l2_cache_size': '4M'})
+
+        self.assertEqual(args[:2], ['-object', 'iothread,id=iothread0'])
+        self.assertIn('aio=io_uring', args[3])
+        self.assertIn('discard=unmap', args[3])
+        self.assertIn('l2-cache-size=4M', args[3])
+        self.assertEqual(args[4:], ['-device', 'virtio-blk-pci,drive=drive0,iothread=iothread0'])
+
+    def test_drive_args_native_aio_requires_cache_none(self):
+        with patch('sys.platform', 'linux'):
+            args = self.controller._build_drive_args('/tmp/disk.qcow2', {'aio': 'native', 'cache': 'writeback',
+                                                                         'interface': 'virtio-scsi'})
+
+        drive = args[args.index('-drive') + 1]
+        self.assertIn('aio=threads', drive)
+        self.assertIn('scsi-hd,drive=drive0,bus=scsi0.0', args)
+
+    @patch('qemu_controller.ingest_firmware', return_value={"disk": None})
+    def test_import_firmware_writes_the_vm_disk(self, mock_ingest):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            package = os.path.join(tmpdir, 'AP_G973FXXU9FUCD.tar.md5')
+            open(package, 'wb').close()
+            self.controller.disk_dir = os.path.join(tmpdir, 'disks')
+
+            self.controller.import_firmware(package, os.path.join(tmpdir, 'dump'), vm_name='vm1')
+
+            mock_ingest.assert_called_once_with(package, os.path.join(tmpdir, 'dump'), self.controller.artifacts,
+                                                os.path.join(tmpdir, 'disks', 'vm1.qcow2'), cluster_size=None,
+                                                progress=None)
+            open(os.path.join(tmpdir, 'disks', 'vm1.qcow2'), 'wb').close()
+            with self.assertRaises(FileExistsError):
+                self.controller.import_firmware(package, vm_name='vm1')
+            with self.assertRaises(FileNotFoundError):
+                self.controller.import_firmware(os.path.join(tmpdir, 'missing.tar.md5'))
+
+    def test_drive_args_partition_drive_has_serial(self):
+        with patch('sys.platform', 'linux'):
+            args = self.controller._build_drive_args('/tmp/vm1-system.qcow2', index=1, serial='system')
+
+        self.assertEqual(args[:2], ['-object', 'iothread,id=iothread1'])
+        self.assertEqual(args[-2:], ['-device', 'virtio-blk-pci,drive=drive1,iothread=iothread1,serial=system'])
+
     @patch('os.path.exists')
     def test_get_kernel_path(self, mock_exists):
         mock_exists.return_value = True
         kernel_path = self.controller._get_kernel_path('Galaxy S10')
         self.assertEqual(kernel_path, '/path/to/dump/boot/kernel')
 
+class TestQMPClient(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.server = await asyncio.start_server(self.handle_client, '127.0.0.1', 0)
+        self.port = self.server.sockets[0].getsockname()[1]
+        self.events = []
+        self.client = QMPClient('127.0.0.1', self.port,
+                                event_callback=lambda event, data: self.events.append(event))
+        await self.client.connect()
+
+    async def asyncTearDown(self):
+        await self.client.close()
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def handle_client(self, reader, writer):
+        writer.write(json.dumps({'QMP': {'version': {}, 'capabilities': []}}).encode() + b'\n')
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            message = json.loads(line)
+            if message['execute'] == 'query-status':
+                reply = {'return': {'status': 'running', 'running': True}}
+            elif message['execute'] == 'stop':
+                writer.write(json.dumps({'event': 'STOP', 'data': {}}).encode() + b'\n')
+                reply = {'return': {}}
+            elif message['execute'] == 'bogus':
+                reply = {'error': {'class': 'CommandNotFound', 'desc': 'bogus'}}
+            else:
+                reply = {'return': {}}
+            reply['id'] = message['id']
+            writer.write(json.dumps(reply).encode() + b'\n')
+            await writer.drain()
+        writer.close()
+
+    async def test_execute_returns_result(self):
+        status = await self.client.execute('query-status')
+        self.assertEqual(status['status'], 'running')
+
+    async def test_events_are_dispatched(self):
+        await self.client.execute('stop')
+        self.assertEqual(self.events, ['STOP'])
+
+    async def test_error_response_raises(self):
+        with self.assertRaises(QMPError):
+            await self.client.execute('bogus')
+
 if __name__ == '__main__':
     unittest.main()
 
@@ -0,0 +1,71 @@
+import os
+import struct
+import tempfile
+import unittest
+from unittest.mock import patch
+from signature_scanner import scan_files
+from qemu_controller import QEMUController
+
+ARM64_IMAGE = struct.pack("<IIQQQQQQ", 0, 0, 0x80000, 0x1000000, 0xA, 0, 0, 0) + b"ARMd" + b"\x00" * 4
+BOOT_HEADER = b"ANDROID!" + struct.pack("<8I", 100, 0x8000, 0, 0, 0, 0, 0x100, 4096) + struct.pack("<I", 2)
+DTB = b"\xd0\x0d\xfe\xed" + struct.pack(">5I", 0x200, 0x38, 0x100, 0x28, 17)
+
+
+class TestSignatureScanner(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        # A raw dump with a boot image, a DTB and an arm64 kernel straddling the 8 KiB chunk boundary
+        self.blob = bytearray(os.urandom(64 * 1024).replace(b"\x1f\x8b", b"\x00\x00"))
+        self.place(0x1000, BOOT_HEADER)
+        self.place(0x1ff0, ARM64_IMAGE)
+        self.place(0x5000, DTB)
+        self.place(0x6000, b"ANDROID!" + b"\xff" * 40)
+        self.path = os.path.join(self.tmpdir.name, 'mmcblk0.raw')
+        with open(self.path, 'wb') as f:
+            f.write(self.blob)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def place(self, offset, data):
+        self.blob[offset:offset + len(data)] = data
+
+    def found(self, candidates, kinds=("android-boot", "arm64-image", "dtb")):
+        return [(c.kind, c.offset) for c in candidates if c.kind in kinds]
+
+    def test_ranked_candidates_with_offsets(self):
+        candidates = scan_files([self.path], chunk_size=8192, max_workers=1)
+
+        self.assertEqual(self.found(candidates), [("android-boot", 0x1000), ("arm64-image", 0x1ff0), ("dtb", 0x5000)])
+        self.assertEqual(candidates[0].to_dict(), {"path": self.path, "offset": 0x1000, "kind": "android-boot",
+                                                   "score": 100})
+
+    def test_magic_across_chunk_boundary(self):
+        for offset in (8184, 8185, 8188, 8191, 8192):
+            self.blob[0x1f00:0x2100] = bytes(0x200)
+            self.place(offset, b"VNDRBOOT")
+            with open(self.path, 'wb') as f:
+                f.write(self.blob)
+
+            candidates = scan_files([self.path], kinds=["vendor-boot"], chunk_size=8192, max_workers=1)
+
+            self.assertEqual(self.found(candidates, ("vendor-boot",)), [("vendor-boot", offset)])
+
+    def test_parallel_scan_matches_serial(self):
+        serial = scan_files([self.path], chunk_size=8192, max_workers=1)
+        with patch('signature_scanner.MIN_PARALLEL_SIZE', 0):
+            parallel = scan_files([self.path], chunk_size=8192, max_workers=2)
+
+        self.assertEqual([c.to_dict() for c in parallel], [c.to_dict() for c in serial])
+
+    def test_thorough_kernel_search_by_signature(self):
+        with open(os.path.join(self.tmpdir.name, 'blob.bin'), 'wb') as f:
+            f.write(ARM64_IMAGE + b"\x00" * 1024)
+
+        controller = QEMUController({'qemu_path': '/path/to/qemu', 'samsung_models': {}})
+        self.assertEqual(controller._thorough_kernel_search(self.tmpdir.name),
+                         os.path.join(self.tmpdir.name, 'blob.bin'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,152 @@
+import os
+import zlib
+import struct
+import tempfile
+import unittest
+from sparse_image import (convert_image, open_sparse_image, crc32_zeros, SparseImageError, SPARSE_MAGIC,
+                          CHUNK_TYPE_RAW, CHUNK_TYPE_FILL, CHUNK_TYPE_DONT_CARE, CHUNK_TYPE_CRC32)
+from qcow2 import Qcow2Writer
+
+BLOCK_SIZE = 4096
+
+
+def write_sparse(path, chunks, crc_chunk=True, checksum=True):
+    """Write a sparse image from ('raw', data), ('fill', pattern, blocks) and ('skip', blocks) chunks.
+
+    Returns the expanded image.
+    """
+    expanded, body, count = b"", b"", 0
+    for chunk in chunks:
+        if chunk[0] == "raw":
+            blocks = len(chunk[1]) // BLOCK_SIZE
+            body += struct.pack("<HHII", CHUNK_TYPE_RAW, 0, blocks, 12 + len(chunk[1])) + chunk[1]
+            expanded += chunk[1]
+        elif chunk[0] == "fill":
+            body += struct.pack("<HHII", CHUNK_TYPE_FILL, 0, chunk[2], 16) + chunk[1]
+            expanded += chunk[1] * (chunk[2] * BLOCK_SIZE // 4)
+        else:
+            body += struct.pack("<HHII", CHUNK_TYPE_DONT_CARE, 0, chunk[1], 12)
+            expanded += bytes(chunk[1] * BLOCK_SIZE)
+        count += 1
+    crc = zlib.crc32(expanded)
+    if crc_chunk:
+        body += struct.pack("<HHIII", CHUNK_TYPE_CRC32, 0, 0, 16, crc)
+        count += 1
+    header = struct.pack("<IHHHHIIII", SPARSE_MAGIC, 1, 0, 28, 12, BLOCK_SIZE, len(expanded) // BLOCK_SIZE, count,
+                         crc if checksum else 0)
+    with open(path, "wb") as f:
+        f.write(header + body)
+    return expanded
+
+
+def read_qcow2(path):
+    """Guest content and number of allocated data clusters of a qcow2 image, checking its refcounts"""
+    with open(path, "rb") as f:
+        image = f.read()
+    (magic, version, _, _, cluster_bits, size, _, l1_size, l1_offset, refcount_offset, refcount_clusters,
+     _, _, _, _, _, refcount_order, _) = struct.unpack_from(">4sIQIIQIIQQIIQQQQII", image, 0)
+    assert (magic, version, refcount_order) == (b"QFI\xfb", 3, 4)
+    cluster_size = 1 << cluster_bits
+    used = {0}
+    content = bytearray(size)
+    allocated = 0
+    for l1_index, l1_entry in enumerate(struct.unpack_from(f">{l1_size}Q", image, l1_offset)):
+        l2_offset = l1_entry & ((1 << 62) - 1)
+        if not l2_offset:
+            continue
+        used.add(l2_offset // cluster_size)
+        for l2_index, l2_entry in enumerate(struct.unpack_from(f">{cluster_size // 8}Q", image, l2_offset)):
+            data_offset = l2_entry & ((1 << 62) - 1)
+            if data_offset:
+                guest = (l1_index * (cluster_size // 8) + l2_index) * cluster_size
+                content[guest:guest + cluster_size] = image[data_offset:data_offset + cluster_size]
+                used.add(data_offset // cluster_size)
+                allocated += 1
+    used.update(range(l1_offset // cluster_size, (l1_offset + l1_size * 8 - 1) // cluster_size + 1))
+    used.update(range(refcount_offset // cluster_size, refcount_offset // cluster_size + refcount_clusters))
+    refcounts = []
+    for block_offset in struct.unpack_from(f">{refcount_clusters * cluster_size // 8}Q", image, refcount_offset):
+        if block_offset:
+            used.add(block_offset // cluster_size)
+            refcounts.extend(struct.unpack_from(f">{cluster_size // 2}H", image, block_offset))
+    assert {index for index, refcount in enumerate(refcounts) if refcount} == used, "refcounts do not match"
+    return bytes(content), allocated
+
+
+class TestSparseImage(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.sparse_path = os.path.join(self.tmpdir.name, 'system.img')
+        self.expanded = write_sparse(self.sparse_path, [
+            ("raw", os.urandom(3 * BLOCK_SIZE)),
+            ("skip", 40),
+            ("fill", b"\x00\x00\x00\x00", 300),
+            ("raw", bytes(BLOCK_SIZE) + os.urandom(BLOCK_SIZE)),
+            ("fill", b"\xde\xad\xbe\xef", 2),
+            ("skip", 17),
+        ])
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_convert_to_raw(self):
+        output = os.path.join(self.tmpdir.name, 'system.raw')
+
+        result = convert_image(self.sparse_path, output)
+
+        with open(output, 'rb') as f:
+            self.assertEqual(f.read(), self.expanded)
+        self.assertEqual((result["sparse"], result["size"]), (True, len(self.expanded)))
+        self.assertEqual(result["crc32"], f"{zlib.crc32(self.expanded):08x}")
+
+    def test_convert_to_qcow2_allocates_only_data_clusters(self):
+        output = os.path.join(self.tmpdir.name, 'system.qcow2')
+
+        result = convert_image(self.sparse_path, output, "qcow2")
+
+        content, allocated = read_qcow2(output)
+        self.assertEqual(content, self.expanded)
+        # The first raw chunk, and the second one with the non-zero fill right after it
+        self.assertEqual(allocated, 2)
+        self.assertEqual(result["allocated"], 2 * 64 * 1024)
+
+    def test_crc_mismatch_fails_and_removes_output(self):
+        with open(self.sparse_path, 'r+b') as f:
+            f.seek(28 + 12 + 100)
+            f.write(b"corrupted")
+        output = os.path.join(self.tmpdir.name, 'system.raw')
+
+        with self.assertRaises(SparseImageError):
+            convert_image(self.sparse_path, output)
+        self.assertFalse(os.path.exists(output))
+
+    def test_view_maps_chunks_without_expanding(self):
+        with open_sparse_image(self.sparse_path) as view:
+            view.seek(2 * BLOCK_SIZE)
+            self.assertEqual(view.read(BLOCK_SIZE * 2), self.expanded[2 * BLOCK_SIZE:4 * BLOCK_SIZE])
+            # Across the second raw chunk into the non-zero fill
+            self.assertEqual(view.read_at(344 * BLOCK_SIZE + 10, BLOCK_SIZE + 7),
+                             self.expanded[344 * BLOCK_SIZE + 10:345 * BLOCK_SIZE + 17])
+            self.assertEqual(view.size, len(self.expanded))
+
+    def test_crc32_zeros_matches_zlib(self):
+        for crc, length in [(0, 0), (0, 1), (0x12345678, 4096), (0xFFFFFFFF, 3 * 1024 * 1024 + 7)]:
+            self.assertEqual(crc32_zeros(crc, length), zlib.crc32(bytes(length), crc))
+
+
+class TestQcow2Writer(unittest.TestCase):
+    def test_refcounts_cover_many_small_clusters(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, 'disk.qcow2')
+            data = os.urandom(700 * 512)
+            with Qcow2Writer(path, 4 * 1024 * 1024, cluster_size=512) as writer:
+                writer.write(100, data[:1000])
+                writer.write(1100, data[1000:])
+
+            content, allocated = read_qcow2(path)
+            self.assertEqual(content[100:100 + len(data)], data)
+            self.assertEqual(allocated, 701)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,48 @@
+import os
+import sys
+import tempfile
+import unittest
+from startup_profile import StartupProfiler
+
+
+class TestStartupProfiler(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        with open(os.path.join(self.tmpdir.name, 'profiled_outer.py'), 'w') as f:
+            f.write("import time\nimport profiled_inner\ntime.sleep(0.02)\n")
+        with open(os.path.join(self.tmpdir.name, 'profiled_inner.py'), 'w') as f:
+            f.write("import time\ntime.sleep(0.05)\nVALUE = 42\n")
+        sys.path.insert(0, self.tmpdir.name)
+        self.profiler = StartupProfiler()
+
+    def tearDown(self):
+        self.profiler.disable()
+        sys.path.remove(self.tmpdir.name)
+        for name in ('profiled_outer', 'profiled_inner'):
+            sys.modules.pop(name, None)
+        self.tmpdir.cleanup()
+
+    def test_import_and_phase_timings(self):
+        self.profiler.enable()
+        with self.profiler.phase("import outer"):
+            import profiled_outer
+
+        self.assertEqual(profiled_outer.profiled_inner.VALUE, 42)
+        outer_total, outer_self = self.profiler.imports['profiled_outer']
+        inner_total, inner_self = self.profiler.imports['profiled_inner']
+        self.assertGreaterEqual(inner_self, 0.05)
+        self.assertGreaterEqual(outer_total, inner_total + 0.02)
+        self.assertLess(outer_self, inner_self)
+        self.assertEqual([name for name, _ in self.profiler.phases], ["import outer"])
+        self.assertIn("profiled_inner", self.profiler.report())
+
+    def test_disabled_profiler_records_nothing(self):
+        with self.profiler.phase("ignored"):
+            import profiled_outer  # noqa: F401
+
+        self.assertEqual(self.profiler.phases, [])
+        self.assertEqual(self.profiler.imports, {})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,177 @@
+import os
+import shutil
+import struct
+import hashlib
+import tempfile
+import unittest
+import subprocess
+from super_image import SuperImage, SuperImageError, LP_PARTITION_ATTR_READONLY
+from fs_image import PartitionImages, detect_filesystem
+from sparse_image import convert_image
+from build_prop import PropertyIndex
+
+MKFS_EXT4 = shutil.which("mkfs.ext4") or shutil.which("mke2fs")
+SECTOR_SIZE = 512
+METADATA_MAX_SIZE = 65536
+DATA_START = 1024 * 1024
+
+
+def build_super(path, partitions, slot_count=2):
+    """Write a super image from a dict of partition names to lists of extents.
+
+    An extent is bytes (a multiple of 512 long) or an int number of zero sectors. The data of
+    the extents is laid out in reverse, so that the partitions are not stored in order.
+    """
+    extents, entries, placed, data = [], [], [], {}
+    offset = DATA_START
+    for name, parts in partitions.items():
+        entries.append((name, len(extents), len(parts)))
+        for part in parts:
+            if isinstance(part, int):
+                extents.append(struct.pack("<QIQI", part, 1, 0, 0))
+            else:
+                extents.append(None)
+                placed.append((len(extents) - 1, part))
+    for index, part in reversed(placed):
+        extents[index] = struct.pack("<QIQI", len(part) // SECTOR_SIZE, 0, offset // SECTOR_SIZE, 0)
+        data[offset] = part
+        offset += len(part)
+    size = offset
+
+    tables = [
+        b"".join(struct.pack("<36sIIII", name.encode(), LP_PARTITION_ATTR_READONLY, first, count, 0)
+                 for name, first, count in entries),
+        b"".join(extents),
+        struct.pack("<36sIQ", b"default", 0, 0),
+        struct.pack("<QIIQ36sI", DATA_START // SECTOR_SIZE, 0, 0, size, b"super", 0),
+    ]
+    descriptors, table_offset = [], 0
+    for table, entry_size in zip(tables, (52, 24, 48, 64)):
+        descriptors += [table_offset, len(table) // entry_size, entry_size]
+        table_offset += len(table)
+    blob = b"".join(tables)
+    header = struct.pack("<IHHI32sI32s12I", 0x414C5030, 10, 0, 128, bytes(32), len(blob),
+                         hashlib.sha256(blob).digest(), *descriptors)
+    header = header[:12] + hashlib.sha256(header).digest() + header[44:]
+    metadata = header + blob
+
+    geometry = struct.pack("<II32sIII", 0x616C4467, 52, bytes(32), METADATA_MAX_SIZE, slot_count, 4096)
+    geometry = geometry[:8] + hashlib.sha256(geometry).digest() + geometry[40:]
+
+    with open(path, "wb") as f:
+        f.truncate(size)
+        for copy in range(2):
+            f.seek(4096 + copy * 4096)
+            f.write(geometry)
+        for slot in range(2 * slot_count):
+            f.seek(3 * 4096 + slot * METADATA_MAX_SIZE)
+            f.write(metadata)
+        for part_offset, part in data.items():
+            f.seek(part_offset)
+            f.write(part)
+
+
+class TestSuperImage(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.super_path = os.path.join(self.tmpdir.name, 'super.img')
+        self.system = [os.urandom(8 * SECTOR_SIZE), os.urandom(3 * SECTOR_SIZE)]
+        self.vendor = os.urandom(5 * SECTOR_SIZE)
+        build_super(self.super_path, {
+            "system": self.system,
+            "vendor": [self.vendor, 2],
+            "product_a": [os.urandom(SECTOR_SIZE)],
+            "product_b": [],
+        })
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_partitions_map_onto_the_super_image(self):
+        self.assertEqual(detect_filesystem(self.super_path), "super")
+        with SuperImage(self.super_path) as image:
+            self.assertEqual(list(image.partitions), ["system", "vendor", "product_a", "product_b"])
+            self.assertTrue(image.partitions["system"].readonly)
+            with image.open("system") as system:
+                self.assertEqual(system.read(), b"".join(self.system))
+                self.assertEqual(system.read_at(8 * SECTOR_SIZE - 2, 4), self.system[0][-2:] + self.system[1][:2])
+            with image.open("vendor") as vendor:
+                self.assertEqual(vendor.read(), self.vendor + bytes(2 * SECTOR_SIZE))
+            # Looked up without its slot suffix, skipping the empty inactive slot
+            self.assertEqual(image.partition("product").name, "product_a")
+            self.assertNotIn("odm", image)
+            with self.assertRaises(FileNotFoundError):
+                image.open("odm")
+
+    def test_falls_back_to_backup_metadata(self):
+        with open(self.super_path, 'r+b') as f:
+            f.seek(3 * 4096 + 200)
+            f.write(b"corrupted")
+
+        with SuperImage(self.super_path) as image, image.open("system") as system:
+            self.assertEqual(system.read(), b"".join(self.system))
+
+    def test_rejects_images_without_metadata(self):
+        other = os.path.join(self.tmpdir.name, 'other.img')
+        with open(other, 'wb') as f:
+            f.write(bytes(64 * 1024))
+
+        with self.assertRaises(SuperImageError):
+            SuperImage(other)
+
+    def test_sparse_super_image(self):
+        with open(self.super_path, 'rb') as f:
+            data = f.read()
+        sparse_path = os.path.join(self.tmpdir.name, 'super_sparse.img')
+        with open(sparse_path, 'wb') as f:
+            f.write(struct.pack("<IHHHHIIII", 0xED26FF3A, 1, 0, 28, 12, 4096, len(data) // 4096, 1, 0))
+            f.write(struct.pack("<HHII", 0xCAC1, 0, len(data) // 4096, 12 + len(data)) + data)
+
+        with SuperImage(sparse_path) as image, image.open("vendor") as vendor:
+            self.assertEqual(vendor.read(len(self.vendor)), self.vendor)
+
+    def test_partition_converts_without_unpacking(self):
+        output = os.path.join(self.tmpdir.name, 'system.raw')
+        with SuperImage(self.super_path) as image, image.open("system") as system:
+            result = convert_image(system, output)
+
+        with open(output, 'rb') as f:
+            self.assertEqual(f.read(), b"".join(self.system))
+        self.assertEqual(result["source"], f"{self.super_path}:system")
+
+
+@unittest.skipUnless(MKFS_EXT4, "mkfs.ext4 not available")
+class TestSuperImageDump(unittest.TestCase):
+    def test_property_index_reads_partitions_of_super_image(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            images = {}
+            for partition, prop in (("system", "ro.product.system.model=SM-G973F"),
+                                    ("vendor", "ro.product.vendor.model=SM-G973U")):
+                root = os.path.join(tmpdir, partition)
+                os.makedirs(root)
+                with open(os.path.join(root, 'build.prop'), 'w') as f:
+                    f.write(prop + "\n")
+                image_path = os.path.join(tmpdir, f"{partition}.ext4")
+                result = subprocess.run([MKFS_EXT4, "-q", "-F", "-d", root, image_path, "4M"],
+                                        capture_output=True, text=True)
+                if result.returncode != 0:
+                    self.skipTest(f"mkfs.ext4 cannot build the image: {result.stderr.strip()}")
+                with open(image_path, 'rb') as f:
+                    data = f.read()
+                # Split in two extents so that the filesystem is not contiguous in super.img
+                images[partition] = [data[:1024 * 1024], data[1024 * 1024:]]
+            dump = os.path.join(tmpdir, 'dump')
+            os.makedirs(dump)
+            build_super(os.path.join(dump, 'super.img'), images)
+
+            with PartitionImages(dump) as partition_images:
+                self.assertEqual(partition_images.image("vendor").partition, "vendor")
+            index = PropertyIndex.from_dump(dump)
+
+            self.assertEqual(index.get("ro.product.system.model"), "SM-G973F")
+            self.assertEqual(index.get("ro.product.vendor.model"), "SM-G973U")
+            self.assertEqual(index.files, [os.path.join(dump, 'super.img')])
+
+
+if __name__ == '__main__':
+    unittest.main()
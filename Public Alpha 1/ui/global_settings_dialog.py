@@ -1,6 +1,6 @@
 from PyQt6.QtWidgets import (QDialog, QVBoxLayout, QHBoxLayout, QLabel,
                              QLineEdit, QPushButton, QFileDialog, QFormLayout,
-                             QComboBox)
+                             QComboBox, QSpinBox)
 from PyQt6.QtCore import pyqtSignal
 from config import CONFIG, save_config
 from .font_manager import FontManager
@@ -30,6 +30,19 @@ class GlobalSettingsDialog(QDialog):
         self.qemu_exec_edit = QLineEdit(CONFIG['qemu_executable'])
         form_layout.addRow("QEMU Executable:", self.qemu_exec_edit)
 
+        # Accelerator
+        self.accelerator_combo = QComboBox()
+        self.accelerator_combo.addItems(["auto", "kvm", "tcg"])
+        self.accelerator_combo.setCurrentText(CONFIG.get('accelerator', 'auto'))
+        form_layout.addRow("Accelerator:", self.accelerator_combo)
+
+        # TCG translation block cache
+        self.tb_size_spin = QSpinBox()
+        self.tb_size_spin.setRange(32, 4096)
+        self.tb_size_spin.setSuffix(" MB")
+        self.tb_size_spin.setValue(CONFIG.get('tcg_tb_size', 512))
+        form_layout.addRow("TCG Translation Cache:", self.tb_size_spin)
+
         # Font Selection
         self.font_combo = QComboBox()
         available_fonts = FontManager.load_fonts()
@@ -61,6 +74,8 @@ class GlobalSettingsDialog(QDialog):
     def save_settings(self):
         CONFIG['qemu_path'] = self.qemu_path_edit.text()
         CONFIG['qemu_executable'] = self.qemu_exec_edit.text()
+        CONFIG['accelerator'] = self.accelerator_combo.currentText()
+        CONFIG['tcg_tb_size'] = self.tb_size_spin.value()
         CONFIG['font'] = self.font_combo.currentText()
         save_config(CONFIG)
         self.settings_updated.emit()
@@ -0,0 +1,253 @@
+import time
+import logging
+import itertools
+import threading
+from PyQt6.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QPushButton, QTreeWidget, QTreeWidgetItem,
+                             QAbstractItemView)
+from PyQt6.QtCore import QObject, QRunnable, QThreadPool, QTimer, Qt, pyqtSignal
+from config import CONFIG
+
+QUEUED = "queued"
+RUNNING = "running"
+FINISHED = "finished"
+FAILED = "failed"
+CANCELLED = "cancelled"
+DONE_STATES = {FINISHED, FAILED, CANCELLED}
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class Job(QRunnable):
+    """A long-running task executed on the thread pool of a JobManager.
+
+    With pass_job, the function gets the job as its `job` keyword argument so it can report
+    progress with set_progress() and stop early through check_cancelled().
+    """
+
+    _ids = itertools.count(1)
+
+    def __init__(self, manager, name, func, args, kwargs, pass_job=False):
+        super().__init__()
+        # The manager keeps the job, Qt must not delete it after run()
+        self.setAutoDelete(False)
+        self.id = next(self._ids)
+        self.name = name
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.pass_job = pass_job
+        self.state = QUEUED
+        self.progress = None
+        self.message = ""
+        self.result = None
+        self.error = None
+        self.created = time.monotonic()
+        self.started = None
+        self.finished = None
+        self._manager = manager
+        self._cancel_requested = threading.Event()
+
+    @property
+    def cancelled(self):
+        return self._cancel_requested.is_set()
+
+    def is_done(self):
+        return self.state in DONE_STATES
+
+    def duration(self):
+        if self.started is None:
+            return 0.0
+        return (self.finished or time.monotonic()) - self.started
+
+    def cancel(self):
+        """Drop the job if it has not started yet, otherwise ask it to stop"""
+        if not self.is_done():
+            self._cancel_requested.set()
+            self._manager._cancel(self)
+
+    def check_cancelled(self):
+        if self.cancelled:
+            raise JobCancelled(f"Job '{self.name}' was cancelled")
+
+    def set_progress(self, progress, message=None):
+        """Progress in percent, None when it cannot be told"""
+        self.progress = None if progress is None else max(0, min(100, int(progress)))
+        if message is not None:
+            self.message = message
+        self._manager._job_changed.emit(self.id)
+
+    def run(self):
+        if self.cancelled:
+            # Cancelled after the pool dequeued it, too late for tryTake() to drop it
+            self.state = CANCELLED
+            self.finished = time.monotonic()
+            self._manager._job_done.emit(self.id)
+            return
+        self.state = RUNNING
+        self.started = time.monotonic()
+        self._manager._job_changed.emit(self.id)
+        try:
+            kwargs = dict(self.kwargs, job=self) if self.pass_job else self.kwargs
+            self.result = self.func(*self.args, **kwargs)
+            self.state = FINISHED
+            self.progress = 100
+        except JobCancelled:
+            self.state = CANCELLED
+        except Exception as e:
+            self.error = str(e)
+            self.state = FAILED
+            logging.error(f"Job '{self.name}' failed: {self.error}")
+        self.finished = time.monotonic()
+        self._manager._job_done.emit(self.id)
+
+
+class JobManager(QObject):
+    """Runs jobs on a shared QThreadPool and reports on them through signals in the GUI thread"""
+
+    job_added = pyqtSignal(int)
+    job_updated = pyqtSignal(int)
+    job_finished = pyqtSignal(int)
+    # Emitted from worker threads, delivered to the manager's (GUI) thread
+    _job_changed = pyqtSignal(int)
+    _job_done = pyqtSignal(int)
+
+    def __init__(self, max_threads=None, parent=None):
+        super().__init__(parent)
+        self.pool = QThreadPool(self)
+        if max_threads:
+            self.pool.setMaxThreadCount(max_threads)
+        self.jobs = {}
+        self._callbacks = {}
+        self._job_changed.connect(self.job_updated)
+        self._job_done.connect(self._on_job_done)
+
+    def submit(self, name, func, *args, on_success=None, on_error=None, pass_job=False, **kwargs):
+        """Queue func(*args, **kwargs); on_success(result) and on_error(message) run in the GUI thread"""
+        job = Job(self, name, func, args, kwargs, pass_job)
+        self.jobs[job.id] = job
+        self._callbacks[job.id] = (on_success, on_error)
+        self.job_added.emit(job.id)
+        self.pool.start(job)
+        return job
+
+    def active_jobs(self):
+        return [job for job in self.jobs.values() if not job.is_done()]
+
+    def clear_finished(self):
+        for job_id in [job_id for job_id, job in self.jobs.items() if job.is_done()]:
+            del self.jobs[job_id]
+
+    def cancel_all(self):
+        for job in self.active_jobs():
+            job.cancel()
+
+    def wait_for_done(self, msecs=-1):
+        return self.pool.waitForDone(msecs)
+
+    def _cancel(self, job):
+        if job.state == QUEUED and self.pool.tryTake(job):
+            job.state = CANCELLED
+            job.finished = time.monotonic()
+            self._job_done.emit(job.id)
+        else:
+            self._job_changed.emit(job.id)
+
+    def _on_job_done(self, job_id):
+        job = self.jobs.get(job_id)
+        on_success, on_error = self._callbacks.pop(job_id, (None, None))
+        if job is not None:
+            try:
+                if job.state == FINISHED and on_success is not None:
+                    on_success(job.result)
+                elif job.state == FAILED and on_error is not None:
+                    on_error(job.error)
+            except Exception as e:
+                logging.error(f"Callback of job '{job.name}' failed: {str(e)}")
+        self.job_finished.emit(job_id)
+
+
+_default_manager = None
+
+
+def get_job_manager():
+    """The job manager shared by the whole application"""
+    global _default_manager
+    if _default_manager is None:
+        _default_manager = JobManager(CONFIG.get('max_concurrent_jobs'))
+    return _default_manager
+
+
+class JobsPanel(QWidget):
+    """Lists the running and finished jobs of a JobManager"""
+
+    def __init__(self, manager=None, parent=None):
+        super().__init__(parent)
+        self.manager = manager or get_job_manager()
+        self._items = {}
+
+        layout = QVBoxLayout(self)
+        self.tree = QTreeWidget()
+        self.tree.setHeaderLabels(["Job", "Status", "Progress", "Time"])
+        self.tree.setRootIsDecorated(False)
+        self.tree.setSelectionMode(QAbstractItemView.SelectionMode.ExtendedSelection)
+        layout.addWidget(self.tree)
+
+        button_layout = QHBoxLayout()
+        cancel_button = QPushButton("Cancel Selected")
+        cancel_button.clicked.connect(self.cancel_selected)
+        clear_button = QPushButton("Clear Finished")
+        clear_button.clicked.connect(self.clear_finished)
+        button_layout.addWidget(cancel_button)
+        button_layout.addWidget(clear_button)
+        layout.addLayout(button_layout)
+
+        for job_id in self.manager.jobs:
+            self.add_job(job_id)
+        self.manager.job_added.connect(self.add_job)
+        self.manager.job_updated.connect(self.refresh_job)
+        self.manager.job_finished.connect(self.refresh_job)
+
+        # Keeps the elapsed time of running jobs current
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.refresh_running)
+        self.timer.start(1000)
+
+    def add_job(self, job_id):
+        item = QTreeWidgetItem()
+        item.setData(0, Qt.ItemDataRole.UserRole, job_id)
+        self.tree.insertTopLevelItem(0, item)
+        self._items[job_id] = item
+        self.refresh_job(job_id)
+
+    def refresh_job(self, job_id):
+        job = self.manager.jobs.get(job_id)
+        item = self._items.get(job_id)
+        if job is None or item is None:
+            return
+        status = job.state
+        if job.error:
+            status += f": {job.error}"
+        elif job.message:
+            status += f": {job.message}"
+        item.setText(0, job.name)
+        item.setText(1, status)
+        item.setText(2, "" if job.progress is None else f"{job.progress}%")
+        item.setText(3, f"{job.duration():.1f}s" if job.started is not None else "")
+
+    def refresh_running(self):
+        for job in self.manager.active_jobs():
+            self.refresh_job(job.id)
+
+    def cancel_selected(self):
+        for item in self.tree.selectedItems():
+            job = self.manager.jobs.get(item.data(0, Qt.ItemDataRole.UserRole))
+            if job is not None:
+                job.cancel()
+
+    def clear_finished(self):
+        self.manager.clear_finished()
+        for job_id in [job_id for job_id in self._items if job_id not in self.manager.jobs]:
+            item = self._items.pop(job_id)
+            self.tree.takeTopLevelItem(self.tree.indexOfTopLevelItem(item))
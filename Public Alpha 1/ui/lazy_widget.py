@@ -0,0 +1,32 @@
+import time
+from PyQt6.QtWidgets import QWidget, QVBoxLayout
+from startup_profile import PROFILER
+
+
+class LazyWidget(QWidget):
+    """Placeholder that builds its real widget the first time it is shown, or asked for"""
+
+    def __init__(self, factory, on_created=None, parent=None):
+        super().__init__(parent)
+        self._factory = factory
+        self._on_created = on_created
+        self._widget = None
+        self._layout = QVBoxLayout(self)
+        self._layout.setContentsMargins(0, 0, 0, 0)
+
+    def is_built(self):
+        return self._widget is not None
+
+    def widget(self):
+        if self._widget is None:
+            start = time.perf_counter()
+            self._widget = self._factory()
+            self._layout.addWidget(self._widget)
+            PROFILER.record(f"build {type(self._widget).__name__}", time.perf_counter() - start)
+            if self._on_created is not None:
+                self._on_created(self._widget)
+        return self._widget
+
+    def showEvent(self, event):
+        self.widget()
+        super().showEvent(event)
@@ -5,27 +5,38 @@ from PyQt6.QtWidgets import (QMainWindow, QWidget, QVBoxLayout, QHBoxLayout,
                              QToolBar, QListWidget, QStackedWidget, QLabel,
                              QPushButton, QSplitter, QFrame, QTextEdit, QTabWidget, QMessageBox, QFileDialog)
 from PyQt6.QtGui import QIcon, QAction
-from PyQt6.QtCore import Qt
+from PyQt6.QtCore import Qt, QTimer, pyqtSignal
 from .vm_settings_widget import VMSettingsWidget
 from .vm_list_widget import VMListWidget
 from .vm_preview_widget import VMPreviewWidget
 from .emulator_tab import EmulatorTab
-from .settings_tab import SettingsTab
+from .lazy_widget import LazyWidget
+from .job_manager import JobsPanel, get_job_manager
 from qemu_controller import QEMUController
 from config import CONFIG
-from .wizard.new_vm_wizard import NewVMWizard
-from .global_settings_dialog import GlobalSettingsDialog
+from vm_store import load_vm_config, save_vm_config
+from base_images import BaseImageCatalog
 from .font_manager import FontManager
-from .documentation_widget import DocumentationWidget
 
 
 class MainWindow(QMainWindow):
+    vm_state_changed = pyqtSignal(str, str)
+    vm_error = pyqtSignal(str, str)
+    dump_analysis_updated = pyqtSignal(dict, list)
+
     def __init__(self):
         super().__init__()
         self.setWindowTitle("SamsEmung - Samsung Smartphone Emulator")
         self.setGeometry(100, 100, 1200, 800)
 
         self.qemu_controller = QEMUController(CONFIG)
+        # Controller callbacks arrive on worker threads, the signals hand them over to the GUI thread
+        self.qemu_controller.add_state_listener(self.vm_state_changed.emit)
+        self.vm_state_changed.connect(self.on_vm_state_changed)
+        self.vm_error.connect(self.on_vm_error)
+        self.dump_analysis_updated.connect(self.on_dump_analysis_updated)
+        self.dump_watcher = None
+        self.jobs = get_job_manager()
 
         # Create central widget and main layout
         central_widget = QWidget()
@@ -64,6 +75,10 @@ class MainWindow(QMainWindow):
 
         # Connect signals
         self.vm_list.currentItemChanged.connect(self.on_vm_selected)
+        self.vm_list.vm_deleted.connect(self.on_vm_deleted)
+        self.vm_list.show_snapshots_requested.connect(self.on_show_snapshots)
+        self.vm_list.delete_snapshots_requested.connect(self.on_delete_snapshots)
+        self.vm_list.flatten_disk_requested.connect(self.on_flatten_disk)
         self.settings_widget.vm_started.connect(self.preview_widget.update_preview)
         self.settings_widget.vm_stopped.connect(self.preview_widget.clear_preview)
 
@@ -71,13 +86,15 @@ class MainWindow(QMainWindow):
         main_layout.addWidget(self.tab_widget)
 
         self.emulator_tab = EmulatorTab(self.qemu_controller)
-        self.settings_tab = SettingsTab(self.qemu_controller)
+        # Tabs that are not visible at startup are built the first time they are shown
+        self.settings_tab = LazyWidget(self.create_settings_tab,
+                                       on_created=lambda tab: tab.log_message.connect(self.log_message))
+        self.documentation_widget = LazyWidget(self.create_documentation_widget)
 
         self.tab_widget.addTab(self.emulator_tab, "Emulator")
         self.tab_widget.addTab(self.settings_tab, "Settings")
-
-        self.documentation_widget = DocumentationWidget()
         self.tab_widget.addTab(self.documentation_widget, "Documentation")
+        self.tab_widget.addTab(LazyWidget(lambda: JobsPanel(self.jobs)), "Jobs")
 
         self.log_output = QTextEdit()
         self.log_output.setReadOnly(True)
@@ -85,7 +102,8 @@ class MainWindow(QMainWindow):
 
         # Connect log signals
         self.emulator_tab.log_message.connect(self.log_message)
-        self.settings_tab.log_message.connect(self.log_message)
+        # Analysing the dump can wait until the window is on screen
+        QTimer.singleShot(0, self.start_dump_watcher)
 
         FontManager.load_fonts()
 
@@ -133,12 +151,36 @@ class MainWindow(QMainWindow):
         start_action.triggered.connect(self.on_start)
         toolbar.addAction(start_action)
 
+        # Fast start action
+        fast_start_action = QAction(QIcon.fromTheme("media-skip-forward"), "Fast Start", self)
+        fast_start_action.setStatusTip("Start virtual machine from its saved booted state")
+        fast_start_action.triggered.connect(self.on_fast_start)
+        toolbar.addAction(fast_start_action)
+
         # Stop action
         stop_action = QAction(QIcon.fromTheme("media-playback-stop"), "Stop", self)
         stop_action.setStatusTip("Stop virtual machine")
         stop_action.triggered.connect(self.on_stop)
         toolbar.addAction(stop_action)
 
+        # Pause action
+        pause_action = QAction(QIcon.fromTheme("media-playback-pause"), "Pause", self)
+        pause_action.setStatusTip("Pause virtual machine")
+        pause_action.triggered.connect(self.on_pause)
+        toolbar.addAction(pause_action)
+
+        # Resume action
+        resume_action = QAction(QIcon.fromTheme("media-playback-start"), "Resume", self)
+        resume_action.setStatusTip("Resume a paused virtual machine")
+        resume_action.triggered.connect(self.on_resume)
+        toolbar.addAction(resume_action)
+
+        # Save booted state action
+        save_state_action = QAction(QIcon.fromTheme("document-save-as"), "Save Booted State", self)
+        save_state_action.setStatusTip("Save the state of the booted virtual machine for fast starts")
+        save_state_action.triggered.connect(self.on_save_booted_state)
+        toolbar.addAction(save_state_action)
+
         toolbar.addSeparator()
 
         # Add Kernel action
@@ -153,6 +195,12 @@ class MainWindow(QMainWindow):
         add_recovery_action.triggered.connect(self.on_add_recovery)
         toolbar.addAction(add_recovery_action)
 
+        # Import Firmware action
+        import_firmware_action = QAction(QIcon.fromTheme("document-import"), "Import Firmware", self)
+        import_firmware_action.setStatusTip("Import an Odin firmware package (AP/BL/CP/CSC .tar.md5)")
+        import_firmware_action.triggered.connect(self.on_import_firmware)
+        toolbar.addAction(import_firmware_action)
+
         # Create Dump action
         create_dump_action = QAction(QIcon.fromTheme("document-save"), "Create Dump", self)
         create_dump_action.setStatusTip("Create a dump file of the current emulator state")
@@ -168,30 +216,97 @@ class MainWindow(QMainWindow):
         toolbar.setMovable(False)
         toolbar.setFloatable(False)
 
+    def create_settings_tab(self):
+        from .settings_tab import SettingsTab
+        return SettingsTab(self.qemu_controller)
+
+    def create_documentation_widget(self):
+        from .documentation_widget import DocumentationWidget
+        return DocumentationWidget()
+
     def open_global_settings(self):
+        from .global_settings_dialog import GlobalSettingsDialog
         dialog = GlobalSettingsDialog(self)
         dialog.settings_updated.connect(self.on_global_settings_updated)
         dialog.exec()
 
     def on_global_settings_updated(self):
-        # Reload QEMU controller with new settings
-        self.qemu_controller = QEMUController(CONFIG)
+        # The controller shares the CONFIG dict, so running VMs stay registered
+        self.qemu_controller.config = CONFIG
+        self.start_dump_watcher()
         self.log_message("Global settings updated")
 
+    def start_dump_watcher(self):
+        """Keep the analysis of the configured dump folder up to date as files change"""
+        dump_folder = CONFIG.get('dump_folder')
+        if self.dump_watcher is not None:
+            if self.dump_watcher.analyzer.dump_folder == dump_folder:
+                return
+            self.dump_watcher.stop()
+            self.dump_watcher = None
+        if dump_folder and os.path.isdir(dump_folder):
+            from dump_analyzer import DumpAnalyzer
+            from dump_watcher import DumpWatcher
+            from analysis_cache import get_default_cache
+            analyzer = DumpAnalyzer(dump_folder, cache=get_default_cache())
+            self.dump_watcher = DumpWatcher(analyzer, self.dump_analysis_updated.emit)
+            self.dump_watcher.start()
+
+    def on_dump_analysis_updated(self, results, detectors):
+        device_model = results.get('device_model') or {}
+        self.log_message(f"Dump analysis updated ({', '.join(detectors)}): model {device_model.get('model')}, "
+                         f"UI {results.get('touchwiz_version')}, kernel {results.get('kernel_version')}")
+
     def on_new_vm(self):
+        from .wizard.new_vm_wizard import NewVMWizard
         wizard = NewVMWizard(self)
         wizard.exec()
 
     def create_new_vm(self, vm_config):
-        try:
-            # Create virtual disk
+        """Create the VM's disk in a background job, then add the VM once it is ready"""
+        self.log_message(f"Creating virtual machine '{vm_config['name']}'...")
+        self.jobs.submit(f"Create VM {vm_config['name']}", self._create_vm_disk, vm_config, pass_job=True,
+                         on_success=self._on_vm_disk_created,
+                         on_error=lambda error: self._on_vm_creation_failed(vm_config, error))
+
+    def _create_vm_disk(self, vm_config, job):
+        # Create virtual disk, as a linked clone when a base image was chosen
+        base_image = BaseImageCatalog().get(vm_config['base_image']) if vm_config.get('base_image') else None
+        cluster_size = (vm_config.get('storage') or {}).get('cluster_size')
+        if base_image:
+            job.set_progress(None, "creating linked clone")
+            logging.info(f"Creating linked clone of base image {vm_config['base_image']}")
+            vdisk_path = self.qemu_controller.create_linked_clone(
+                base_image['path'], vm_config['name'], vm_config['disk_size'], cluster_size=cluster_size)
+            vm_config['backing_file'] = base_image['path']
+        else:
+            job.set_progress(None, "creating virtual disk")
             logging.info(f"Creating virtual disk of size {vm_config['disk_size']}MB")
-            vdisk_path = self.qemu_controller.create_virtual_disk(vm_config['disk_size'])
+            vdisk_path = self.qemu_controller.create_virtual_disk(
+                vm_config['disk_size'], vm_config['name'], cluster_size=cluster_size)
+
+        # Update configuration
+        vm_config['virtual_disk_path'] = vdisk_path
+        vm_config['qcow2_path'] = vdisk_path
+
+        if vm_config.get('provision_partitions') and vm_config.get('dump_folder'):
+            job.set_progress(0, "provisioning partition drives")
 
-            # Update configuration
-            vm_config['virtual_disk_path'] = vdisk_path
-            vm_config['qcow2_path'] = vdisk_path
+            def progress(percent, message):
+                job.check_cancelled()
+                job.set_progress(percent, message)
 
+            try:
+                vm_config['drives'] = self.qemu_controller.provision_vm_disks(
+                    vm_config['name'], vm_config['dump_folder'], cluster_size=cluster_size, progress=progress)
+            except Exception:
+                os.remove(vdisk_path)
+                raise
+        return vm_config
+
+    def _on_vm_disk_created(self, vm_config):
+        vdisk_path = vm_config['virtual_disk_path']
+        try:
             # Add VM to list
             try:
                 self.vm_list.add_vm(vm_config)
@@ -214,23 +329,18 @@ class MainWindow(QMainWindow):
             )
 
         except Exception as e:
-            error_msg = str(e)
-            logging.error(f"Failed to create virtual machine: {error_msg}")
-            QMessageBox.critical(
-                self,
-                "Error",
-                f"Failed to create virtual machine: {error_msg}"
-            )
+            self._on_vm_creation_failed(vm_config, str(e))
 
-    def save_vm_config(self, vm_config):
-        # Create VMs directory if it doesn't exist
-        vms_dir = os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', 'vms')
-        os.makedirs(vms_dir, exist_ok=True)
+    def _on_vm_creation_failed(self, vm_config, error_msg):
+        logging.error(f"Failed to create virtual machine: {error_msg}")
+        QMessageBox.critical(
+            self,
+            "Error",
+            f"Failed to create virtual machine: {error_msg}"
+        )
 
-        # Save VM configuration to JSON file
-        vm_file = os.path.join(vms_dir, f"{vm_config['name']}.json")
-        with open(vm_file, 'w') as f:
-            json.dump(vm_config, f, indent=2)
+    def save_vm_config(self, vm_config):
+        save_vm_config(vm_config)
 
     def on_add_vm(self):
         file_path, _ = QFileDialog.getOpenFileName(
@@ -257,12 +367,15 @@ class MainWindow(QMainWindow):
                     f"Failed to add virtual machine: {str(e)}"
                 )
 
-    def on_start(self):
+    def on_fast_start(self):
+        self.on_start(fast_start=True)
+
+    def on_start(self, fast_start=False):
         current_vm = self.vm_list.currentItem()
         if current_vm:
             try:
                 vm_config = self.load_vm_config(current_vm.text())
-                self.start_vm(vm_config)
+                self.start_vm(vm_config, fast_start=fast_start)
             except Exception as e:
                 QMessageBox.critical(
                     self,
@@ -279,20 +392,17 @@ class MainWindow(QMainWindow):
     def on_stop(self):
         current_vm = self.vm_list.currentItem()
         if current_vm:
-            try:
-                self.qemu_controller.stop_emulator()
-                self.preview_widget.clear_preview()
-                QMessageBox.information(
-                    self,
-                    "Success",
-                    f"Virtual machine '{current_vm.text()}' stopped successfully!"
-                )
-            except Exception as e:
-                QMessageBox.critical(
+            vm_name = current_vm.text()
+            if not self.qemu_controller.is_running(vm_name):
+                QMessageBox.warning(
                     self,
-                    "Error",
-                    f"Failed to stop virtual machine: {str(e)}"
+                    "Warning",
+                    f"Virtual machine '{vm_name}' is not running."
                 )
+                return
+            self.log_message(f"Stopping virtual machine '{vm_name}'...")
+            future = self.qemu_controller.stop_emulator_async(vm_name)
+            future.add_done_callback(lambda f: self._report_future_error(vm_name, f))
         else:
             QMessageBox.warning(
                 self,
@@ -300,48 +410,178 @@ class MainWindow(QMainWindow):
                 "Please select a virtual machine first."
             )
 
-    def load_vm_config(self, vm_name):
-        vm_file = os.path.join(
-            os.path.dirname(os.path.realpath(__file__)),
-            '..',
-            'vms',
-            f"{vm_name}.json"
-        )
+    def on_pause(self):
+        self.run_on_selected_vm(self.qemu_controller.pause_emulator)
 
-        with open(vm_file, 'r') as f:
-            return json.load(f)
+    def on_resume(self):
+        self.run_on_selected_vm(self.qemu_controller.resume_emulator)
 
-    def start_vm(self, vm_config):
-        # Update QEMU controller configuration
-        self.qemu_controller.config.update({
-            'virtual_disk_path': vm_config['virtual_disk_path'],
-            'qcow2_path': vm_config.get('qcow2_path', vm_config['virtual_disk_path'])
-        })
+    def run_on_selected_vm(self, action):
+        current_vm = self.vm_list.currentItem()
+        if current_vm is None:
+            QMessageBox.warning(
+                self,
+                "Warning",
+                "Please select a virtual machine first."
+            )
+            return
+        vm_name = current_vm.text()
+        future = self.qemu_controller.submit(action, vm_name)
+        future.add_done_callback(lambda f: self._report_future_error(vm_name, f))
 
-        cmd_line = self.qemu_controller.get_command_line(
-            vm_config['model'],
-            vm_config['ui_version'],
-            vm_config['memory'],
-            vm_config['kernel_zip'],
-            vm_config['recovery_img']
-        )
-        self.log_message(f"Starting VM with command: {cmd_line}")
+    def load_vm_config(self, vm_name):
+        return load_vm_config(vm_name)
+
+    def start_vm(self, vm_config, fast_start=False):
+        """Resolve the boot artifacts and launch QEMU in a background job"""
+        vm_name = vm_config['name']
+        self.jobs.submit(f"Start VM {vm_name}", self._start_vm, vm_config, fast_start,
+                         on_success=lambda cmd_line: self.log_message(f"Starting VM with command: {cmd_line}"),
+                         on_error=lambda error: self.vm_error.emit(vm_name, error))
 
-        # Start the VM
+    def _start_vm(self, vm_config, fast_start=False):
+        disk_path = vm_config.get('qcow2_path', vm_config['virtual_disk_path'])
+        kernel = vm_config.get('kernel_zip', vm_config.get('kernel_path'))
+
+        # Start the VM, the preview follows through on_vm_state_changed
         self.qemu_controller.start_emulator(
             vm_config['model'],
             vm_config['ui_version'],
             vm_config['memory'],
-            vm_config['kernel_zip'],
-            vm_config['recovery_img']
+            kernel,
+            vm_config.get('recovery_img'),
+            vm_name=vm_config['name'],
+            disk_path=disk_path,
+            fast_start=fast_start,
+            cpus=vm_config.get('cpus', 1),
+            storage=vm_config.get('storage'),
+            drives=vm_config.get('drives')
         )
+        return self.qemu_controller.get_command_line(vm_config['name'])
+
+    def on_save_booted_state(self):
+        current_vm = self.vm_list.currentItem()
+        if current_vm and not self.qemu_controller.is_running(current_vm.text()):
+            QMessageBox.warning(
+                self,
+                "Warning",
+                f"Virtual machine '{current_vm.text()}' is not running."
+            )
+            return
+        self.log_message("Saving booted state...")
+        self.run_on_selected_vm(self.qemu_controller.save_boot_snapshot)
+
+    def on_show_snapshots(self, vm_name):
+        try:
+            vm_config = self.load_vm_config(vm_name)
+        except Exception as e:
+            QMessageBox.critical(
+                self,
+                "Error",
+                f"Failed to list saved states: {str(e)}"
+            )
+            return
+        self.jobs.submit(
+            f"List saved states of {vm_name}", self.qemu_controller.list_snapshots, vm_config['virtual_disk_path'],
+            on_success=lambda snapshots: QMessageBox.information(
+                self,
+                f"Saved States of '{vm_name}'",
+                "\n".join(
+                    f"{snapshot['tag']} ({snapshot['vm_state_size'] / 1024 / 1024:.0f} MB)" for snapshot in snapshots
+                ) or "No saved states."
+            ),
+            on_error=lambda error: QMessageBox.critical(
+                self,
+                "Error",
+                f"Failed to list saved states: {error}"
+            ))
 
-        # Update preview
-        self.preview_widget.update_preview()
+    def on_delete_snapshots(self, vm_name):
+        try:
+            vm_config = self.load_vm_config(vm_name)
+        except Exception as e:
+            QMessageBox.critical(
+                self,
+                "Error",
+                f"Failed to delete saved states: {str(e)}"
+            )
+            return
+        self.jobs.submit(
+            f"Delete saved states of {vm_name}", self.qemu_controller.invalidate_snapshots,
+            vm_config['virtual_disk_path'],
+            on_success=lambda removed: self.log_message(f"Deleted {len(removed)} saved state(s) of '{vm_name}'"),
+            on_error=lambda error: QMessageBox.critical(
+                self,
+                "Error",
+                f"Failed to delete saved states: {error}"
+            ))
+
+    def on_flatten_disk(self, vm_name):
+        try:
+            vm_config = self.load_vm_config(vm_name)
+        except Exception as e:
+            QMessageBox.critical(
+                self,
+                "Error",
+                f"Failed to flatten disk: {str(e)}"
+            )
+            return
+        if not vm_config.get('backing_file'):
+            self.log_message(f"Disk of '{vm_name}' is not a linked clone")
+            return
+        self.log_message(f"Flattening disk of '{vm_name}'...")
+        # Copies all the data of the base image into the overlay, which takes a while on big bases
+        self.jobs.submit(
+            f"Flatten disk of {vm_name}", self.qemu_controller.flatten_disk, vm_config['virtual_disk_path'],
+            on_success=lambda _: self._on_disk_flattened(vm_name),
+            on_error=lambda error: QMessageBox.critical(
+                self,
+                "Error",
+                f"Failed to flatten disk: {error}"
+            ))
+
+    def _on_disk_flattened(self, vm_name):
+        vm_config = self.load_vm_config(vm_name)
+        vm_config.pop('backing_file', None)
+        self.save_vm_config(vm_config)
+        self.log_message(f"Disk of '{vm_name}' no longer depends on its base image")
 
     def on_vm_selected(self, current, previous):
         if current:
             self.settings_widget.load_vm_settings(current.text())
+            self.update_preview_for(current.text())
+
+    def update_preview_for(self, vm_name):
+        if self.qemu_controller.is_running(vm_name):
+            self.preview_widget.update_preview()
+        else:
+            self.preview_widget.clear_preview()
+
+    def on_vm_state_changed(self, vm_name, state):
+        self.log_message(f"Virtual machine '{vm_name}' is {state}")
+        current_vm = self.vm_list.currentItem()
+        if current_vm and current_vm.text() == vm_name:
+            self.update_preview_for(vm_name)
+
+    def on_vm_deleted(self, vm_name):
+        if self.qemu_controller.is_running(vm_name):
+            future = self.qemu_controller.stop_emulator_async(vm_name)
+            future.add_done_callback(lambda f: self.qemu_controller.unregister_vm(vm_name))
+        else:
+            self.qemu_controller.unregister_vm(vm_name)
+
+    def _report_future_error(self, vm_name, future):
+        error = future.exception()
+        if error:
+            self.vm_error.emit(vm_name, str(error))
+
+    def on_vm_error(self, vm_name, error_message):
+        self.log_message(f"Error in virtual machine '{vm_name}': {error_message}")
+        QMessageBox.critical(
+            self,
+            "Error",
+            f"Virtual machine '{vm_name}' failed: {error_message}"
+        )
 
     def log_message(self, message):
         self.log_output.append(message)
@@ -355,19 +595,18 @@ class MainWindow(QMainWindow):
         )
 
         if file_path:
-            try:
-                kernel_path = self.qemu_controller.add_kernel(file_path)
-                QMessageBox.information(
+            self.jobs.submit(
+                f"Add kernel {os.path.basename(file_path)}", self.qemu_controller.add_kernel, file_path,
+                on_success=lambda _: QMessageBox.information(
                     self,
                     "Success",
-                    f"Kernel zip added successfully: {os.path.basename(kernel_path)}"
-                )
-            except Exception as e:
-                QMessageBox.critical(
+                    f"Kernel zip added successfully: {os.path.basename(file_path)}"
+                ),
+                on_error=lambda error: QMessageBox.critical(
                     self,
                     "Error",
-                    f"Failed to add kernel zip: {str(e)}"
-                )
+                    f"Failed to add kernel zip: {error}"
+                ))
 
     def on_add_recovery(self):
         file_path, _ = QFileDialog.getOpenFileName(
@@ -378,19 +617,51 @@ class MainWindow(QMainWindow):
         )
 
         if file_path:
-            try:
-                recovery_path = self.qemu_controller.add_twrp_recovery(file_path)
-                QMessageBox.information(
+            self.jobs.submit(
+                f"Add recovery {os.path.basename(file_path)}", self.qemu_controller.add_twrp_recovery, file_path,
+                on_success=lambda _: QMessageBox.information(
                     self,
                     "Success",
-                    f"TWRP recovery image added and modified successfully: {os.path.basename(recovery_path)}"
-                )
-            except Exception as e:
-                QMessageBox.critical(
+                    f"TWRP recovery image added and modified successfully: {os.path.basename(file_path)}"
+                ),
+                on_error=lambda error: QMessageBox.critical(
                     self,
                     "Error",
-                    f"Failed to add TWRP recovery image: {str(e)}"
-                )
+                    f"Failed to add TWRP recovery image: {error}"
+                ))
+
+    def on_import_firmware(self):
+        file_path, _ = QFileDialog.getOpenFileName(
+            self,
+            "Select Firmware Package",
+            "",
+            "Odin Packages (*.tar.md5 *.tar);;All Files (*.*)"
+        )
+        if not file_path:
+            return
+        dump_folder = QFileDialog.getExistingDirectory(self, "Select Folder for the Partition Images")
+
+        self.jobs.submit(
+            f"Import firmware {os.path.basename(file_path)}", self._import_firmware, file_path, dump_folder or None,
+            pass_job=True,
+            on_success=lambda result: QMessageBox.information(
+                self,
+                "Success",
+                f"Firmware imported: {len(result['artifacts'])} images added to the store, "
+                f"{len(result['dump'])} partition images written"
+            ),
+            on_error=lambda error: QMessageBox.critical(
+                self,
+                "Error",
+                f"Failed to import firmware: {error}"
+            ))
+
+    def _import_firmware(self, file_path, dump_folder, job):
+        def progress(percent, message):
+            job.check_cancelled()
+            job.set_progress(percent, message)
+
+        return self.qemu_controller.import_firmware(file_path, dump_folder, progress=progress)
 
     def on_create_dump(self):
         current_vm = self.vm_list.currentItem()
@@ -404,12 +675,19 @@ class MainWindow(QMainWindow):
                 )
 
                 if file_path:
-                    dump_path = self.qemu_controller.create_dump_file(file_path)
-                    QMessageBox.information(
-                        self,
-                        "Success",
-                        f"Dump file created successfully: {os.path.basename(dump_path)}"
-                    )
+                    self.jobs.submit(
+                        f"Create dump of {current_vm.text()}", self.qemu_controller.create_dump_file, file_path,
+                        current_vm.text(),
+                        on_success=lambda dump_path: QMessageBox.information(
+                            self,
+                            "Success",
+                            f"Dump file created successfully: {os.path.basename(dump_path)}"
+                        ),
+                        on_error=lambda error: QMessageBox.critical(
+                            self,
+                            "Error",
+                            f"Failed to create dump file: {error}"
+                        ))
             except Exception as e:
                 QMessageBox.critical(
                     self,
@@ -427,6 +705,7 @@ class MainWindow(QMainWindow):
         self.tab_widget.setCurrentWidget(self.documentation_widget)
 
     def on_global_settings(self):
+        from .global_settings_dialog import GlobalSettingsDialog
         dialog = GlobalSettingsDialog(self)
         dialog.exec()
 
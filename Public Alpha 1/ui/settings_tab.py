@@ -1,7 +1,12 @@
+import os
 from PyQt6.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QLabel,
-                             QPushButton, QLineEdit, QGroupBox, QFileDialog, QMessageBox, QSpinBox)
+                             QPushButton, QLineEdit, QGroupBox, QFileDialog, QMessageBox, QSpinBox,
+                             QComboBox, QListWidget)
 from PyQt6.QtCore import pyqtSignal
 from config import save_config, CONFIG
+from base_images import BaseImageCatalog
+from dump_analyzer import analyze_dump, invalidate_dump_analysis
+from .job_manager import get_job_manager
 
 class SettingsTab(QWidget):
     log_message = pyqtSignal(str)
@@ -88,6 +93,29 @@ class SettingsTab(QWidget):
 
         self.layout.addWidget(vdisk_group)
 
+        # Base images for linked clones
+        base_group = QGroupBox("Base Images")
+        base_layout = QVBoxLayout()
+        base_group.setLayout(base_layout)
+
+        self.base_image_list = QListWidget()
+        base_layout.addWidget(self.base_image_list)
+
+        base_register_layout = QHBoxLayout()
+        self.base_model_combo = QComboBox()
+        self.base_model_combo.addItems(CONFIG['samsung_models'].keys())
+        self.base_firmware_input = QLineEdit()
+        self.base_firmware_input.setPlaceholderText("Firmware (e.g. G973FXXU9FUCD)")
+        register_base_button = QPushButton("Register Base Image...")
+        register_base_button.clicked.connect(self.register_base_image)
+        base_register_layout.addWidget(self.base_model_combo)
+        base_register_layout.addWidget(self.base_firmware_input)
+        base_register_layout.addWidget(register_base_button)
+        base_layout.addLayout(base_register_layout)
+
+        self.layout.addWidget(base_group)
+        self.refresh_base_images()
+
         # Save settings button
         save_settings_button = QPushButton("Save Settings")
         save_settings_button.clicked.connect(self.save_settings)
@@ -98,6 +126,11 @@ class SettingsTab(QWidget):
         analyze_dump_button.clicked.connect(self.analyze_dump)
         self.layout.addWidget(analyze_dump_button)
 
+        # Drops cached results, for dumps edited in ways size and mtime do not show
+        reanalyze_dump_button = QPushButton("Re-analyze Dump (clear cache)")
+        reanalyze_dump_button.clicked.connect(lambda: self.analyze_dump(refresh=True))
+        self.layout.addWidget(reanalyze_dump_button)
+
     def select_qemu_path(self):
         qemu_path = QFileDialog.getExistingDirectory(self, "Select QEMU Directory")
         if qemu_path:
@@ -132,29 +165,65 @@ class SettingsTab(QWidget):
             QMessageBox.critical(self, "Error", f"Failed to save settings: {str(e)}")
             self.log_message.emit(f"Error: Failed to save settings - {str(e)}")
 
-    def analyze_dump(self):
+    def analyze_dump(self, refresh=False):
+        dump_folder = self.dump_folder_input.text()
+        if not dump_folder:
+            self.on_analyze_dump_failed("No dump folder selected")
+            return
+        self.log_message.emit(f"Analyzing dump folder: {dump_folder}")
+        get_job_manager().submit(f"Analyze dump {os.path.basename(dump_folder)}", self._analyze_dump, dump_folder,
+                                 refresh, on_success=lambda result: self.on_dump_analyzed(dump_folder, *result),
+                                 on_error=self.on_analyze_dump_failed)
+
+    def _analyze_dump(self, dump_folder, refresh):
+        if refresh:
+            invalidate_dump_analysis(dump_folder)
+        return analyze_dump(dump_folder)
+
+    def on_dump_analyzed(self, dump_folder, model, ui_version):
+        self.log_message.emit(f"Detected model: {model}, UI version: {ui_version}")
+        QMessageBox.information(self, "Success", f"Dump analysis completed for folder: {dump_folder}\n"
+                                                 f"Model: {model}\nUI version: {ui_version}")
+
+    def on_analyze_dump_failed(self, error):
+        QMessageBox.critical(self, "Error", f"Failed to analyze dump: {error}")
+        self.log_message.emit(f"Error: Failed to analyze dump - {error}")
+
+    def refresh_base_images(self):
+        self.base_image_list.clear()
+        for image in BaseImageCatalog().list_images():
+            self.base_image_list.addItem(f"{image['key']} - {image['path']}")
+
+    def register_base_image(self):
+        path, _ = QFileDialog.getOpenFileName(self, "Select Base Image", filter="QCOW2 Images (*.qcow2);;All files (*.*)")
+        if not path:
+            return
         try:
-            dump_folder = self.dump_folder_input.text()
-            if not dump_folder:
-                raise ValueError("No dump folder selected")
-            # Implement dump analysis logic here
-            self.log_message.emit(f"Analyzing dump folder: {dump_folder}")
-            QMessageBox.information(self, "Success", f"Dump analysis completed for folder: {dump_folder}")
+            key = BaseImageCatalog().register(path, self.base_model_combo.currentText(),
+                                              self.base_firmware_input.text().strip())
+            self.refresh_base_images()
+            self.log_message.emit(f"Base image registered: {key}")
         except Exception as e:
-            QMessageBox.critical(self, "Error", f"Failed to analyze dump: {str(e)}")
-            self.log_message.emit(f"Error: Failed to analyze dump - {str(e)}")
+            QMessageBox.critical(self, "Error", f"Failed to register base image: {str(e)}")
+            self.log_message.emit(f"Error: Failed to register base image - {str(e)}")
 
     def create_virtual_disk(self):
-        try:
-            size = self.vdisk_size_input.value()
-            vdisk_path = self.qemu_controller.create_virtual_disk(size)
-            self.vdisk_info_label.setText(f"Virtual disk created at: {vdisk_path}")
-            CONFIG['virtual_disk_path'] = vdisk_path
-            CONFIG['virtual_disk_size'] = size
-            save_config(CONFIG)
-            self.log_message.emit(f"Virtual disk created: {vdisk_path}")
-            QMessageBox.information(self, "Success", f"Virtual disk created at: {vdisk_path}")
-        except Exception as e:
-            QMessageBox.critical(self, "Error", f"Failed to create virtual disk: {str(e)}")
-            self.log_message.emit(f"Error: Failed to create virtual disk - {str(e)}")
+        size = self.vdisk_size_input.value()
+        self.vdisk_info_label.setText("Creating virtual disk...")
+        get_job_manager().submit(f"Create {size} MB virtual disk", self.qemu_controller.create_virtual_disk, size,
+                                 on_success=lambda vdisk_path: self.on_virtual_disk_created(vdisk_path, size),
+                                 on_error=self.on_create_virtual_disk_failed)
+
+    def on_virtual_disk_created(self, vdisk_path, size):
+        self.vdisk_info_label.setText(f"Virtual disk created at: {vdisk_path}")
+        CONFIG['virtual_disk_path'] = vdisk_path
+        CONFIG['virtual_disk_size'] = size
+        save_config(CONFIG)
+        self.log_message.emit(f"Virtual disk created: {vdisk_path}")
+        QMessageBox.information(self, "Success", f"Virtual disk created at: {vdisk_path}")
+
+    def on_create_virtual_disk_failed(self, error):
+        self.vdisk_info_label.setText("")
+        QMessageBox.critical(self, "Error", f"Failed to create virtual disk: {error}")
+        self.log_message.emit(f"Error: Failed to create virtual disk - {error}")
 
@@ -2,10 +2,15 @@ from PyQt6.QtWidgets import (QListWidget, QListWidgetItem, QMenu, QMessageBox)
 from PyQt6.QtGui import QIcon
 from PyQt6.QtCore import Qt, pyqtSignal
 import os
+from vm_store import delete_vm_config
+from base_images import BaseImageCatalog
 
 
 class VMListWidget(QListWidget):
     vm_deleted = pyqtSignal(str)  # Signal emitted when VM is deleted
+    show_snapshots_requested = pyqtSignal(str)
+    delete_snapshots_requested = pyqtSignal(str)
+    flatten_disk_requested = pyqtSignal(str)
 
     def __init__(self):
         super().__init__()
@@ -29,11 +34,21 @@ class VMListWidget(QListWidget):
             return
 
         menu = QMenu()
+        show_snapshots_action = menu.addAction("Show Saved States")
+        delete_snapshots_action = menu.addAction("Delete Saved States")
+        flatten_action = menu.addAction("Flatten Disk")
+        menu.addSeparator()
         delete_action = menu.addAction("Delete VM")
         action = menu.exec(self.mapToGlobal(position))
 
         if action == delete_action:
             self.delete_vm(item)
+        elif action == show_snapshots_action:
+            self.show_snapshots_requested.emit(item.text())
+        elif action == delete_snapshots_action:
+            self.delete_snapshots_requested.emit(item.text())
+        elif action == flatten_action:
+            self.flatten_disk_requested.emit(item.text())
 
     def delete_vm(self, item):
         vm_name = item.text()
@@ -48,10 +63,17 @@ class VMListWidget(QListWidget):
             # Get VM config to find associated files
             vm_config = item.data(Qt.ItemDataRole.UserRole)
 
-            # Delete virtual disk if it exists
-            if 'virtual_disk_path' in vm_config and os.path.exists(vm_config['virtual_disk_path']):
+            # Delete virtual disk if it exists, but never a base image other disks are cloned from
+            disk_path = vm_config.get('virtual_disk_path')
+            if disk_path and os.path.exists(disk_path) and BaseImageCatalog().is_in_use(disk_path):
+                QMessageBox.warning(
+                    self,
+                    "Warning",
+                    f"Virtual disk was kept because it is a base image in use: {disk_path}"
+                )
+            elif disk_path and os.path.exists(disk_path):
                 try:
-                    os.remove(vm_config['virtual_disk_path'])
+                    os.remove(disk_path)
                 except Exception as e:
                     QMessageBox.warning(
                         self,
@@ -59,15 +81,21 @@ class VMListWidget(QListWidget):
                         f"Could not delete virtual disk: {str(e)}"
                     )
 
+            # Delete the partition drives provisioned from a dump
+            for drive in vm_config.get('drives') or []:
+                if os.path.exists(drive['path']):
+                    try:
+                        os.remove(drive['path'])
+                    except Exception as e:
+                        QMessageBox.warning(
+                            self,
+                            "Warning",
+                            f"Could not delete partition drive: {str(e)}"
+                        )
+
             # Delete VM config file
             try:
-                config_path = os.path.join(
-                    os.path.dirname(os.path.dirname(os.path.realpath(__file__))),
-                    'vms',
-                    f"{vm_name}.json"
-                )
-                if os.path.exists(config_path):
-                    os.remove(config_path)
+                delete_vm_config(vm_name)
             except Exception as e:
                 QMessageBox.warning(
                     self,
@@ -1,9 +1,13 @@
 from PyQt6.QtWidgets import (QWidget, QVBoxLayout, QTabWidget, QLabel,
                              QLineEdit, QSpinBox, QComboBox, QPushButton,
                              QFileDialog, QMessageBox, QGroupBox, QFormLayout,
-                             QScrollArea)
+                             QScrollArea, QCheckBox)
 from PyQt6.QtCore import pyqtSignal, Qt
 from config import CONFIG
+from qemu_controller import (STORAGE_INTERFACES, AIO_MODES, CACHE_MODES, DISCARD_MODES, CLUSTER_SIZES,
+                             DEFAULT_STORAGE_PROFILE)
+from vm_store import load_vm_config, save_vm_config
+from .lazy_widget import LazyWidget
 
 
 class KernelInfoTab(QWidget):
@@ -56,6 +60,7 @@ class VMSettingsWidget(QWidget):
     def __init__(self, qemu_controller):
         super().__init__()
         self.qemu_controller = qemu_controller
+        self.vm_config = None
 
         layout = QVBoxLayout(self)
 
@@ -67,7 +72,7 @@ class VMSettingsWidget(QWidget):
         self.system_tab = self.create_system_tab()
         self.storage_tab = self.create_storage_tab()
         self.kernel_tab = self.create_kernel_tab()
-        self.kernel_info_tab = KernelInfoTab()
+        self.kernel_info_tab = LazyWidget(KernelInfoTab)
 
         # Add tabs
         self.tabs.addTab(self.general_tab, "General")
@@ -78,6 +83,10 @@ class VMSettingsWidget(QWidget):
 
         layout.addWidget(self.tabs)
 
+        apply_button = QPushButton("Apply")
+        apply_button.clicked.connect(self.save_vm_settings)
+        layout.addWidget(apply_button)
+
     def create_general_tab(self):
         widget = QWidget()
         layout = QFormLayout(widget)
@@ -140,8 +149,65 @@ class VMSettingsWidget(QWidget):
         disk_layout.addRow("", browse_button)
 
         layout.addWidget(disk_group)
+
+        # Disk I/O profile, applied on the next start
+        io_group = QGroupBox("Disk I/O")
+        io_layout = QFormLayout(io_group)
+
+        self.interface_combo = QComboBox()
+        self.interface_combo.addItems(STORAGE_INTERFACES)
+        io_layout.addRow("Interface:", self.interface_combo)
+
+        self.iothread_check = QCheckBox("Dedicated I/O thread")
+        io_layout.addRow("", self.iothread_check)
+
+        self.aio_combo = QComboBox()
+        self.aio_combo.addItems(AIO_MODES)
+        io_layout.addRow("AIO:", self.aio_combo)
+
+        self.cache_combo = QComboBox()
+        self.cache_combo.addItems(CACHE_MODES)
+        io_layout.addRow("Cache:", self.cache_combo)
+
+        self.discard_combo = QComboBox()
+        self.discard_combo.addItems(DISCARD_MODES)
+        io_layout.addRow("Discard:", self.discard_combo)
+
+        self.l2_cache_edit = QLineEdit()
+        self.l2_cache_edit.setPlaceholderText("QEMU default, e.g. 4M")
+        io_layout.addRow("L2 cache size:", self.l2_cache_edit)
+
+        # Only used when a disk is created
+        self.cluster_size_combo = QComboBox()
+        self.cluster_size_combo.addItems(CLUSTER_SIZES)
+        self.cluster_size_combo.setEnabled(False)
+        io_layout.addRow("Cluster size:", self.cluster_size_combo)
+
+        layout.addWidget(io_group)
+        self.set_storage_profile(DEFAULT_STORAGE_PROFILE)
         return widget
 
+    def set_storage_profile(self, storage):
+        storage = dict(DEFAULT_STORAGE_PROFILE, **(storage or {}))
+        self.interface_combo.setCurrentText(storage['interface'])
+        self.iothread_check.setChecked(bool(storage['iothread']))
+        self.aio_combo.setCurrentText(storage['aio'])
+        self.cache_combo.setCurrentText(storage['cache'])
+        self.discard_combo.setCurrentText(storage['discard'])
+        self.l2_cache_edit.setText(storage['l2_cache_size'] or '')
+        self.cluster_size_combo.setCurrentText(storage['cluster_size'])
+
+    def get_storage_profile(self):
+        return {
+            'interface': self.interface_combo.currentText(),
+            'iothread': self.iothread_check.isChecked(),
+            'aio': self.aio_combo.currentText(),
+            'cache': self.cache_combo.currentText(),
+            'discard': self.discard_combo.currentText(),
+            'l2_cache_size': self.l2_cache_edit.text().strip(),
+            'cluster_size': self.cluster_size_combo.currentText(),
+        }
+
     def create_kernel_tab(self):
         widget = QWidget()
         layout = QVBoxLayout(widget)
@@ -186,7 +252,41 @@ class VMSettingsWidget(QWidget):
     def load_vm_settings(self, vm_name):
         # Load VM settings from config
         self.name_edit.setText(vm_name)
-        # Load other settings...
+        try:
+            self.vm_config = load_vm_config(vm_name)
+        except (OSError, ValueError):
+            self.vm_config = None
+            return
+
+        self.model_combo.setCurrentText(self.vm_config.get('model', ''))
+        self.ui_version_combo.setCurrentText(self.vm_config.get('ui_version', ''))
+        self.memory_spin.setValue(self.vm_config.get('memory', 2048))
+        self.cpu_spin.setValue(self.vm_config.get('cpus', 1))
+        self.disk_size_spin.setValue(self.vm_config.get('disk_size', 4096))
+        self.disk_path_edit.setText(self.vm_config.get('virtual_disk_path', ''))
+        self.kernel_path_edit.setText(self.vm_config.get('kernel_path') or '')
+        self.set_storage_profile(self.vm_config.get('storage'))
+
+    def save_vm_settings(self):
+        if self.vm_config is None:
+            QMessageBox.warning(self, "Warning", "Please select a virtual machine first.")
+            return
+        storage = self.get_storage_profile()
+        if storage['aio'] == 'native' and storage['cache'] != 'none':
+            QMessageBox.warning(self, "Warning", "AIO 'native' requires cache mode 'none'.")
+            return
+        self.vm_config.update({
+            'model': self.model_combo.currentText(),
+            'ui_version': self.ui_version_combo.currentText(),
+            'memory': self.memory_spin.value(),
+            'cpus': self.cpu_spin.value(),
+            'kernel_path': self.kernel_path_edit.text(),
+            'storage': storage,
+        })
+        try:
+            save_vm_config(self.vm_config)
+        except OSError as e:
+            QMessageBox.critical(self, "Error", f"Failed to save VM settings: {str(e)}")
 
     def start_vm(self):
         try:
@@ -5,6 +5,9 @@ from PyQt6.QtWidgets import (QWizard, QWizardPage, QVBoxLayout, QLabel,
 from PyQt6.QtCore import Qt
 import os
 from dump_analyzer import analyze_dump
+from base_images import BaseImageCatalog
+from qemu_controller import CLUSTER_SIZES, DEFAULT_STORAGE_PROFILE
+from ..job_manager import get_job_manager
 
 
 class KernelInfoWidget(QWidget):
@@ -128,6 +131,7 @@ class NamePage(QWizardPage):
         # Automatic detection
         self.auto_detect = QCheckBox("Automatically detect model from dump")
         self.auto_detect.stateChanged.connect(self.toggle_model_selection)
+        self.registerField("auto_detect", self.auto_detect)
 
         # Model
         model_layout = QHBoxLayout()
@@ -151,6 +155,7 @@ class NamePage(QWizardPage):
         self.dump_folder_edit.setReadOnly(True)
         dump_button = QPushButton("Select Dump Folder")
         dump_button.clicked.connect(self.select_dump_folder)
+        self.registerField("dump_folder", self.dump_folder_edit)
         dump_layout.addWidget(self.dump_folder_edit)
         dump_layout.addWidget(dump_button)
 
@@ -187,21 +192,23 @@ class NamePage(QWizardPage):
                 self.detect_model_from_dump(folder)
 
     def detect_model_from_dump(self, folder):
-        try:
-            model, ui_version = analyze_dump(folder)
-            index = self.model_combo.findText(model)
-            if index >= 0:
-                self.model_combo.setCurrentIndex(index)
-            else:
-                self.model_combo.setCurrentText("Other")
-
-            ui_index = self.ui_combo.findText(ui_version)
-            if ui_index >= 0:
-                self.ui_combo.setCurrentIndex(ui_index)
-
-            QMessageBox.information(self, "Auto-detection", f"Detected model: {model}\nUI version: {ui_version}")
-        except Exception as e:
-            QMessageBox.warning(self, "Auto-detection Failed", f"Could not detect model from dump: {str(e)}")
+        get_job_manager().submit(f"Detect model in {os.path.basename(folder)}", analyze_dump, folder,
+                                 on_success=lambda result: self.on_model_detected(*result),
+                                 on_error=lambda error: QMessageBox.warning(
+                                     self, "Auto-detection Failed", f"Could not detect model from dump: {error}"))
+
+    def on_model_detected(self, model, ui_version):
+        index = self.model_combo.findText(model)
+        if index >= 0:
+            self.model_combo.setCurrentIndex(index)
+        else:
+            self.model_combo.setCurrentText("Other")
+
+        ui_index = self.ui_combo.findText(ui_version)
+        if ui_index >= 0:
+            self.ui_combo.setCurrentIndex(ui_index)
+
+        QMessageBox.information(self, "Auto-detection", f"Detected model: {model}\nUI version: {ui_version}")
 
 
 class MemoryPage(QWizardPage):
@@ -222,9 +229,17 @@ class MemoryPage(QWizardPage):
         recommended_label = QLabel("Recommended: 2048 MB or more")
         recommended_label.setStyleSheet("color: gray;")
 
+        cpu_label = QLabel("Processors:")
+        self.cpu_spin = QSpinBox()
+        self.cpu_spin.setRange(1, 8)
+        self.cpu_spin.setValue(min(4, os.cpu_count() or 1))
+        self.registerField("cpus", self.cpu_spin)
+
         layout.addWidget(memory_label)
         layout.addWidget(self.memory_spin)
         layout.addWidget(recommended_label)
+        layout.addWidget(cpu_label)
+        layout.addWidget(self.cpu_spin)
         self.setLayout(layout)
 
 
@@ -247,9 +262,38 @@ class StoragePage(QWizardPage):
         recommended_label = QLabel("Recommended: 8192 MB (8GB) or more")
         recommended_label.setStyleSheet("color: gray;")
 
+        # Base image to clone from
+        base_label = QLabel("Base image:")
+        self.base_combo = QComboBox()
+        self.base_combo.addItem("None (empty disk)", "")
+        for image in BaseImageCatalog().list_images():
+            self.base_combo.addItem(image['key'], image['key'])
+        self.registerField("base_image", self.base_combo, "currentData")
+
+        base_hint = QLabel("A linked clone only stores the changes made on top of the base image")
+        base_hint.setStyleSheet("color: gray;")
+
+        # qcow2 cluster size, fixed once the disk exists
+        cluster_label = QLabel("Cluster size:")
+        self.cluster_combo = QComboBox()
+        self.cluster_combo.addItems(CLUSTER_SIZES)
+        self.cluster_combo.setCurrentText(DEFAULT_STORAGE_PROFILE['cluster_size'])
+        self.registerField("cluster_size", self.cluster_combo, "currentText")
+
+        # Partition drives built from the dump chosen on the first page
+        self.provision_check = QCheckBox("Build system, vendor and other partition drives from the dump folder")
+        self.provision_check.setChecked(True)
+        self.registerField("provision_partitions", self.provision_check)
+
         layout.addWidget(size_label)
         layout.addWidget(self.size_spin)
         layout.addWidget(recommended_label)
+        layout.addWidget(base_label)
+        layout.addWidget(self.base_combo)
+        layout.addWidget(base_hint)
+        layout.addWidget(cluster_label)
+        layout.addWidget(self.cluster_combo)
+        layout.addWidget(self.provision_check)
         self.setLayout(layout)
 
 
@@ -275,10 +319,14 @@ class NewVMWizard(QWizard):
                 'model': self.field("model"),
                 'ui_version': self.field("ui_version"),
                 'memory': self.field("memory"),
+                'cpus': self.field("cpus"),
                 'use_default_kernel': self.field("use_default_kernel"),
                 'kernel_path': self.field("kernel_path"),
                 'disk_size': self.field("disk_size"),
-                'dump_folder': self.field("dump_folder") if self.field("auto_detect") else None
+                'base_image': self.field("base_image"),
+                'storage': dict(DEFAULT_STORAGE_PROFILE, cluster_size=self.field("cluster_size")),
+                'dump_folder': self.field("dump_folder") or None,
+                'provision_partitions': self.field("provision_partitions")
             }
 
             # Save VM configuration (you'll implement this in main_window.py)
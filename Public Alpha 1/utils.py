@@ -1,8 +1,17 @@
 import os
+import hashlib
 
 def ensure_dir(directory):
     if not os.path.exists(directory):
         os.makedirs(directory)
 
+def file_sha256(path, chunk_size=1024 * 1024):
+    """Hex SHA-256 of a file, read in chunks"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
 # Add more utility functions as needed
 
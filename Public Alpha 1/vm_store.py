@@ -0,0 +1,67 @@
+import json
+import os
+
+VMS_DIR = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'vms')
+# Pid and ports of VMs left running by the command line, one file per VM
+RUN_DIR = os.path.join(VMS_DIR, 'run')
+
+
+def get_vm_config_path(vm_name):
+    return os.path.join(VMS_DIR, f"{vm_name}.json")
+
+
+def load_vm_config(vm_name):
+    with open(get_vm_config_path(vm_name), 'r') as f:
+        return json.load(f)
+
+
+def save_vm_config(vm_config):
+    os.makedirs(VMS_DIR, exist_ok=True)
+    with open(get_vm_config_path(vm_config['name']), 'w') as f:
+        json.dump(vm_config, f, indent=2)
+
+
+def delete_vm_config(vm_name):
+    config_path = get_vm_config_path(vm_name)
+    if os.path.exists(config_path):
+        os.remove(config_path)
+
+
+def list_vm_configs():
+    if not os.path.isdir(VMS_DIR):
+        return []
+    configs = []
+    for file_name in sorted(os.listdir(VMS_DIR)):
+        if file_name.endswith('.json'):
+            with open(os.path.join(VMS_DIR, file_name), 'r') as f:
+                configs.append(json.load(f))
+    return configs
+
+
+def get_vm_runtime_path(vm_name):
+    return os.path.join(RUN_DIR, f"{vm_name}.json")
+
+
+def get_vm_log_path(vm_name):
+    return os.path.join(RUN_DIR, f"{vm_name}.log")
+
+
+def load_vm_runtime(vm_name):
+    """Runtime record of a VM started by another process, None if there is none"""
+    try:
+        with open(get_vm_runtime_path(vm_name), 'r') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def save_vm_runtime(vm_name, runtime):
+    os.makedirs(RUN_DIR, exist_ok=True)
+    with open(get_vm_runtime_path(vm_name), 'w') as f:
+        json.dump(runtime, f, indent=2)
+
+
+def delete_vm_runtime(vm_name):
+    runtime_path = get_vm_runtime_path(vm_name)
+    if os.path.exists(runtime_path):
+        os.remove(runtime_path)